@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Benchmark for full-text history search (conversation_db.search_messages).
+
+Builds a synthetic messages table (Zipf-distributed vocabulary, so there are
+both rare and very common words), indexes it with the same newest-first
+backfill the bot runs on an existing database, then times the searches the
+bot and its API make: a channel-scoped question, a common word, an author
+filter, a time range and the prompt's format_related_history. Prints each
+query's plan and p50/p95 latency.
+
+Usage:
+  python bench_history_search.py --rows 10000000 --channels 200 --queries 500
+"""
+import argparse
+import datetime
+import itertools
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+import conversation_db
+
+TOPICS = ("bridge staking wallet worker gpu payout validator airdrop testnet mainnet release "
+          "docker driver vram comfyui model queue kudos token price exchange").split()
+VOCABULARY = TOPICS + [f"w{i}" for i in range(20000)]
+# Zipf-like: the first words are very common, the tail is rare
+CUM_WEIGHTS = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(VOCABULARY))))
+
+def build_db(path: str, rows: int, channels: int, seed: int):
+    """messages in the current layout, without messages_fts (init_db adds it)."""
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    conn.execute("""
+        CREATE TABLE messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            channel_id INTEGER NOT NULL,
+            author_name TEXT NOT NULL,
+            author_id INTEGER,
+            content TEXT NOT NULL,
+            is_bot INTEGER DEFAULT 0,
+            timestamp TEXT NOT NULL,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            ts INTEGER
+        )
+    """)
+    start = datetime.datetime.now() - datetime.timedelta(days=30)
+    step = datetime.timedelta(days=30) / rows
+    batch = []
+    for i in range(rows):
+        when = start + step * i
+        content = " ".join(rng.choices(VOCABULARY, cum_weights=CUM_WEIGHTS, k=rng.randint(3, 20)))
+        batch.append((rng.randrange(channels), f"user{rng.randrange(5000)}", content,
+                      when.isoformat(), int(when.timestamp() * 1000)))
+        if len(batch) == 100000:
+            conn.executemany("INSERT INTO messages (channel_id, author_name, content, timestamp, ts) "
+                             "VALUES (?, ?, ?, ?, ?)", batch)
+            batch.clear()
+    if batch:
+        conn.executemany("INSERT INTO messages (channel_id, author_name, content, timestamp, ts) "
+                         "VALUES (?, ?, ?, ?, ?)", batch)
+    conn.commit()
+    conn.close()
+
+def time_calls(fn, param_sets):
+    timings = []
+    hits = 0
+    for params in param_sets:
+        started = time.perf_counter()
+        result = fn(*params)
+        timings.append((time.perf_counter() - started) * 1000)
+        hits += 1 if result else 0
+    timings.sort()
+    return timings[len(timings) // 2], timings[int(len(timings) * 0.95)], hits
+
+def report(label, fn, param_sets):
+    p50, p95, hits = time_calls(fn, param_sets)
+    print(f"  {label}: p50={p50:.2f}ms p95={p95:.2f}ms ({hits}/{len(param_sets)} found matches)")
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark full-text history search')
+    parser.add_argument('--rows', type=int, default=2000000, help='Synthetic messages, spread over 30 days')
+    parser.add_argument('--channels', type=int, default=200)
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'conversations.db')
+        started = time.perf_counter()
+        build_db(path, args.rows, args.channels, args.seed)
+        size_before = os.path.getsize(path)
+        print(f"Built {args.rows} rows in {args.channels} channels in {time.perf_counter() - started:.1f}s "
+              f"({size_before / 2**20:.0f}MB)")
+
+        # Index exactly as the bot does for an existing database
+        conversation_db.DB_PATH = path
+        conversation_db.init_db(backfill_in_background=False)
+        conversation_db.backfill_message_ts(pause=0)
+        started = time.perf_counter()
+        indexed = conversation_db.backfill_message_fts(pause=0)
+        conn = conversation_db.get_db_connection()
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        print(f"Indexed {indexed} rows in {time.perf_counter() - started:.1f}s "
+              f"(+{(os.path.getsize(path) - size_before) / 2**20:.0f}MB)")
+
+        def question():
+            # A couple of topic words plus mid-frequency and rare words, like a real question
+            words = rng.sample(TOPICS, 1) + [f"w{rng.randrange(50, 20000)}" for _ in range(2)]
+            return "what did people say about " + " ".join(words) + "?"
+
+        channels = [rng.randrange(args.channels) for _ in range(args.queries)]
+        now_ms = int(time.time() * 1000)
+        day_ms = 86400 * 1000
+        match = conversation_db.fts_match(["bridge", "w1234"])
+        plan_sql = ("SELECT m.id FROM messages_fts JOIN messages m ON m.id = messages_fts.rowid "
+                    "WHERE messages_fts MATCH ? AND messages_fts.rowid < ? AND m.ts < ? "
+                    "ORDER BY messages_fts.rowid DESC LIMIT 200")
+        plan = "; ".join(row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + plan_sql,
+                                                        (f'{match} AND channel_id : "1"', args.rows, now_ms)))
+        print(f"Plan: {plan}")
+
+        search = conversation_db.search_messages
+        print("Searches:")
+        report("question in a channel", lambda q, c: search(q, channel_id=c, limit=5),
+               [(question(), c) for c in channels])
+        report("most common topic word in a channel", lambda q, c: search(q, channel_id=c, limit=5),
+               [(TOPICS[0], c) for c in channels])
+        report("question, whole server", lambda q: search(q, limit=5), [(question(),) for _ in channels])
+        report("author in a channel", lambda a, c: search("", channel_id=c, author=a, limit=10),
+               [(f"user{rng.randrange(5000)}", c) for c in channels])
+        report("question in a channel, yesterday", lambda q, c: search(q, channel_id=c, since_ms=now_ms - 2 * day_ms,
+                                                                       until_ms=now_ms - day_ms, limit=5),
+               [(question(), c) for c in channels])
+        report("format_related_history (prompt)", conversation_db.format_related_history,
+               [(c, question()) for c in channels])
+        conversation_db.close_db_connections()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for the link rule engine (link_rules.py).
+
+Builds a rules file with thousands of synthetic domain rules and keywords on
+top of link_rules.json, then times LinkRules.check() per URL against the old
+substring checks. Also checks that an edited rules file is picked up.
+
+Usage:
+  python bench_link_rules.py --domains 5000 --keywords 500 --iterations 20000
+"""
+import argparse
+import json
+import os
+import random
+import string
+import tempfile
+import time
+
+from link_rules import LinkRules
+
+SAMPLE_URLS = [
+    "https://docs.aipowergrid.io/help/staking-pool",
+    "https://github.com/AIPowerGrid/grid-discord-rag-bot/issues/12",
+    "https://x.com/aipowergrid/status/1790000000000000000",
+    "https://discord.gg/abcdef",
+    "https://app.uniswap.org/swap?outputCurrency=0xabc",
+    "https://support-desk-claim.xyz/ticket/123",
+    "https://www.example.com/blog/how-we-help-liquidity-pools",
+    "https://etherscan.io/tx/0x1234567890abcdef",
+    "https://aave-rewards.io/claim",
+    "https://news.ycombinator.com/item?id=123456",
+]
+
+def legacy_is_forbidden_link_type(url: str, message_content: str):
+    """The substring checks link_rules replaced, kept here for comparison."""
+    import re
+    url_lower = url.lower()
+    content_lower = message_content.lower()
+    for pattern in [r'discord\.gg/', r'discord\.com/invite/', r'discordapp\.com/invite/']:
+        if re.search(pattern, url_lower):
+            return True, "posted a Discord invite link"
+    support_keywords = ['support', 'help', 'ticket', 'helpdesk', 'zendesk', 'freshdesk']
+    if any(keyword in url_lower for keyword in support_keywords):
+        return True, "posted a support ticket/help link"
+    dex_keywords = ['dex', 'uniswap', 'pancakeswap', 'sushiswap', '1inch', 'dydx', 'curve', 'balancer', 'kyberswap']
+    if any(keyword in url_lower for keyword in dex_keywords):
+        return True, "posted a DEX (decentralized exchange) link"
+    defi_keywords = ['defi', 'lending', 'borrowing', 'yield', 'farm', 'staking', 'liquidity', 'pool',
+                     'aave', 'compound', 'makerdao', 'yearn', 'convex', 'frax']
+    if any(keyword in url_lower for keyword in defi_keywords):
+        if 'aipg' in content_lower or 'aipowergrid' in content_lower or 'power grid' in content_lower:
+            return False, ""
+        return True, "posted a DeFi platform link"
+    return False, ""
+
+def random_label(rng, length):
+    return ''.join(rng.choice(string.ascii_lowercase) for _ in range(length))
+
+def build_config(base_path: str, domains: int, keywords: int, seed: int):
+    rng = random.Random(seed)
+    with open(base_path, encoding='utf-8') as f:
+        config = json.load(f)
+    synthetic = config['categories'].setdefault('synthetic', {'reason': 'synthetic benchmark rule'})
+    synthetic['domains'] = [f"{random_label(rng, 8)}.{rng.choice(['com', 'io', 'xyz', 'co.uk'])}" for _ in range(domains)]
+    synthetic['host_keywords'] = [random_label(rng, rng.randint(5, 10)) for _ in range(keywords // 2)]
+    synthetic['path_keywords'] = [random_label(rng, rng.randint(5, 10)) for _ in range(keywords - keywords // 2)]
+    return config
+
+def time_per_call(fn, urls, iterations):
+    started = time.perf_counter()
+    for i in range(iterations):
+        fn(urls[i % len(urls)], "check this out")
+    return (time.perf_counter() - started) / iterations * 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the link rule engine')
+    parser.add_argument('--rules', default='link_rules.json', help='Base rules file')
+    parser.add_argument('--domains', type=int, default=5000, help='Synthetic domain rules to add')
+    parser.add_argument('--keywords', type=int, default=500, help='Synthetic keywords to add (half host, half path)')
+    parser.add_argument('--iterations', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    config = build_config(args.rules, args.domains, args.keywords, args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'link_rules.json')
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(config, f)
+
+        started = time.perf_counter()
+        rules = LinkRules(path, reload_seconds=0)
+        print(f"Compile: {(time.perf_counter() - started) * 1000:.1f}ms")
+
+        # Steady state: no file changes, so only the (throttled) mtime check on top of matching
+        rules.reload_seconds = 3600
+        engine_us = time_per_call(rules.check, SAMPLE_URLS, args.iterations)
+        legacy_us = time_per_call(legacy_is_forbidden_link_type, SAMPLE_URLS, args.iterations)
+        print(f"LinkRules.check: {engine_us:.2f}us/URL ({rules.domains.size} domain rules, "
+              f"{len(rules.host_keywords) + len(rules.path_keywords)} keywords)")
+        print(f"Legacy substring checks: {legacy_us:.2f}us/URL (built-in lists only)")
+
+        for url in SAMPLE_URLS:
+            print(f"  {url}\n    engine={rules.check(url, '')} legacy={legacy_is_forbidden_link_type(url, '')}")
+
+        # Hot reload: deny a new domain and check it's picked up without a new LinkRules
+        config['categories']['synthetic']['domains'].append('hot-reload-test.example')
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(config, f)
+        os.utime(path, (time.time() + 1, time.time() + 1))
+        rules.reload_seconds = 0
+        print(f"Hot reload picked up new rule: {rules.check('https://hot-reload-test.example/x', '')[0]}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the messages table layout (conversation_db.py).
+
+Builds a synthetic messages table in the pre-migration layout (ISO text
+timestamps, idx_channel_timestamp), times recent-history queries and a
+retention delete, migrates it the way the bot does (init_db + online ts
+backfill), then runs the same workload on epoch-millisecond ts with the
+covering index. Prints each query plan next to its latency.
+
+Usage:
+  python bench_messages_schema.py --rows 2000000 --channels 200 --queries 2000
+"""
+import argparse
+import datetime
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+import conversation_db
+
+LEGACY_SCHEMA = """
+    CREATE TABLE messages (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        channel_id INTEGER NOT NULL,
+        author_name TEXT NOT NULL,
+        author_id INTEGER,
+        content TEXT NOT NULL,
+        is_bot INTEGER DEFAULT 0,
+        timestamp TEXT NOT NULL,
+        created_at TEXT DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE INDEX idx_channel_timestamp ON messages(channel_id, timestamp DESC);
+"""
+
+LEGACY_HISTORY = """
+    SELECT author_name, content, is_bot, timestamp FROM messages
+    WHERE channel_id = ? ORDER BY timestamp DESC LIMIT ?
+"""
+TS_HISTORY = """
+    SELECT author_name, content, is_bot, ts FROM messages
+    WHERE channel_id = ? ORDER BY ts DESC LIMIT ?
+"""
+LEGACY_RETENTION = "SELECT COUNT(*) FROM messages WHERE timestamp < ?"
+TS_RETENTION = "SELECT COUNT(*) FROM messages WHERE ts < ? OR (ts IS NULL AND timestamp < ?)"
+
+WORDS = ("grid worker model staking aipg discord question answer image text queue gpu "
+         "payout wallet node join help docs bridge token price release").split()
+
+def build_legacy_db(path: str, rows: int, channels: int, seed: int):
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    conn.executescript(LEGACY_SCHEMA)
+    start = datetime.datetime.now() - datetime.timedelta(days=90)
+    step = datetime.timedelta(days=90) / rows
+    batch = []
+    for i in range(rows):
+        timestamp = (start + step * i).isoformat()
+        content = " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 25)))
+        batch.append((rng.randrange(channels), f"user{rng.randrange(5000)}", rng.randrange(10**9),
+                      content, 1 if rng.random() < 0.1 else 0, timestamp))
+        if len(batch) == 50000:
+            conn.executemany("INSERT INTO messages (channel_id, author_name, author_id, content, is_bot, timestamp) "
+                             "VALUES (?, ?, ?, ?, ?, ?)", batch)
+            batch.clear()
+    if batch:
+        conn.executemany("INSERT INTO messages (channel_id, author_name, author_id, content, is_bot, timestamp) "
+                         "VALUES (?, ?, ?, ?, ?, ?)", batch)
+    conn.commit()
+    conn.close()
+
+def query_plan(conn, sql, params):
+    return "; ".join(row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params))
+
+def time_queries(conn, sql, param_sets):
+    timings = []
+    for params in param_sets:
+        started = time.perf_counter()
+        conn.execute(sql, params).fetchall()
+        timings.append((time.perf_counter() - started) * 1e6)
+    timings.sort()
+    return timings[len(timings) // 2], timings[int(len(timings) * 0.95)]
+
+def report(label, conn, sql, param_sets):
+    p50, p95 = time_queries(conn, sql, param_sets)
+    print(f"  {label}: p50={p50:.0f}us p95={p95:.0f}us")
+    print(f"    plan: {query_plan(conn, sql, param_sets[0])}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the messages table layout')
+    parser.add_argument('--rows', type=int, default=2000000, help='Synthetic messages, spread over 90 days')
+    parser.add_argument('--channels', type=int, default=200)
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--limit', type=int, default=25, help='History rows per query')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'conversations.db')
+        started = time.perf_counter()
+        build_legacy_db(path, args.rows, args.channels, args.seed)
+        print(f"Built {args.rows} rows in {args.channels} channels in {time.perf_counter() - started:.1f}s "
+              f"({os.path.getsize(path) / 2**20:.0f}MB)")
+
+        history_params = [(rng.randrange(args.channels), args.limit) for _ in range(args.queries)]
+        # A daily retention run deletes about one day of the oldest messages
+        cutoff = datetime.datetime.now() - datetime.timedelta(days=89)
+
+        conn = sqlite3.connect(path)
+        print("Legacy layout (ISO text timestamp):")
+        report("recent history", conn, LEGACY_HISTORY, history_params)
+        report("retention count", conn, LEGACY_RETENTION, [(cutoff.isoformat(),)] * 20)
+        conn.close()
+
+        # Migrate exactly as the bot does on startup
+        conversation_db.DB_PATH = path
+        started = time.perf_counter()
+        conversation_db.init_db(backfill_in_background=False)
+        schema_seconds = time.perf_counter() - started
+        started = time.perf_counter()
+        converted = conversation_db.backfill_message_ts(pause=0)
+        print(f"Migration: schema + indexes {schema_seconds:.1f}s, ts backfill of {converted} rows "
+              f"{time.perf_counter() - started:.1f}s ({os.path.getsize(path) / 2**20:.0f}MB after)")
+
+        conn = sqlite3.connect(path)
+        conn.execute("ANALYZE")
+        print("Migrated layout (epoch ms ts, covering index):")
+        report("recent history", conn, TS_HISTORY, history_params)
+        report("retention count", conn, TS_RETENTION,
+               [(int(cutoff.timestamp() * 1000), cutoff.isoformat())] * 20)
+        conn.close()
+        conversation_db.close_db_connections()
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,35 @@
 import os
+import json
+import time
+import asyncio
 import discord
 import datetime
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
 from dotenv import load_dotenv
 from retriever import DocumentRetriever
-from grid_client import GridClient
+from grid_client import GridClient, is_error_response
+from fallback_answers import FAQIndex, build_fallback_answer
+from prompt_builder import PromptBuilder
+from relevance_gate import RelevanceGate
+from burst_coalescer import ChannelCoalescer
+from link_cache import LinkVerdictCache
+from link_rules import LinkRules
+from url_risk import assess_links
+from spam_waves import SpamWaveIndex
+from scam_index import ScamIndex
+from memory_index import MemoryIndex
+from channel_summarizer import ChannelSummarizer
+from pipeline_metrics import PipelineMetrics
+from task_pool import BoundedWorkerPool
 from coingecko_mcp import get_crypto_context
 from conversation_db import (
-    init_db, add_message, format_channel_history,
-    format_mood, format_memories, format_recent_happenings
+    init_db, add_message, format_related_history,
+    format_mood, format_recent_happenings, set_memory_pinned,
+    log_classification
 )
+from conversation_store import ConversationStore
+from db_maintenance import MaintenanceScheduler
 
 # Load environment variables
 load_dotenv()
@@ -48,22 +68,66 @@ client = discord.Client(intents=intents)
 # Initialize document retriever and Grid client
 retriever = DocumentRetriever()
 grid_client = GridClient()
-
-# Store conversation history
-channel_message_history = {}
-MAX_MESSAGE_HISTORY = 10  # Number of messages to remember per channel
+faq_index = FAQIndex()  # Used to answer without the LLM while the Grid is down
+relevance_gate = RelevanceGate(retriever.embed_texts)  # Filters automatic classifications before the Grid
+link_verdict_cache = LinkVerdictCache()  # Known links skip the Grid scam analysis
+link_rules = LinkRules()  # Forbidden link types, hot-reloaded from link_rules.json
+spam_waves = SpamWaveIndex()  # Groups copies of the same scam posted across channels
+scam_index = ScamIndex(retriever.embed_texts)  # Known scam messages, matched by embedding
+memory_index = MemoryIndex(retriever.embed_texts)  # Memories relevant to each message
+conversation_store = ConversationStore()  # Database reads/writes off the event loop
+db_maintenance = MaintenanceScheduler()  # Retention, archival and vacuum for conversations.db
+channel_summarizer = ChannelSummarizer(grid_client, BOT_NAME)  # Rolling per-channel summaries for prompt history
 
 # Scam detection and voting
 BAN_VOTE_THRESHOLD = 3  # Number of upvotes needed to ban
 DISMISS_VOTE_THRESHOLD = 3  # Number of downvotes needed to dismiss
 pending_ban_votes = {}  # {message_id: {'target_user_id': int, 'reason': str, 'upvotes': set, 'downvotes': set}}
+dismissed_ban_votes = set()  # Vote message ids the community dismissed; later copies of that wave are left alone
+
+# Link screening runs in the background so the response path never waits on the Grid
+SCAM_SCREENING_WORKERS = int(os.getenv('SCAM_SCREENING_WORKERS', '4'))
+SCAM_SCREENING_QUEUE_SIZE = int(os.getenv('SCAM_SCREENING_QUEUE_SIZE', '100'))
+scam_screening = BoundedWorkerPool("Scam screening", SCAM_SCREENING_WORKERS, SCAM_SCREENING_QUEUE_SIZE)
+screening_replies = {}  # {message_id: [(bot message or reacted message, emoji or None)]} for messages still being screened
+flagged_messages = {}  # {message_id: True} recent messages found to be scams, oldest first
+MAX_FLAGGED_MESSAGES = 500
+
+# Routing decisions for messages waiting in the response coalescer
+pending_routes = {}  # {message_id: {'forced': bool, 'gate_score': float or None}}
+
+# Stage timings for on_message, reported by !stats
+pipeline_metrics = PipelineMetrics()
+
+# Per-source time limits (seconds) for gathering prompt context. A source that
+# runs over is left out of the prompt instead of holding up the response.
+CONTEXT_SOURCE_TIMEOUTS = {
+    'conversation_history': 2.0,
+    'related_history': 2.0,  # Full-text search of older messages
+    'context': 10.0,  # Document retrieval (embedding + vector search)
+    'crypto_context': float(os.getenv('CRYPTO_CONTEXT_TIMEOUT', '4')),
+    'mood_info': 2.0,
+    'memories_info': 2.0,
+    'happenings_info': 2.0,
+}
+
+# CoinGecko lookups get their own threads: one that overruns its timeout keeps
+# running in the background and mustn't hold a default-executor slot that
+# retrieval, the relevance gate or the memory and scam indexes need
+crypto_lookups = ThreadPoolExecutor(max_workers=2, thread_name_prefix='crypto')
 
 # Command prefixes
 COMMANDS = {
     'help': '!help',
     'upload': '!upload',
     'list': '!list',
-    'delete': '!delete'
+    'delete': '!delete',
+    'stats': '!stats',
+    'trustlink': '!trustlink',
+    'blocklink': '!blocklink',
+    'forgetlink': '!forgetlink',
+    'pinmemory': '!pinmemory',
+    'unpinmemory': '!unpinmemory'
 }
 
 @client.event
@@ -78,16 +142,13 @@ async def on_ready():
     print(f'Admin commands allowed in channels: {ALLOWED_CHANNEL_IDS}')
     print(f'Admin user ID: {ADMIN_USER_ID}')
     print('------')
-
-def get_channel_history(channel_id):
-    """Get the conversation history for a channel."""
-    if channel_id not in channel_message_history:
-        channel_message_history[channel_id] = []
-    return channel_message_history[channel_id]
-
-# add_to_channel_history is now handled by add_message from conversation_db
-
-# format_channel_history is now imported from conversation_db
+    
+    # Train the relevance gate from logged decisions without blocking the gateway
+    asyncio.create_task(asyncio.to_thread(relevance_gate.train))
+    asyncio.create_task(asyncio.to_thread(scam_index.load))
+    asyncio.create_task(asyncio.to_thread(memory_index.refresh))
+    conversation_store.start_lag_monitor()
+    db_maintenance.start()
 
 def extract_urls_from_message(message_content: str) -> list[str]:
     """Extract all URLs from a message."""
@@ -106,63 +167,19 @@ def extract_urls_from_message(message_content: str) -> list[str]:
 
 def is_forbidden_link_type(url: str, message_content: str) -> tuple[bool, str]:
     """Check if a URL is a forbidden type (DEX, DeFi, support, Discord invite).
-    Returns (is_forbidden, reason)"""
-    import re
-    url_lower = url.lower()
-    content_lower = message_content.lower()
-    
-    # Discord invites (always forbidden)
-    discord_patterns = [
-        r'discord\.gg/',
-        r'discord\.com/invite/',
-        r'discordapp\.com/invite/',
-    ]
-    for pattern in discord_patterns:
-        if re.search(pattern, url_lower):
-            return True, "posted a Discord invite link"
-    
-    # Support ticket/help desk links
-    support_keywords = ['support', 'help', 'ticket', 'helpdesk', 'zendesk', 'freshdesk']
-    support_domains = ['support', 'help', 'ticket', 'helpdesk']
-    if any(keyword in url_lower for keyword in support_keywords) or any(domain in url_lower for domain in support_domains):
-        return True, "posted a support ticket/help link"
-    
-    # DEX (Decentralized Exchange) links
-    dex_keywords = ['dex', 'uniswap', 'pancakeswap', 'sushiswap', '1inch', 'dydx', 'curve', 'balancer', 'kyberswap']
-    dex_domains = ['uniswap', 'pancakeswap', 'sushiswap', '1inch', 'dydx', 'curve.fi', 'balancer', 'kyberswap']
-    if any(keyword in url_lower for keyword in dex_keywords) or any(domain in url_lower for domain in dex_domains):
-        return True, "posted a DEX (decentralized exchange) link"
-    
-    # DeFi platform links
-    defi_keywords = ['defi', 'lending', 'borrowing', 'yield', 'farm', 'staking', 'liquidity', 'pool']
-    defi_domains = ['aave', 'compound', 'makerdao', 'yearn', 'convex', 'frax']
-    if any(keyword in url_lower for keyword in defi_keywords) or any(domain in url_lower for domain in defi_domains):
-        # But allow if it's clearly about AIPG staking/pools (legitimate)
-        if 'aipg' in content_lower or 'aipowergrid' in content_lower or 'power grid' in content_lower:
-            return False, ""
-        return True, "posted a DeFi platform link"
-    
-    return False, ""
+    Returns (is_forbidden, reason). Rules live in link_rules.json (see link_rules.py)."""
+    return link_rules.check(url, message_content)
 
 def detect_discord_invite(message_content: str) -> tuple[bool, str]:
     """Quick check for Discord invites (always flag these)."""
-    import re
-    content_lower = message_content.lower()
-    
-    discord_invite_patterns = [
-        r'discord\.gg/\w+',
-        r'discord\.com/invite/\w+',
-        r'discordapp\.com/invite/\w+',
-    ]
-    
-    for pattern in discord_invite_patterns:
-        if re.search(pattern, content_lower):
-            return True, "posted a Discord invite link"
-    
+    if link_rules.find_in_text(message_content, 'discord_invite'):
+        return True, "posted a Discord invite link"
     return False, ""
 
-async def analyze_link_with_ai(message_content: str, urls: list[str]) -> tuple[bool, str]:
-    """Use AI Power Grid to analyze if a message with links is a scam."""
+async def analyze_link_with_ai(message_content: str, urls: list[str]) -> tuple[bool, str, bool]:
+    """Use AI Power Grid to analyze if a message with links is a scam.
+    Returns (is_scam, reason, analyzed) - analyzed is False when the AI call
+    failed and the message was only flagged to be safe, so it isn't cached."""
     import json
     
     urls_text = "\n".join([f"- {url}" for url in urls])
@@ -200,6 +217,9 @@ Only return the JSON object, nothing else.
     try:
         result = await grid_client.get_answer(analysis_prompt, [])
         print(f"AI Scam Analysis Response: '{result}'")
+        if is_error_response(result):
+            # The Grid didn't analyze anything (e.g. breaker still recovering) - leave it unscreened
+            return False, "", False
         
         # Try to extract JSON from response
         result_clean = result.strip()
@@ -218,84 +238,270 @@ Only return the JSON object, nothing else.
         is_scam = analysis.get('is_scam', False)
         reason = analysis.get('reason', 'analyzed by AI')
         
-        return is_scam, reason
+        return is_scam, reason, True
         
     except json.JSONDecodeError as e:
         print(f"Failed to parse AI scam analysis JSON: {e}")
         print(f"Raw response: '{result}'")
         # If AI fails, default to flagging it (safer)
-        return True, "AI analysis failed - flagged for review"
+        return True, "AI analysis failed - flagged for review", False
     except Exception as e:
         print(f"Error in AI scam analysis: {e}")
         # If AI fails, default to flagging it (safer)
-        return True, "AI analysis error - flagged for review"
+        return True, "AI analysis error - flagged for review", False
 
-async def handle_scam_detection(message):
-    """Handle detected scam messages by creating a vote."""
+def start_scam_screening(message) -> str:
+    """Start screening a message's links in the background, without waiting for a verdict.
+    
+    Returns "none" (nothing to screen), "pending" or "scam" (a copy of a wave
+    already found to be a scam). First copies go to the bounded worker pool,
+    since they may need a Grid round trip. Copies of a wave seen recently in any
+    channel (see spam_waves.py) never go to the Grid: they wait on the first
+    copy's verdict, run the cheap checks on their own links and join its ban
+    vote, so they run as plain tracked tasks and a raid can't tie up the
+    workers. A verdict that arrives after the bot replied retracts the reply."""
     # Don't check admins
     if message.author.id == ADMIN_USER_ID:
-        print(f"⏭️  Skipping scam check for admin: {message.author.display_name}")
-        return False
-    
-    print(f"🔍 Checking message for scams: '{message.content[:100]}...' from {message.author.display_name}")
+        return "none"
     
     # Check for URLs
     urls = extract_urls_from_message(message.content)
-    print(f"🔗 Extracted {len(urls)} URL(s): {urls}")
-    
     if not urls:
         # No links, not a scam
-        print(f"⏭️  No URLs found in message, skipping scam check")
-        return False
+        return "none"
+    
+    print(f"🔍 Screening {len(urls)} URL(s) from {message.author.display_name} in the background: {urls}")
+    wave, is_first = spam_waves.observe(message.content, message.channel.id, message.author.id)
+    screening_replies[message.id] = []
+    
+    if not is_first:
+        scam_screening.spawn(screen_wave_copy(wave, message, urls))
+        shared = wave.shared_verdict()
+        if shared and shared[0]:
+            flag_message(message)
+            return "scam"
+        return "pending"
+    
+    if not scam_screening.submit(lambda: screen_message(wave, message, urls), label=f"message {message.id}"):
+        # Overloaded: still apply the rules, cache and risk score, just skip the Grid
+        print(f"⚠️  Scam screening queue full, checking message {message.id} without the Grid")
+        scam_screening.spawn(screen_message(wave, message, urls, allow_grid=False))
+    return "pending"
+
+async def screen_message(wave, message, urls: list[str], allow_grid: bool = True):
+    """Screen the first copy of a wave and post the ban vote if it's a scam."""
+    is_scam, reason, source = False, "", "error"
+    try:
+        is_scam, reason, source = await screen_links(message, urls, allow_grid=allow_grid)
+        if is_scam:
+            await retract_responses(message)
+            wave.vote_message_id = await create_ban_vote(message, reason)
+    finally:
+        # Copies waiting on this wave get the verdict (one they can't reuse if screening failed)
+        wave.resolve(is_scam, reason, source)
+        screening_replies.pop(message.id, None)
+
+async def screen_wave_copy(wave, message, urls: list[str]):
+    """Screen a copy with the cheap checks on its own links plus the wave's Grid or
+    scam-index verdict, and add it to the wave's ban vote if it's a scam."""
+    try:
+        await asyncio.shield(wave.verdict)
+        is_scam, reason, source = await screen_links(message, urls, allow_grid=False, shared=wave.shared_verdict())
+        print(f"🌊 Copy {wave.copies} of a message seen in {len(wave.channels)} channel(s): is_scam={is_scam} ({source})")
+        if is_scam:
+            await retract_responses(message)
+            await add_to_ban_vote(wave, message, reason)
+    finally:
+        screening_replies.pop(message.id, None)
+
+def flag_message(message):
+    """Remember a scam message so the response pipeline leaves it alone."""
+    flagged_messages[message.id] = True
+    while len(flagged_messages) > MAX_FLAGGED_MESSAGES:
+        del flagged_messages[next(iter(flagged_messages))]
+
+def track_screened_replies(messages, delivered: list):
+    """Remember what the bot sent in answer to messages that are still being screened.
+    A message flagged while the reply was being delivered gets it retracted now."""
+    flagged = next((m for m in messages if m.id in flagged_messages), None)
+    if flagged:
+        scam_screening.spawn(retract_sent(flagged.id, delivered))
+    for m in messages:
+        if m.id in screening_replies:
+            screening_replies[m.id].extend(delivered)
+
+async def retract_responses(message):
+    """A message turned out to be a scam: drop any pending answer to it and take back what the bot already sent."""
+    flag_message(message)
+    if response_coalescer.discard(message.channel.id, message.id):
+        print(f"🛑 Scam message {message.id} dropped from pending response decision")
+    await retract_sent(message.id, screening_replies.pop(message.id, []))
+
+async def retract_sent(message_id: int, delivered: list):
+    """Delete replies and remove reactions the bot sent in answer to a scam message."""
+    for sent, emoji in delivered:
+        try:
+            if emoji:
+                await sent.remove_reaction(emoji, client.user)
+            else:
+                await sent.delete()
+            print(f"↩️  Retracted {'reaction ' + emoji if emoji else 'reply'} to scam message {message_id}")
+        except Exception as e:
+            print(f"Error retracting response to scam message: {e}")
+
+async def screen_links(message, urls: list[str], allow_grid: bool = True,
+                       shared: tuple | None = None) -> tuple[bool, str, str]:
+    """Decide whether a message's links are a scam: admin overrides and cached
+    verdicts, forbidden link rules, similarity to known scam messages, the
+    offline risk score, then the Grid (unless allow_grid is False).
+    
+    Returns (is_scam, reason, source), source naming the check that decided:
+    "rule", "similarity", "cache", "risk", "grid" or "unscreened" (no check
+    could tell). `shared` is a spam-wave verdict from the similarity check or
+    the Grid (see SpamWave.shared_verdict), used in place of running that check."""
+    # Cached verdicts (and admin overrides) for links we've seen before
+    verdicts = await conversation_store.read(link_verdict_cache.lookup, urls)
+    admin_trusted = {url for url, verdict in verdicts.items()
+                     if verdict and verdict['source'] == 'admin' and not verdict['is_scam']}
     
     # Check each URL for forbidden types (DEX, DeFi, support, Discord invites)
-    is_scam = False
-    reason = ""
-    
     for url in urls:
+        if url in admin_trusted:
+            continue  # Trusted by an admin
         is_forbidden, forbidden_reason = is_forbidden_link_type(url, message.content)
         if is_forbidden:
             print(f"🚨 Forbidden link type detected: {forbidden_reason} - URL: {url}")
-            is_scam = True
-            reason = forbidden_reason
-            break
-    
-    if not is_scam:
-        # No forbidden links found, use AI to analyze for other scam patterns
-        print(f"🔍 No forbidden link types detected. Analyzing {len(urls)} link(s) with AI for other scam patterns...")
-        is_scam, reason = await analyze_link_with_ai(message.content, urls)
-        print(f"🤖 AI Analysis Result: is_scam={is_scam}, reason='{reason}'")
-    
-    if not is_scam:
-        return False
-    
-    # Create vote message
-    vote_message_text = f"🚨 **Ban {message.author.mention} ({message.author.display_name})?**\nReason: {reason}\n\nReact ✅ to ban, ❌ to dismiss"
+            return True, forbidden_reason, "rule"
+    
+    # Messages that read like a known scam template are flagged without the Grid - unless
+    # every link is trusted: a real announcement reads like the scams imitating it
+    if not all(url in admin_trusted or link_rules.is_allowed_url(url) for url in urls):
+        if shared:
+            # The wave's first copy already ran this check (on near-identical text)
+            if shared[2] == "similarity":
+                return shared
+        else:
+            match = await asyncio.to_thread(scam_index.match, message.content)
+            if match:
+                similarity, example = match
+                print(f"🧬 Scam index match {similarity:.2f} with example #{example['id']}: '{example['content'][:80]}'")
+                return True, f"matches a known scam ({example['reason']})", "similarity"
+    
+    cached_scams = [verdicts[url] for url in urls if verdicts[url] and verdicts[url]['is_scam']]
+    if cached_scams:
+        print(f"🗂️  Cached scam verdict ({cached_scams[0]['source']}): {cached_scams[0]['reason']}")
+        return True, cached_scams[0]['reason'], "cache"
+    if all(verdicts.values()):
+        print(f"🗂️  All {len(urls)} link(s) have cached safe verdicts, skipping AI analysis")
+        return False, "", "cache"
+    
+    # Offline lexical score for the links we don't know yet; only the ambiguous middle goes to the Grid
+    unknown_urls = [url for url in urls if not verdicts[url]]
+    risk_verdict, risk_score, risk_reason = assess_links(unknown_urls, trusted=link_rules.is_allowed)
+    if risk_score is not None:
+        print(f"🧮 URL risk {risk_score:.2f} ({risk_verdict}): {risk_reason}")
+    if risk_verdict == "scam":
+        return True, risk_reason, "risk"
+    if risk_verdict == "safe":
+        return False, "", "risk"
+    
+    if shared and shared[2] == "grid":
+        return shared
+    
+    if not allow_grid:
+        return False, "", "unscreened"
+    
+    if not grid_client.is_available():
+        # Don't queue behind a dead Grid (and don't flag every link as a failed analysis)
+        print(f"⚡ Grid circuit breaker open, skipping AI link analysis")
+        return False, "", "unscreened"
+    
+    # No forbidden links found, use AI to analyze for other scam patterns
+    print(f"🔍 No forbidden link types detected. Analyzing {len(urls)} link(s) with AI for other scam patterns...")
+    is_scam, reason, analyzed = await analyze_link_with_ai(message.content, urls)
+    print(f"🤖 AI Analysis Result: is_scam={is_scam}, reason='{reason}'")
+    if not analyzed:
+        # A failed analysis is flagged for review, but it says nothing about the wave's other copies
+        return is_scam, reason, "unscreened"
+    # Links that already had a verdict keep it; only cache the new ones
+    conversation_store.write_nowait(link_verdict_cache.record, unknown_urls, is_scam, reason)
+    return is_scam, reason, "grid"
+
+def format_ban_vote(vote_info: dict) -> str:
+    """Vote message text, listing every account that posted the scam."""
+    targets = list(vote_info['targets'].items())
+    names = ", ".join(f"<@{user_id}> ({name})" for user_id, name in targets[:20])
+    if len(targets) > 20:
+        names += f" and {len(targets) - 20} more"
+    text = f"🚨 **Ban {names}?**\nReason: {vote_info['reason']}"
+    if vote_info['copies'] > 1:
+        text += f"\nSame message posted {vote_info['copies']} times in {len(vote_info['channels'])} channel(s)"
+    return text + "\n\nReact ✅ to ban, ❌ to dismiss"
+
+async def create_ban_vote(message, reason: str):
+    """Post a ban vote for a scam message. Returns the vote message id, or None if it couldn't be posted."""
+    vote_info = {
+        'target_user_id': message.author.id,
+        'target_user_name': message.author.display_name,
+        'targets': {message.author.id: message.author.display_name},
+        'copies': 1,
+        'channels': {message.channel.id},
+        'reason': reason,
+        'original_message_id': message.id,
+        'content': message.content,
+        'channel_id': message.channel.id,
+        'upvotes': {client.user.id},  # Bot's vote counts as 1
+        'downvotes': set(),
+        'refresh_task': None
+    }
     
     try:
-        vote_message = await message.channel.send(vote_message_text)
+        vote_message = await message.channel.send(format_ban_vote(vote_info))
         
         # Bot automatically adds its own ban vote (1 vote from bot, chat needs 2 more)
         await vote_message.add_reaction('✅')
         await vote_message.add_reaction('❌')
         
         # Store vote info with bot's vote already counted
-        pending_ban_votes[vote_message.id] = {
-            'target_user_id': message.author.id,
-            'target_user_name': message.author.display_name,
-            'reason': reason,
-            'original_message_id': message.id,
-            'channel_id': message.channel.id,
-            'upvotes': {client.user.id},  # Bot's vote counts as 1
-            'downvotes': set()
-        }
+        vote_info['vote_message'] = vote_message
+        pending_ban_votes[vote_message.id] = vote_info
         
         print(f"🚨 Scam detected! Created ban vote for {message.author.display_name}: {reason} (Bot voted ✅, chat needs 2 more)")
-        return True
+        return vote_message.id
         
     except Exception as e:
         print(f"Error creating ban vote: {e}")
+        return None
+
+async def add_to_ban_vote(wave, message, reason: str) -> bool:
+    """Fold a copy from a spam wave into the wave's existing vote."""
+    if wave.vote_message_id in dismissed_ban_votes:
         return False
+    vote_info = pending_ban_votes.get(wave.vote_message_id)
+    if vote_info is None:
+        # The wave's vote was already decided (or never got posted) - this copy gets its own
+        wave.vote_message_id = await create_ban_vote(message, reason)
+        return wave.vote_message_id is not None
+    
+    vote_info['targets'][message.author.id] = message.author.display_name
+    vote_info['copies'] += 1
+    vote_info['channels'].add(message.channel.id)
+    
+    # One edit per burst of copies rather than one per copy, to stay clear of rate limits
+    if vote_info['refresh_task'] is None or vote_info['refresh_task'].done():
+        vote_info['refresh_task'] = asyncio.create_task(refresh_ban_vote(wave.vote_message_id))
+    return True
+
+async def refresh_ban_vote(vote_message_id: int, delay: float = 2.0):
+    """Update a vote message with the copies that joined it."""
+    await asyncio.sleep(delay)
+    vote_info = pending_ban_votes.get(vote_message_id)
+    if vote_info is None:
+        return
+    try:
+        await vote_info['vote_message'].edit(content=format_ban_vote(vote_info))
+    except Exception as e:
+        print(f"Error updating ban vote: {e}")
 
 def should_respond_to_message(content, author_id):
     """Basic filters - don't respond to bots, commands, or empty messages."""
@@ -317,17 +523,7 @@ def has_obvious_trigger(content: str, message) -> bool:
     """Quick implicit filter - like human skimming. Returns True if message catches attention."""
     content_lower = content.lower()
     
-    # Always respond to direct mentions
-    if client.user.mentioned_in(message):
-        return True
-    
-    # Always respond to replies to bot
-    if message.reference and message.reference.message_id:
-        try:
-            # We'll check if it's a reply to us in the main flow, but flag it here
-            return True
-        except:
-            pass
+    # Mentions and replies to the bot are routed before this (see route_message)
     
     # Question patterns
     if '?' in content:
@@ -406,7 +602,12 @@ async def handle_help_command(message):
             name="Document Management (Admin Only)",
             value=f"`{COMMANDS['upload']}` - Upload a document (attach a file)\n"
                   f"`{COMMANDS['list']}` - List all documents\n"
-                  f"`{COMMANDS['delete']} [filename]` - Delete a document",
+                  f"`{COMMANDS['delete']} [filename]` - Delete a document\n"
+                  f"`{COMMANDS['stats']}` - Show Grid and relevance gate stats\n"
+                  f"`{COMMANDS['trustlink']} [url or domain]` - Never flag this link/domain as a scam\n"
+                  f"`{COMMANDS['blocklink']} [url or domain] [reason]` - Always flag this link/domain\n"
+                  f"`{COMMANDS['forgetlink']} [url or domain]` - Drop a cached verdict or override\n"
+                  f"`{COMMANDS['pinmemory']} [key]` / `{COMMANDS['unpinmemory']} [key]` - Always / only when relevant include a memory",
             inline=False
         )
     
@@ -509,58 +710,17 @@ async def handle_delete_command(message):
     except Exception as e:
         await message.channel.send(f"❌ Error deleting document: {str(e)}")
 
-async def classify_and_respond(message):
-    """Classify if the bot should respond and generate a natural response."""
-    content = message.content.strip()
-    author_name = message.author.display_name
-    
-    # Check basic conditions first
-    if not should_respond_to_message(content, message.author.id):
-        return False
-    
-    # Add the message to channel history (always save, but don't always process)
-    add_message(message.channel.id, author_name, content, author_id=message.author.id, is_bot=False)
-    
-    # STAGE 1: Quick implicit filter (like human skimming)
-    if not has_obvious_trigger(content, message):
-        print(f"⏭️  Skipped (no obvious trigger): '{content[:50]}...'")
-        return False
-    
-    # STAGE 2: Full processing (only if we got here - message caught attention)
-    print(f"\n🔍 Processing message: '{content}' from {author_name}")
-    
-    try:
-        # Get conversation history for context
-        conversation_history = format_channel_history(message.channel.id, max_messages=10)
-        
-        # Retrieve relevant documents for the response
-        context = retriever.get_relevant_context(content)
-        
-        # Get crypto market data if relevant
-        crypto_context = await get_crypto_context(content)
-        
-        # Get mood, memories, and recent happenings
-        mood_info = format_mood()
-        memories_info = format_memories()
-        happenings_info = format_recent_happenings()
-        
-        # Get channel information
-        channel_name = message.channel.name if hasattr(message.channel, 'name') else f"Channel {message.channel.id}"
-        channel_topic = ""
-        if hasattr(message.channel, 'topic') and message.channel.topic:
-            channel_topic = message.channel.topic
-        elif hasattr(message.channel, 'description') and message.channel.description:
-            channel_topic = message.channel.description
-        
-        channel_info = f"Channel: #{channel_name}"
-        if channel_topic:
-            channel_info += f"\nChannel description: {channel_topic}"
-        
-        # Single API call with JSON response
-        current_time = datetime.datetime.now()
-        timestamp = current_time.strftime("%B %d, %Y at %I:%M %p")
-        
-        single_prompt = f"""
+# Added to the prompt when the batch holds a mention of or reply to the bot
+DIRECT_ADDRESS_NOTE = ('You were directly addressed (mentioned or replied to), so you MUST respond this time: '
+                       'return {"respond": true, "message": ...}, even if it is only to say you don\'t know.')
+
+def render_classify_prompt(timestamp: str, channel_info: str = "",
+                           mood_info: str = "", memories_info: str = "", happenings_info: str = "",
+                           conversation_history: str = "", related_history: str = "",
+                           latest_messages: str = "", documents: str = "",
+                           crypto_context: str = "", direct_address: str = "") -> str:
+    """Fill the classify-and-respond prompt template with (already budgeted) sections."""
+    return f"""
 You are {BOT_NAME}, a helpful Discord bot for AI Power Grid discussions.
 
 Current time: {timestamp}
@@ -573,11 +733,13 @@ Current time: {timestamp}
 
 Recent conversation:
 {conversation_history}
+{related_history}
 
-Latest message from {author_name}: "{content}"
+{latest_messages}
+{direct_address}
 
 Context from AI Power Grid documentation:
-{chr(10).join([f"[{i+1}] {item['text']}" for i, item in enumerate(context)])}
+{documents}
 {crypto_context}
 
 DEFAULT BEHAVIOR: Stay quiet unless you have something valuable to add. Most messages don't need a response - that's normal and expected. Think like a human: you naturally stay quiet most of the time.
@@ -623,124 +785,442 @@ If you should NOT respond (most cases), return:
 
 Only return valid JSON. Default to staying quiet - only respond when you have value to add.
 """
+
+
+async def handle_stats_command(message):
+    """Handle the !stats command."""
+    if message.author.id != ADMIN_USER_ID:
+        await message.channel.send("You don't have permission to view stats.")
+        return
+    
+    grid_stats = grid_client.get_stats()
+    models = grid_stats.pop('models')
+    lines = [
+        "Grid: " + ", ".join(f"{key}={value}" for key, value in grid_stats.items()),
+        *[f"  {m['model']}: p50={m['p50']} p90={m['p90']} failure_rate={m['failure_rate']} healthy={m['healthy']}" for m in models],
+        relevance_gate.report(),
+        link_verdict_cache.report(),
+        spam_waves.report(),
+        scam_index.report(),
+        memory_index.report(),
+        channel_summarizer.report(),
+        scam_screening.report(),
+        *pipeline_metrics.report(),
+        *conversation_store.report(),
+        db_maintenance.report(),
+    ]
+    await message.channel.send("```\n" + "\n".join(lines)[:1900] + "\n```")
+
+async def handle_memory_pin_command(message):
+    """Handle !pinmemory and !unpinmemory."""
+    if message.author.id != ADMIN_USER_ID:
+        await message.channel.send("You don't have permission to change memories.")
+        return
+    
+    command_parts = message.content.split(maxsplit=1)
+    command = command_parts[0]
+    if len(command_parts) < 2:
+        await message.channel.send(f"Please specify a memory key. Usage: `{command} [key]`")
+        return
+    key = command_parts[1].strip()
+    
+    pinned = command == COMMANDS['pinmemory']
+    if await conversation_store.write(set_memory_pinned, key, pinned):
+        await message.channel.send(f"✅ Memory `{key}` will {'always be included' if pinned else 'only be included when relevant'}")
+    else:
+        await message.channel.send(f"❌ No memory with key `{key}`")
+
+async def handle_link_override_command(message):
+    """Handle !trustlink, !blocklink and !forgetlink."""
+    if message.author.id != ADMIN_USER_ID:
+        await message.channel.send("You don't have permission to change link verdicts.")
+        return
+    
+    command_parts = message.content.split(maxsplit=2)
+    command = command_parts[0]
+    if len(command_parts) < 2:
+        await message.channel.send(f"Please specify a URL or domain. Usage: `{command} [url or domain]`")
+        return
+    target = command_parts[1]
+    
+    if command == COMMANDS['forgetlink']:
+        if await conversation_store.write(link_verdict_cache.forget, target):
+            await message.channel.send(f"✅ Forgot the verdict for {target}")
+        else:
+            await message.channel.send(f"❌ No cached verdict for {target}")
+        return
+    
+    is_scam = command == COMMANDS['blocklink']
+    default_reason = "blocked by admin" if is_scam else "trusted by admin"
+    reason = command_parts[2].strip() if len(command_parts) > 2 else default_reason
+    key = await conversation_store.write(link_verdict_cache.override, target, is_scam, reason)
+    if key is None:
+        await message.channel.send(f"❌ Couldn't parse a URL or domain from {target}")
+        return
+    await message.channel.send(f"✅ {key[0].capitalize()} `{key[1]}` will {'always' if is_scam else 'never'} be flagged as a scam")
+
+def record_decision(message, content: str, responded: bool, forced: bool, gate_score):
+    """Log a respond/stay-quiet decision and retrain the relevance gate when enough have piled up."""
+    source = "forced" if forced else "llm"
+    conversation_store.write_nowait(log_classification, message.channel.id, message.id, content, responded, source=source, gate_score=gate_score)
+    if not forced and relevance_gate.record_llm_decision(gate_score, responded):
+        asyncio.create_task(asyncio.to_thread(relevance_gate.train))
+
+async def is_reply_to_bot(message) -> bool:
+    """True if the message is a reply to one of the bot's messages."""
+    reference = message.reference
+    if not reference or not reference.message_id:
+        return False
+    
+    # discord.py usually resolves the replied-to message already; fetch only if it didn't
+    referenced = reference.resolved if isinstance(reference.resolved, discord.Message) else None
+    if referenced is None:
+        try:
+            referenced = await message.channel.fetch_message(reference.message_id)
+        except Exception as e:
+            print(f"Error fetching replied-to message: {e}")
+            return False
+    return referenced.author == client.user
+
+def strip_bot_mention(content: str) -> str:
+    """Remove the bot's @-mention from a message, leaving the question."""
+    for mention in (f'<@{client.user.id}>', f'<@!{client.user.id}>'):
+        content = content.replace(mention, '')
+    return content.strip()
+
+async def route_message(message) -> str:
+    """Decide how a chat message is handled:
+    'forced' - a mention of or reply to the bot, always answered
+    'auto'   - caught attention while skimming, the LLM decides whether to respond
+    'skip'   - nothing to respond to"""
+    if client.user.mentioned_in(message) or await is_reply_to_bot(message):
+        return 'forced'
+    if has_obvious_trigger(message.content.strip(), message):
+        return 'auto'
+    return 'skip'
+
+def fetch_crypto_context(content: str) -> str:
+    """Blocking: run the CoinGecko lookup on a private event loop. Its MCP calls
+    are abandoned at the timeout; its HTTP calls stop at COINGECKO_HTTP_TIMEOUT."""
+    return asyncio.run(asyncio.wait_for(get_crypto_context(content), CONTEXT_SOURCE_TIMEOUTS['crypto_context']))
+
+async def gather_prompt_context(channel_id: int, retrieval_query: str, latest_content: str) -> dict:
+    """Fetch every prompt input concurrently, each under its own timeout.
+    
+    Blocking sources (SQLite, embedding/vector search) run in worker threads.
+    The crypto lookup makes blocking HTTP calls inside its coroutine, so it gets
+    its own thread and event loop - otherwise its timeout couldn't fire."""
+    loop = asyncio.get_running_loop()
+    sources = {
+        'conversation_history': (lambda: conversation_store.read(channel_summarizer.format_history, channel_id, 10), ""),
+        'related_history': (lambda: conversation_store.read(format_related_history, channel_id, retrieval_query), ""),
+        'context': (lambda: asyncio.to_thread(retriever.get_relevant_context, retrieval_query), []),
+        'crypto_context': (lambda: loop.run_in_executor(crypto_lookups, fetch_crypto_context, latest_content), ""),
+        'mood_info': (lambda: conversation_store.read_state('mood', format_mood), ""),
+        'memories_info': (lambda: asyncio.to_thread(memory_index.format_for, retrieval_query), ""),
+        'happenings_info': (lambda: conversation_store.read_state('happenings', format_recent_happenings), ""),
+    }
+    
+    async def fetch(name, start_source, default):
+        started = time.perf_counter()
+        try:
+            value = await asyncio.wait_for(start_source(), CONTEXT_SOURCE_TIMEOUTS[name])
+            status = ""
+        except asyncio.TimeoutError:
+            # The worker thread finishes in the background; we just don't wait for it
+            value, status = default, " TIMEOUT"
+        except Exception as e:
+            value, status = default, f" ERROR({e})"
+        return name, value, f"{name}={(time.perf_counter() - started) * 1000:.0f}ms{status}"
+    
+    started = time.perf_counter()
+    results = await asyncio.gather(*(fetch(name, start, default) for name, (start, default) in sources.items()))
+    print(f"⏱️  Context gathered in {(time.perf_counter() - started) * 1000:.0f}ms: {' '.join(r[2] for r in results)}")
+    return {name: value for name, value, _ in results}
+
+def parse_response_json(result: str):
+    """Parse the model's JSON decision (tolerating ```json fences). None if it isn't a JSON object."""
+    result_clean = result.strip()
+    if result_clean.startswith('```json'):
+        result_clean = result_clean[7:]
+    if result_clean.endswith('```'):
+        result_clean = result_clean[:-3]
+    result_clean = result_clean.strip()
+    
+    try:
+        response_data = json.loads(result_clean)
+    except json.JSONDecodeError as e:
+        print(f"Failed to parse JSON response: {e}")
+        print(f"Raw response: '{result}'")
+        return None
+    return response_data if isinstance(response_data, dict) else None
+
+def channel_display_name(channel) -> str:
+    return channel.name if hasattr(channel, 'name') else f"Channel {channel.id}"
+
+def build_classify_prompt(message, gathered: dict, latest_messages: str, forced: bool) -> str:
+    """Fit the gathered context into the classify-and-respond prompt."""
+    # Get channel information
+    channel_name = channel_display_name(message.channel)
+    channel_topic = ""
+    if hasattr(message.channel, 'topic') and message.channel.topic:
+        channel_topic = message.channel.topic
+    elif hasattr(message.channel, 'description') and message.channel.description:
+        channel_topic = message.channel.description
+    
+    channel_info = f"Channel: #{channel_name}"
+    if channel_topic:
+        channel_info += f"\nChannel description: {channel_topic}"
+    
+    current_time = datetime.datetime.now()
+    timestamp = current_time.strftime("%B %d, %Y at %I:%M %p")
+    direct_address = DIRECT_ADDRESS_NOTE if forced else ""
+    
+    # Fit every variable section into the context window, trimming the least
+    # important ones first (happenings, memories, crypto, then older history/docs)
+    prompt_budget = PromptBuilder(label=f"classify prompt for {message.id}")
+    prompt_budget.add_fixed(render_classify_prompt(timestamp, direct_address=direct_address))
+    prompt_budget.add('channel_info', channel_info, priority=90, max_tokens=150)
+    prompt_budget.add_block('latest_messages', latest_messages, priority=100, max_tokens=1000, keep="tail")
+    prompt_budget.add('documents', [f"[{i+1}] {item['text']}" for i, item in enumerate(gathered['context'])],
+                      priority=70, max_tokens=3000)
+    prompt_budget.add_block('conversation_history', gathered['conversation_history'], priority=60, max_tokens=1500, keep="tail")
+    prompt_budget.add_block('related_history', gathered['related_history'], priority=55, max_tokens=500)
+    prompt_budget.add_block('crypto_context', gathered['crypto_context'], priority=50, max_tokens=300)
+    prompt_budget.add_block('memories_info', gathered['memories_info'], priority=40, max_tokens=800)
+    prompt_budget.add_block('happenings_info', gathered['happenings_info'], priority=30, max_tokens=600)
+    prompt_budget.add('mood_info', gathered['mood_info'], priority=20, max_tokens=60)
+    return render_classify_prompt(timestamp, direct_address=direct_address, **prompt_budget.build())
+
+async def find_reaction_target(message, content: str):
+    """Pick the message a reaction is meant for ("react to my message a few messages ago")."""
+    target_message = message  # Default to current message
+    
+    # Check if user wants to react to a previous message
+    content_lower = content.lower()
+    needs_previous = any(phrase in content_lower for phrase in [
+        'few messages ago', 'previous message', 'earlier message', 
+        'that message', 'my message', 'a few messages ago'
+    ])
+
+    if needs_previous:
+        # Fetch recent messages to find the target
+        try:
+            messages_found = []
+            async for msg in message.channel.history(limit=20):
+                # Skip the current message and bot messages
+                if msg.id == message.id or msg.author == client.user:
+                    continue
+                messages_found.append(msg)
+
+            # If they said "my message", find their message
+            if 'my message' in content_lower:
+                user_messages = [msg for msg in messages_found if msg.author.id == message.author.id]
+
+                # If they also said "few messages ago", skip forward a bit
+                if 'few' in content_lower or 'several' in content_lower:
+                    # Find their message that's a few back (skip first 1-2 of their messages)
+                    skip_own = 1 if len(user_messages) > 1 else 0
+                    if len(user_messages) > skip_own:
+                        target_message = user_messages[skip_own]
+                        print(f"Found user's message {skip_own+1} back: {target_message.id} - '{target_message.content[:50]}...'")
+                    elif len(user_messages) > 0:
+                        target_message = user_messages[0]
+                        print(f"Found user's most recent message: {target_message.id} - '{target_message.content[:50]}...'")
+                else:
+                    # Just "my message" - find their most recent
+                    if len(user_messages) > 0:
+                        target_message = user_messages[0]
+                        print(f"Found user's most recent message: {target_message.id} - '{target_message.content[:50]}...'")
+            # Otherwise, find a message a few back (skip 1-3 messages)
+            else:
+                # Try to find message 2-4 messages back
+                skip_count = 2  # Default: 2 messages back
+                if 'few' in content_lower or 'several' in content_lower:
+                    skip_count = 3
+
+                if len(messages_found) > skip_count:
+                    target_message = messages_found[skip_count]
+                    print(f"Found message {skip_count} back: {target_message.id} - '{target_message.content[:50]}...'")
+                elif len(messages_found) > 0:
+                    # Fallback to first non-bot message found
+                    target_message = messages_found[0]
+                    print(f"Found first previous message: {target_message.id} - '{target_message.content[:50]}...'")
+
+        except Exception as e:
+            print(f"Error fetching message history: {e}")
+    
+    return target_message
+
+def record_bot_reply(channel, text: str):
+    """Add a reply the bot actually sent to the channel's history."""
+    conversation_store.write_nowait(add_message, channel.id, BOT_NAME, text, author_id=client.user.id, is_bot=True)
+    channel_summarizer.note_message(channel.id, channel_display_name(channel))
+
+async def deliver_response(message, content: str, response_message: str, react_emoji, typing_delay: bool = True) -> list:
+    """Send the reply and/or reaction chosen by the LLM. Returns what was sent
+    as (message, emoji or None) pairs, so it can be retracted."""
+    # Newer messages can't supersede the batch from here on, or a reaction
+    # could be added twice and a reply recorded without being sent
+    response_coalescer.begin_delivery()
+    delivered = []
+    if react_emoji:
+        target_message = await find_reaction_target(message, content)
+        try:
+            await target_message.add_reaction(react_emoji)
+            delivered.append((target_message, react_emoji))
+            print(f"Reacted with {react_emoji} to message {target_message.id} from {target_message.author.display_name}")
+        except Exception as e:
+            print(f"Error adding reaction: {e}")
+    
+    if response_message:
+        # Show typing indicator for 1-2 seconds before responding (forced answers already showed it while generating)
+        if typing_delay:
+            async with message.channel.typing():
+                await asyncio.sleep(1.5)  # 1.5 second delay
         
-        # Get response from Grid API (no typing indicator during decision)
-        result = await grid_client.get_answer(single_prompt, [])
+        # Send the response naturally
+        sent = await message.channel.send(response_message)
+        delivered.append((sent, None))
+        print(f"Responding with: '{response_message}'")
+        
+        # Add bot response to channel history
+        record_bot_reply(message.channel, response_message)
+    return delivered
+
+async def send_fallback_answer(message, context: list) -> list:
+    """Answer a mention/reply from the FAQ/docs when the Grid can't."""
+    response_coalescer.begin_delivery()
+    answer = build_fallback_answer(strip_bot_mention(message.content), context, faq_index)
+    sent = await message.channel.send(answer)
+    print(f"Answered from FAQ/docs: '{answer[:100]}'")
+    record_bot_reply(message.channel, answer)
+    return [(sent, None)]
+
+async def respond_to_batch(messages):
+    """Make one respond/stay-quiet decision covering a batch of messages from one channel.
+    
+    This is the only place a message gets a retrieval and a Grid generation.
+    The reply (or reaction) targets the latest message, so it addresses the
+    current state of the conversation. If the batch holds a mention of or
+    reply to the bot, it must be answered: the prompt says so, and a refusal,
+    unusable output or a Grid outage falls back to the FAQ/docs instead of a
+    second generation. Cancelled by the coalescer if newer messages supersede
+    the batch, which also cancels the Grid generation. What it sends in answer
+    to messages whose links are still being screened is tracked, so a late scam
+    verdict can retract it."""
+    message = messages[-1]
+    content = message.content.strip()
+    author_name = message.author.display_name
+    routes = [pending_routes.get(m.id, {}) for m in messages]
+    forced = any(route.get('forced') for route in routes)
+    gate_score = routes[-1].get('gate_score')
+    trace = pipeline_metrics.trace(f"Batch of {len(messages)} ending {message.id}")
+    outcome = "error"
+    
+    print(f"\n🔍 Processing {len(messages)} message(s), latest: '{content}' from {author_name}")
+    
+    if not forced and not grid_client.is_available():
+        print(f"⚡ Grid circuit breaker open, skipping decision: '{content[:50]}...'")
+        trace.finish("grid_down")
+        return False
+    
+    if len(messages) == 1:
+        latest_messages = f'Latest message from {author_name}: "{message.clean_content.strip()}"'
+    else:
+        latest_messages = "Latest messages (newest last):\n" + "\n".join(
+            f'{m.author.display_name}: "{m.clean_content.strip()}"' for m in messages
+        )
+    
+    # Retrieve for the recent messages together, weighted to the latest
+    retrieval_query = " ".join(strip_bot_mention(m.content) for m in messages[-3:])
+    context = []
+    
+    try:
+        # Gather history, docs, crypto data, mood, memories and happenings in parallel
+        with trace.stage("context"):
+            gathered = await gather_prompt_context(message.channel.id, retrieval_query, content)
+        context = gathered['context']
+        
+        if not grid_client.is_available():
+            # Only forced batches get here while the breaker is open
+            print("⚡ Grid circuit breaker open, answering from FAQ/docs")
+            with trace.stage("deliver"):
+                track_screened_replies(messages, await send_fallback_answer(message, context))
+            outcome = "fallback"
+            return True
+        
+        with trace.stage("prompt"):
+            single_prompt = build_classify_prompt(message, gathered, latest_messages, forced)
+        
+        # Single API call with JSON response. Forced answers show typing while the
+        # Grid works; automatic decisions don't, since most end in silence
+        with trace.stage("generate"):
+            if forced:
+                async with message.channel.typing():
+                    result = await grid_client.get_answer(single_prompt, [])
+            else:
+                result = await grid_client.get_answer(single_prompt, [])
         
         print(f"API Response: '{result}'")
         
-        # Try to parse JSON response
-        try:
-            import json
-            # Clean up the response to extract JSON
-            result_clean = result.strip()
-            if result_clean.startswith('```json'):
-                result_clean = result_clean[7:]
-            if result_clean.endswith('```'):
-                result_clean = result_clean[:-3]
-            result_clean = result_clean.strip()
-            
-            response_data = json.loads(result_clean)
-            
-            if response_data.get("respond", False):
+        response_data = None
+        if is_error_response(result):
+            print(f"Grid answer failed: {result}")
+        else:
+            response_data = parse_response_json(result)
+            if response_data is None and forced and result.strip():
+                # Answered in plain text instead of JSON - still an answer
+                response_data = {"respond": True, "message": result.strip()}
+        
+        response_message, react_emoji = "", None
+        if response_data is not None:
+            responded = bool(response_data.get("respond", False))
+            record_decision(message, content, responded, forced, gate_score)
+            if responded:
                 response_message = response_data.get("message", "")
                 react_emoji = response_data.get("react", None)
-                
-                # Handle reactions - check if we need to react to a previous message
-                if react_emoji:
-                    target_message = message  # Default to current message
-                    
-                    # Check if user wants to react to a previous message
-                    content_lower = content.lower()
-                    needs_previous = any(phrase in content_lower for phrase in [
-                        'few messages ago', 'previous message', 'earlier message', 
-                        'that message', 'my message', 'a few messages ago'
-                    ])
-                    
-                    if needs_previous:
-                        # Fetch recent messages to find the target
-                        try:
-                            messages_found = []
-                            async for msg in message.channel.history(limit=20):
-                                # Skip the current message and bot messages
-                                if msg.id == message.id or msg.author == client.user:
-                                    continue
-                                messages_found.append(msg)
-                            
-                            # If they said "my message", find their message
-                            if 'my message' in content_lower:
-                                user_messages = [msg for msg in messages_found if msg.author.id == message.author.id]
-                                
-                                # If they also said "few messages ago", skip forward a bit
-                                if 'few' in content_lower or 'several' in content_lower:
-                                    # Find their message that's a few back (skip first 1-2 of their messages)
-                                    skip_own = 1 if len(user_messages) > 1 else 0
-                                    if len(user_messages) > skip_own:
-                                        target_message = user_messages[skip_own]
-                                        print(f"Found user's message {skip_own+1} back: {target_message.id} - '{target_message.content[:50]}...'")
-                                    elif len(user_messages) > 0:
-                                        target_message = user_messages[0]
-                                        print(f"Found user's most recent message: {target_message.id} - '{target_message.content[:50]}...'")
-                                else:
-                                    # Just "my message" - find their most recent
-                                    if len(user_messages) > 0:
-                                        target_message = user_messages[0]
-                                        print(f"Found user's most recent message: {target_message.id} - '{target_message.content[:50]}...'")
-                            # Otherwise, find a message a few back (skip 1-3 messages)
-                            else:
-                                # Try to find message 2-4 messages back
-                                skip_count = 2  # Default: 2 messages back
-                                if 'few' in content_lower or 'several' in content_lower:
-                                    skip_count = 3
-                                
-                                if len(messages_found) > skip_count:
-                                    target_message = messages_found[skip_count]
-                                    print(f"Found message {skip_count} back: {target_message.id} - '{target_message.content[:50]}...'")
-                                elif len(messages_found) > 0:
-                                    # Fallback to first non-bot message found
-                                    target_message = messages_found[0]
-                                    print(f"Found first previous message: {target_message.id} - '{target_message.content[:50]}...'")
-                                    
-                        except Exception as e:
-                            print(f"Error fetching message history: {e}")
-                    
-                    try:
-                        await target_message.add_reaction(react_emoji)
-                        print(f"Reacted with {react_emoji} to message {target_message.id} from {target_message.author.display_name}")
-                    except Exception as e:
-                        print(f"Error adding reaction: {e}")
-                
-                if response_message:
-                    # Add bot response to channel history
-                    add_message(message.channel.id, BOT_NAME, response_message, author_id=client.user.id, is_bot=True)
-                    
-                    # Show typing indicator for 1-2 seconds before responding
-                    async with message.channel.typing():
-                        import asyncio
-                        await asyncio.sleep(1.5)  # 1.5 second delay
-                    
-                    # Send the response naturally
-                    await message.channel.send(response_message)
-                    print(f"Responding with: '{response_message}'")
-                    return True
-                elif react_emoji:
-                    # Only reacted, no message
-                    return True
-                else:
-                    print("Response data has respond=true but no message or reaction")
-                    return False
-            else:
-                print(f"Not responding to message: '{content}'")
-                return False
-                
-        except json.JSONDecodeError as e:
-            print(f"Failed to parse JSON response: {e}")
-            print(f"Raw response: '{result}'")
+        
+        if not response_message and not react_emoji:
+            if forced:
+                with trace.stage("deliver"):
+                    track_screened_replies(messages, await send_fallback_answer(message, context))
+                outcome = "fallback"
+                return True
+            print(f"Not responding to message: '{content}'")
+            outcome = "quiet"
             return False
         
+        with trace.stage("deliver"):
+            delivered = await deliver_response(message, content, response_message, react_emoji, typing_delay=not forced)
+        track_screened_replies(messages, delivered)
+        outcome = "responded"
+        return True
+    
+    except asyncio.CancelledError:
+        outcome = "superseded"
+        raise
     except Exception as e:
-        print(f"Error in classify_and_respond: {str(e)}")
+        print(f"Error in respond_to_batch: {str(e)}")
+        if forced:
+            try:
+                track_screened_replies(messages, await send_fallback_answer(message, context))
+                outcome = "fallback"
+                return True
+            except Exception as send_error:
+                print(f"Error sending fallback answer: {send_error}")
         return False
+    finally:
+        trace.finish(outcome)
+
+@client.event
+async def on_message_delete(message):
+    """Drop a deleted message from its channel's pending decision (cancelling the Grid call if needed)."""
+    if response_coalescer.discard(message.channel.id, message.id):
+        print(f"🗑️  Message {message.id} deleted, dropped from pending response decision")
+
+# Debounces automatic responses per channel (see burst_coalescer.py)
+response_coalescer = ChannelCoalescer(respond_to_batch)
 
 @client.event
 async def on_reaction_add(reaction, user):
@@ -755,8 +1235,8 @@ async def on_reaction_add(reaction, user):
     
     vote_info = pending_ban_votes[reaction.message.id]
     
-    # Ignore reactions from the target user
-    if user.id == vote_info['target_user_id']:
+    # Ignore reactions from the target users
+    if user.id in vote_info['targets']:
         return
     
     # Handle upvote (✅)
@@ -775,75 +1255,178 @@ async def on_reaction_add(reaction, user):
         
         # If downvotes reach threshold, dismiss
         if len(vote_info['downvotes']) >= DISMISS_VOTE_THRESHOLD:
-            await reaction.message.edit(content=f"❌ Vote dismissed. {vote_info['target_user_name']} will not be banned.")
+            names = ", ".join(vote_info['targets'].values())
+            await reaction.message.edit(content=f"❌ Vote dismissed. {names} will not be banned.")
             del pending_ban_votes[reaction.message.id]
+            dismissed_ban_votes.add(reaction.message.id)
 
 async def execute_ban(vote_message, vote_info):
-    """Execute the ban after threshold is met."""
+    """Execute the ban after threshold is met, for every account in the vote."""
+    reason = vote_info['reason']
+    # Drop the vote first so late reactions don't trigger a second round of bans
+    pending_ban_votes.pop(vote_message.id, None)
+    
+    # The community confirmed it, so future messages like it are flagged without the Grid
     try:
-        channel = vote_message.channel
-        target_user_id = vote_info['target_user_id']
-        target_user_name = vote_info['target_user_name']
-        reason = vote_info['reason']
-        
-        # Get the member object
-        member = channel.guild.get_member(target_user_id)
-        if not member:
-            await vote_message.edit(content=f"❌ User {target_user_name} not found in server.")
-            del pending_ban_votes[vote_message.id]
-            return
-        
-        # Ban the user
-        await member.ban(reason=f"Community vote: {reason}")
-        
-        # Update vote message
-        await vote_message.edit(content=f"✅ **{target_user_name} has been banned.**\nReason: {reason}\nVotes: {len(vote_info['upvotes'])} ✅")
-        
-        # Clean up
-        del pending_ban_votes[vote_message.id]
-        
-        print(f"✅ Banned {target_user_name} ({target_user_id}) - Reason: {reason}")
-        
-    except discord.Forbidden:
-        await vote_message.edit(content=f"❌ Missing permissions to ban {target_user_name}.")
-        del pending_ban_votes[vote_message.id]
+        await asyncio.to_thread(scam_index.add, vote_info['content'], reason)
+    except Exception as e:
+        print(f"Error adding scam example: {e}")
+    
+    banned, not_found, forbidden, failed = [], [], [], []
+    for target_user_id, target_user_name in vote_info['targets'].items():
+        try:
+            # Get the member object
+            member = vote_message.channel.guild.get_member(target_user_id)
+            if not member:
+                not_found.append(target_user_name)
+                continue
+            
+            # Ban the user
+            await member.ban(reason=f"Community vote: {reason}")
+            banned.append(target_user_name)
+            print(f"✅ Banned {target_user_name} ({target_user_id}) - Reason: {reason}")
+        except discord.Forbidden:
+            forbidden.append(target_user_name)
+        except Exception as e:
+            failed.append(target_user_name)
+            print(f"Error executing ban: {e}")
+    
+    lines = []
+    if banned:
+        lines.append(f"✅ **{', '.join(banned)} {'has' if len(banned) == 1 else 'have'} been banned.**\nReason: {reason}\nVotes: {len(vote_info['upvotes'])} ✅")
+    if not_found:
+        lines.append(f"❌ User {', '.join(not_found)} not found in server.")
+    if forbidden:
+        lines.append(f"❌ Missing permissions to ban {', '.join(forbidden)}.")
+    if failed:
+        lines.append(f"❌ Error banning {', '.join(failed)}.")
+    
+    try:
+        await vote_message.edit(content="\n".join(lines)[:2000])
     except Exception as e:
-        await vote_message.edit(content=f"❌ Error banning user: {str(e)}")
-        del pending_ban_votes[vote_message.id]
-        print(f"Error executing ban: {e}")
+        print(f"Error updating ban vote: {e}")
 
 @client.event
 async def on_message(message):
-    """Event called when a message is received."""
+    """Event called when a message is received.
+    
+    Every message goes through the same stages, each timed in pipeline_metrics:
+    scam screening (started in the background, not awaited), commands, intake
+    (history), routing, the relevance gate, then at most one retrieval + Grid
+    generation in respond_to_batch."""
     # Ignore messages from the bot itself
     if message.author == client.user:
         return
     
-    # Check for scam messages first
-    if await handle_scam_detection(message):
-        return  # Don't process further if scam detected
+    trace = pipeline_metrics.trace(f"Message {message.id} from {message.author.display_name}")
+    outcome = "error"
+    try:
+        outcome = await run_message_pipeline(message, trace)
+    finally:
+        trace.finish(outcome)
+
+async def run_message_pipeline(message, trace) -> str:
+    """Run one message through the pipeline stages. Returns the outcome for the trace."""
+    # Screen links in the background; only copies of a known scam stop here
+    with trace.stage("screen"):
+        screening = start_scam_screening(message)
+    if screening == "scam":
+        return "scam"
+    
+    with trace.stage("commands"):
+        handled = await handle_admin_message(message)
+    if handled:
+        return "command"
     
+    content = message.content.strip()
+    if not should_respond_to_message(content, message.author.id):
+        return "ignored"
+    
+    # Add the message to channel history (always save, but don't always process)
+    with trace.stage("intake"):
+        conversation_store.write_nowait(add_message, message.channel.id, message.author.display_name, content, author_id=message.author.id, is_bot=False)
+        channel_summarizer.note_message(message.channel.id, channel_display_name(message.channel))
+    
+    # Quick implicit filter (like human skimming); mentions/replies are forced through
+    with trace.stage("route"):
+        route = await route_message(message)
+    if route == 'skip':
+        print(f"⏭️  Skipped (no obvious trigger): '{content[:50]}...'")
+        return "skipped"
+    
+    forced = route == 'forced'
+    if forced and not strip_bot_mention(content):
+        # A bare mention gets the help message
+        await handle_help_command(message)
+        return "help"
+    
+    gate_score = None
+    if not forced:
+        # Fail fast while the Grid is down - forced messages still get a FAQ/docs answer
+        if not grid_client.is_available():
+            print(f"⚡ Grid circuit breaker open, skipping classification: '{content[:50]}...'")
+            return "grid_down"
+        
+        # Everything that isn't addressed to the bot goes past the local gate first
+        with trace.stage("gate"):
+            call_llm, gate_score = await asyncio.to_thread(relevance_gate.check, content)
+        if not call_llm:
+            print(f"🧠 Relevance gate skipped (score {gate_score:.2f}): '{content[:50]}...'")
+            conversation_store.write_nowait(log_classification, message.channel.id, message.id, content, False, source="gate", gate_score=gate_score)
+            return "gated"
+    
+    if message.id in flagged_messages:
+        # Screening finished while the message was being routed
+        return "scam"
+    
+    # Queue for the channel's next decision. Mentions/replies go right away;
+    # other messages wait a few seconds so a burst of chat gets one decision
+    pending_routes[message.id] = {'forced': forced, 'gate_score': gate_score}
+    try:
+        with trace.stage("respond"):
+            responded = await response_coalescer.submit(message.channel.id, message, immediate=forced)
+    finally:
+        pending_routes.pop(message.id, None)
+    return "responded" if responded else "quiet"
+
+async def handle_admin_message(message) -> bool:
+    """Document management commands and admin file uploads. Returns True if handled."""
     # Handle document management commands in allowed channels
     if message.channel.id in ALLOWED_CHANNEL_IDS:
         # Handle help command
         if message.content.startswith(COMMANDS['help']):
             await handle_help_command(message)
-            return
+            return True
         
         # Handle upload command
         if message.content.startswith(COMMANDS['upload']):
             await handle_upload_command(message)
-            return
+            return True
         
         # Handle list command
         if message.content.startswith(COMMANDS['list']):
             await handle_list_command(message)
-            return
+            return True
         
         # Handle delete command
         if message.content.startswith(COMMANDS['delete']):
             await handle_delete_command(message)
-            return
+            return True
+        
+        # Handle stats command
+        if message.content.startswith(COMMANDS['stats']):
+            await handle_stats_command(message)
+            return True
+        
+        # Handle link verdict overrides
+        if message.content.startswith((COMMANDS['trustlink'], COMMANDS['blocklink'], COMMANDS['forgetlink'])):
+            await handle_link_override_command(message)
+            return True
+        
+        # Handle memory pins
+        if message.content.startswith((COMMANDS['pinmemory'], COMMANDS['unpinmemory'])):
+            await handle_memory_pin_command(message)
+            return True
     
     # Handle direct file uploads (if user is admin and in allowed channel)
     if (message.author.id == ADMIN_USER_ID and 
@@ -854,72 +1437,28 @@ async def on_message(message):
         # If this appears to be just a file upload with no command
         if not message.content or message.content.isspace():
             await handle_upload_command(message)
-            return
-    
-    # Listen for messages in ALL channels (automatic classification)
-    # Return early if we already responded to avoid duplicate handling
-    if await classify_and_respond(message):
-        return
+            return True
     
-    # Handle replied messages regardless of channel
-    if message.reference and message.reference.message_id:
+    return False
+
+async def main():
+    """Run the bot and cancel any outstanding screening and Grid generations on shutdown."""
+    async with client:
         try:
-            # Get the message being replied to
-            referenced_message = await message.channel.fetch_message(message.reference.message_id)
-            
-            # Check if the referenced message is from our bot
-            if referenced_message.author == client.user:
-                # Extract the question from the reply
-                question = message.content.strip()
-                
-                # If no question was provided, ignore
-                if not question:
-                    return
-                
-                # Send a typing indicator to show the bot is processing
-                async with message.channel.typing():
-                    try:
-                        # Retrieve relevant documents
-                        context = retriever.get_relevant_context(question)
-                        
-                        # Send to Grid API for answer
-                        answer = await grid_client.get_answer(question, context)
-                        
-                        # Send natural text response (no embeds)
-                        await message.channel.send(answer)
-                    except Exception as e:
-                        await message.channel.send(f"Error: {str(e)}")
-                
-                # We've handled the reply, so return
-                return
-        except Exception as e:
-            print(f"Error handling reply: {str(e)}")
-    
-    # Check if the bot is mentioned in the message (works in all channels)
-    if client.user.mentioned_in(message):
-        # Extract the question by removing the mention
-        content = message.content
-        mention = f'<@{client.user.id}>'
-        question = content.replace(mention, '').strip()
-        
-        # If no question was provided, show help message
-        if not question:
-            await handle_help_command(message)
-            return
-        
-        # Send a typing indicator to show the bot is processing
-        async with message.channel.typing():
-            try:
-                # Retrieve relevant documents
-                context = retriever.get_relevant_context(question)
-                
-                # Send to Grid API for answer
-                answer = await grid_client.get_answer(question, context)
-                
-                # Send natural text response (no embeds)
-                await message.channel.send(answer)
-            except Exception as e:
-                await message.channel.send(f"Error: {str(e)}")
+            await client.start(DISCORD_TOKEN)
+        finally:
+            response_coalescer.cancel_all()
+            screening = scam_screening.cancel_all()
+            print(f"Shutdown: cancelled {screening} scam screening task(s)")
+            channel_summarizer.cancel_all()
+            crypto_lookups.shutdown(wait=False, cancel_futures=True)
+            cancelled = grid_client.cancel_all_generations()
+            print(f"Shutdown: cancelled {cancelled} pending generation(s). Grid stats: {grid_client.get_stats()}")
+            db_maintenance.stop()
+            conversation_store.close()
 
 if __name__ == "__main__":
-    client.run(DISCORD_TOKEN) 
\ No newline at end of file
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
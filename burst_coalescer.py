@@ -0,0 +1,191 @@
+"""
+Per-channel debounce for automatic responses.
+
+Triggered messages in a channel are collected for a short window and then
+handled as one batch (one retrieval, one Grid decision). If newer messages
+arrive while a batch is still being decided, that work is cancelled and its
+messages are folded into the next batch, so replies address the latest
+state of the conversation instead of stale messages. Once the handler starts
+sending (begin_delivery), the batch is no longer cancelled: newer messages
+wait for the next batch, so a reply is never cut off half-delivered. A
+channel's state is dropped as soon as it has nothing pending or running.
+"""
+import asyncio
+import os
+import time
+from typing import Awaitable, Callable, Dict, List
+
+AUTO_RESPONSE_WINDOW_SECONDS = float(os.getenv('AUTO_RESPONSE_WINDOW_SECONDS', '4'))
+AUTO_RESPONSE_MAX_WAIT_SECONDS = float(os.getenv('AUTO_RESPONSE_MAX_WAIT_SECONDS', '12'))
+AUTO_RESPONSE_MAX_BATCH = int(os.getenv('AUTO_RESPONSE_MAX_BATCH', '6'))
+# After this many supersessions in a row, let the running batch finish so busy channels still get answers
+AUTO_RESPONSE_MAX_SUPERSEDE = int(os.getenv('AUTO_RESPONSE_MAX_SUPERSEDE', '2'))
+
+class _ChannelState:
+    def __init__(self):
+        self.pending = []  # [(message, future)] waiting for the next batch
+        self.first_pending_at = 0.0
+        self.timer = None  # Task that fires the next batch
+        self.running = None  # Task handling the current batch
+        self.running_batch = []
+        self.superseded = False
+        self.supersede_streak = 0
+        self.delivering = False  # The running batch is sending its reply and can't be cancelled
+
+class ChannelCoalescer:
+    """Batches messages per channel and runs `handler(messages) -> bool` once per batch.
+
+    submit() resolves with the handler's result for the batch the message
+    ended up in (False if it was dropped, discarded or cancelled)."""
+
+    def __init__(self, handler: Callable[[List], Awaitable[bool]],
+                 window: float = AUTO_RESPONSE_WINDOW_SECONDS,
+                 max_wait: float = AUTO_RESPONSE_MAX_WAIT_SECONDS,
+                 max_batch: int = AUTO_RESPONSE_MAX_BATCH,
+                 max_supersede: int = AUTO_RESPONSE_MAX_SUPERSEDE):
+        self.handler = handler
+        self.window = window
+        self.max_wait = max_wait
+        self.max_batch = max_batch
+        self.max_supersede = max_supersede
+        self.channels: Dict[int, _ChannelState] = {}  # Only channels with something pending or running
+        self.running: Dict[asyncio.Task, _ChannelState] = {}  # Batch task -> its channel, for begin_delivery
+        self.stats = {'messages': 0, 'batches': 0, 'superseded': 0, 'dropped': 0}
+
+    async def submit(self, channel_id: int, message, immediate: bool = False) -> bool:
+        """Queue a message. immediate=True (mentions/replies) skips the debounce window."""
+        state = self.channels.setdefault(channel_id, _ChannelState())
+        future = asyncio.get_running_loop().create_future()
+        if not state.pending:
+            state.first_pending_at = time.monotonic()
+        state.pending.append((message, future))
+        self.stats['messages'] += 1
+
+        # Newer messages make the batch being decided stale
+        if (state.running and not state.running.done() and not state.delivering
+                and state.supersede_streak < self.max_supersede):
+            print(f"🔁 New message in channel {channel_id} supersedes pending decision on {len(state.running_batch)} message(s)")
+            state.superseded = True
+            state.supersede_streak += 1
+            self.stats['superseded'] += 1
+            state.running.cancel()
+
+        self._schedule(channel_id, state, immediate)
+        return await future
+
+    def _schedule(self, channel_id: int, state: _ChannelState, immediate: bool):
+        if state.timer and not state.timer.done():
+            state.timer.cancel()
+        waited = time.monotonic() - state.first_pending_at
+        delay = 0.0 if immediate else max(0.0, min(self.window, self.max_wait - waited))
+        state.timer = asyncio.create_task(self._fire_after(channel_id, state, delay))
+
+    async def _fire_after(self, channel_id: int, state: _ChannelState, delay: float):
+        await asyncio.sleep(delay)
+
+        # Let a batch we just superseded hand its messages back first
+        if state.running and not state.running.done():
+            await asyncio.wait({state.running})
+
+        if not state.pending:
+            state.timer = None
+            self._forget_if_idle(channel_id, state)
+            return
+        batch = state.pending[-self.max_batch:]
+        for _, future in state.pending[:-self.max_batch]:
+            self.stats['dropped'] += 1
+            if not future.done():
+                future.set_result(False)
+        state.pending = []
+        state.timer = None
+
+        self.stats['batches'] += 1
+        state.running_batch = batch
+        state.running = asyncio.create_task(self._run(state, batch))
+        self.running[state.running] = state
+        state.running.add_done_callback(lambda task: self._batch_done(channel_id, state, task))
+
+    def _batch_done(self, channel_id: int, state: _ChannelState, task: asyncio.Task):
+        del self.running[task]
+        self._forget_if_idle(channel_id, state)
+
+    def _forget_if_idle(self, channel_id: int, state: _ChannelState):
+        """Drop the channel's state once it has no pending messages, timer or running batch."""
+        timer_live = state.timer and not state.timer.done() and state.timer is not asyncio.current_task()
+        if (not state.pending and not timer_live and not (state.running and not state.running.done())
+                and self.channels.get(channel_id) is state):
+            del self.channels[channel_id]
+
+    async def _run(self, state: _ChannelState, batch: List):
+        result = False
+        try:
+            result = await self.handler([message for message, _ in batch])
+            state.supersede_streak = 0
+        except asyncio.CancelledError:
+            if state.superseded:
+                # Fold the unanswered messages into the next batch, ahead of the newer ones
+                state.superseded = False
+                state.pending[:0] = [(m, f) for m, f in batch if not f.done()]
+                return
+            for _, future in batch:
+                if not future.done():
+                    future.cancel()
+            raise
+        except Exception as e:
+            print(f"Error handling message batch: {e}")
+        finally:
+            if state.running is asyncio.current_task():
+                state.running = None
+                state.running_batch = []
+                state.delivering = False
+
+        for _, future in batch:
+            if not future.done():
+                future.set_result(result)
+
+    def begin_delivery(self):
+        """Called by the handler before it sends anything: from here on the
+        current batch runs to completion. No-op outside a batch."""
+        state = self.running.get(asyncio.current_task())
+        if state is not None:
+            state.delivering = True
+
+    def discard(self, channel_id: int, message_id: int) -> bool:
+        """Drop a (deleted) message, cancelling its batch's decision if it's already running."""
+        state = self.channels.get(channel_id)
+        if state is None:
+            return False
+
+        for entry in list(state.pending):
+            if entry[0].id == message_id:
+                state.pending.remove(entry)
+                if not entry[1].done():
+                    entry[1].set_result(False)
+                return True
+
+        for entry in state.running_batch:
+            if entry[0].id == message_id and state.running and not state.running.done():
+                if not entry[1].done():
+                    entry[1].set_result(False)
+                if state.delivering:
+                    return True  # Already answering; the caller deals with what was sent
+                # Re-decide for whatever else was in the batch
+                state.superseded = True
+                state.running.cancel()
+                if any(not f.done() for _, f in state.running_batch):
+                    self._schedule(channel_id, state, immediate=False)
+                return True
+        return False
+
+    def cancel_all(self):
+        """Cancel every pending and running batch (shutdown)."""
+        for state in self.channels.values():
+            if state.timer and not state.timer.done():
+                state.timer.cancel()
+            if state.running and not state.running.done():
+                state.superseded = False
+                state.running.cancel()
+            for _, future in state.pending:
+                if not future.done():
+                    future.set_result(False)
+            state.pending = []
@@ -0,0 +1,191 @@
+"""
+Rolling per-channel summaries, so prompts carry a compact account of the
+conversation instead of a long run of raw messages.
+
+Every CHANNEL_SUMMARY_EVERY new messages in a channel the bot has built a
+prompt for within CHANNEL_SUMMARY_ACTIVE_SECONDS, a low-priority job folds
+the messages that left the raw tail into the channel's stored summary: the
+Grid gets the current summary plus only those new messages and returns the
+updated summary, so a summary is extended, never rebuilt from the whole
+history. Channels nobody asks the bot in are never summarized, so folds
+stay a fraction of answer traffic. The job runs on a single worker, uses a
+raw prompt outside the circuit breaker (see GridClient.generate) and waits
+until no other generation is in flight (and the breaker allows requests),
+so it never competes with answering people; if the Grid stays busy it gives
+up and a later message queues it again. Output that doesn't read like a
+summary (a refusal, JSON, a few words) is dropped rather than stored.
+
+The prompt's history is then the summary followed by the messages after it
+(the last CHANNEL_SUMMARY_KEEP_RAW to CHANNEL_SUMMARY_KEEP_RAW +
+CHANNEL_SUMMARY_EVERY), at most max_messages. A channel without a summary
+yet gets plain recent history.
+"""
+import asyncio
+import os
+import re
+import time
+from typing import Dict, List, Optional
+
+from conversation_db import get_channel_messages, get_channel_summary, save_channel_summary
+from grid_client import is_error_response
+from prompt_builder import estimate_tokens
+from task_pool import BoundedWorkerPool
+
+CHANNEL_SUMMARY_ENABLED = os.getenv('CHANNEL_SUMMARY_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+# New messages in a channel between folds, and the newest messages always left raw
+CHANNEL_SUMMARY_EVERY = int(os.getenv('CHANNEL_SUMMARY_EVERY', '10'))
+CHANNEL_SUMMARY_KEEP_RAW = int(os.getenv('CHANNEL_SUMMARY_KEEP_RAW', '2'))
+# Length cap asked of the model (and enforced on its answer)
+CHANNEL_SUMMARY_MAX_WORDS = int(os.getenv('CHANNEL_SUMMARY_MAX_WORDS', '80'))
+# How long a fold waits for the Grid to go idle before giving up until the next message
+CHANNEL_SUMMARY_MAX_WAIT = float(os.getenv('CHANNEL_SUMMARY_MAX_WAIT', '300'))
+# Only channels the bot built a prompt for this recently get folded
+CHANNEL_SUMMARY_ACTIVE_SECONDS = float(os.getenv('CHANNEL_SUMMARY_ACTIVE_SECONDS', '3600'))
+# Most messages folded at once; older unsummarized ones are skipped, as raw history would drop them
+FOLD_MAX_MESSAGES = 40
+IDLE_POLL_SECONDS = 2.0
+# Fewer words than this isn't a summary of anything
+MIN_SUMMARY_WORDS = 8
+# Openings of model output that refuses or answers instead of summarizing
+NOT_A_SUMMARY = re.compile(r"(?:not sure|can'?t find|sorry|i'?m sorry|as an ai|i (?:don'?t|do not|can'?t|cannot)|"
+                           r"there (?:are|is) no|no (?:new )?messages|nothing to summari[sz]e)\b", re.IGNORECASE)
+
+SUMMARY_PROMPT = """Keep a running summary of the Discord channel #{channel_name}.
+
+Summary so far:
+{summary}
+
+New messages since then:
+{messages}
+
+Write the updated summary: fold the new messages into the summary so far. Keep who asked or said what, open questions, answers given, decisions and anything {bot_name} promised; drop greetings, small talk and whatever no longer matters. At most {max_words} words, one paragraph of plain text, no preamble."""
+
+def format_messages(messages: List[Dict]) -> str:
+    return "\n".join(f"{msg['author']}: {msg['content']}" for msg in messages)
+
+def is_summary(text: str) -> bool:
+    """False for Grid output that shouldn't replace a channel's summary."""
+    return (not is_error_response(text) and not text.startswith(('{', '[', '```'))
+            and len(text.split()) >= MIN_SUMMARY_WORDS and not NOT_A_SUMMARY.match(text))
+
+class ChannelSummarizer:
+    """Folds each channel's older messages into a stored summary on the Grid, one channel at a time."""
+
+    def __init__(self, grid_client, bot_name: str, every: int = CHANNEL_SUMMARY_EVERY,
+                 keep_raw: int = CHANNEL_SUMMARY_KEEP_RAW, max_words: int = CHANNEL_SUMMARY_MAX_WORDS,
+                 enabled: bool = CHANNEL_SUMMARY_ENABLED):
+        self.grid_client = grid_client
+        self.bot_name = bot_name
+        self.every = max(1, every)
+        self.keep_raw = max(1, keep_raw)
+        self.max_words = max_words
+        self.enabled = enabled
+        self.pool = BoundedWorkerPool("Channel summaries", 1, 50)
+        self.unsummarized: Dict[int, int] = {}  # Messages since the last fold (the raw tail counts too)
+        self.queued = set()
+        self.summaries: Dict[int, Optional[Dict]] = {}  # channel_summaries rows, loaded on first use
+        self.prompted: Dict[int, float] = {}  # Channel -> when format_history last ran for it
+        self.stats = {'folds': 0, 'messages': 0, 'deferred': 0, 'failed': 0, 'rejected': 0,
+                      'prompts': 0, 'with_summary': 0, 'history_tokens': 0}
+
+    def _summary(self, channel_id: int) -> Optional[Dict]:
+        """The channel's stored summary row (cached; this process is its only writer). Blocking."""
+        if channel_id not in self.summaries:
+            self.summaries[channel_id] = get_channel_summary(channel_id)
+        return self.summaries[channel_id]
+
+    def note_message(self, channel_id: int, channel_name: str):
+        """Count a stored message and queue a fold once enough have arrived in a
+        channel the bot is answering in."""
+        if not self.enabled:
+            return
+        count = self.unsummarized.get(channel_id, 0) + 1
+        self.unsummarized[channel_id] = count
+        if count < self.keep_raw + self.every or channel_id in self.queued:
+            return
+        if time.monotonic() - self.prompted.get(channel_id, float('-inf')) > CHANNEL_SUMMARY_ACTIVE_SECONDS:
+            return
+        if self.pool.submit(lambda: self.fold(channel_id, channel_name), label=f"#{channel_name}"):
+            self.queued.add(channel_id)
+
+    async def _wait_for_idle_grid(self) -> bool:
+        """True once the Grid has no generation in flight, False if that takes too long."""
+        deadline = time.monotonic() + CHANNEL_SUMMARY_MAX_WAIT
+        while not (self.grid_client.is_available() and not self.grid_client.active_generations):
+            if time.monotonic() >= deadline:
+                return False
+            await asyncio.sleep(IDLE_POLL_SECONDS)
+        return True
+
+    def _retry_later(self, channel_id: int):
+        """Try again after another `every` messages rather than on every message (the fold reads
+        the messages themselves, so none are lost)."""
+        self.unsummarized[channel_id] = self.keep_raw
+
+    async def fold(self, channel_id: int, channel_name: str):
+        """Fold the channel's messages older than the raw tail into its summary."""
+        try:
+            if not await self._wait_for_idle_grid():
+                self.stats['deferred'] += 1
+                self._retry_later(channel_id)
+                return
+            current = await asyncio.to_thread(self._summary, channel_id)
+            recent = await asyncio.to_thread(get_channel_messages, channel_id, FOLD_MAX_MESSAGES + self.keep_raw)
+            through_ts = current['through_ts'] if current else 0
+            new = [msg for msg in recent if msg['ts'] > through_ts][:-self.keep_raw]
+            if not new:
+                self.unsummarized[channel_id] = self.keep_raw
+                return
+
+            prompt = SUMMARY_PROMPT.format(channel_name=channel_name,
+                                           summary=current['summary'] if current else "(none yet)",
+                                           messages=format_messages(new), bot_name=self.bot_name,
+                                           max_words=self.max_words)
+            result = (await self.grid_client.generate(prompt)).strip()
+            if not is_summary(result):
+                self.stats['failed' if not result or is_error_response(result) else 'rejected'] += 1
+                print(f"Channel summary for #{channel_name} not updated: {result[:100]}")
+                self._retry_later(channel_id)
+                return
+            # One line, so the prompt builder trims it as a unit; models run long, the cap doesn't
+            summary = " ".join(result.split()[:self.max_words * 3 // 2])
+
+            await asyncio.to_thread(save_channel_summary, channel_id, summary, new[-1]['ts'], len(new))
+            self.summaries[channel_id] = {'summary': summary, 'through_ts': new[-1]['ts'],
+                                          'folded': (current['folded'] if current else 0) + len(new)}
+            # Messages that arrived while the Grid was working stay counted
+            self.unsummarized[channel_id] = max(self.keep_raw, self.unsummarized.get(channel_id, 0) - len(new))
+            self.stats['folds'] += 1
+            self.stats['messages'] += len(new)
+            print(f"📝 Folded {len(new)} messages into #{channel_name}'s summary ({estimate_tokens(summary)} tokens)")
+        finally:
+            self.queued.discard(channel_id)
+
+    def format_history(self, channel_id: int, max_messages: int = 10) -> str:
+        """Prompt history: the channel's summary and the messages after it, or
+        plain recent history while it has none. Blocking."""
+        self.prompted[channel_id] = time.monotonic()
+        messages = get_channel_messages(channel_id, limit=max_messages)
+        current = self._summary(channel_id) if self.enabled else None
+        formatted = ""
+        if current:
+            messages = [msg for msg in messages if msg['ts'] > current['through_ts']]
+            formatted = f"Summary of the earlier conversation in this channel:\n{current['summary']}\n"
+        if messages:
+            formatted += "Recent chat (last messages):\n" + format_messages(messages) + "\n"
+        self.stats['prompts'] += 1
+        self.stats['with_summary'] += 1 if current else 0
+        self.stats['history_tokens'] += estimate_tokens(formatted)
+        return formatted
+
+    def cancel_all(self) -> int:
+        return self.pool.cancel_all()
+
+    def report(self) -> str:
+        if not self.enabled:
+            return "Channel summaries: disabled"
+        s = self.stats
+        average = s['history_tokens'] / s['prompts'] if s['prompts'] else 0
+        return (f"Channel summaries: {s['folds']} folds of {s['messages']} messages, {s['deferred']} deferred "
+                f"(Grid busy), {s['failed']} failed, {s['rejected']} rejected, {len(self.queued)} queued; {s['with_summary']}/{s['prompts']} "
+                f"prompts summarized, avg history {average:.0f} tokens")
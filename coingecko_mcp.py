@@ -16,6 +16,9 @@ import requests
 # CoinGecko MCP server URL
 COINGECKO_MCP_URL = "https://mcp.pro-api.coingecko.com/mcp"
 COINGECKO_API_KEY = os.getenv("COINGECKO_API_KEY")
+# Per-request limit for the price and search calls made while building a prompt;
+# keep it below the bot's CRYPTO_CONTEXT_TIMEOUT
+COINGECKO_HTTP_TIMEOUT = float(os.getenv("COINGECKO_HTTP_TIMEOUT", "3"))
 
 async def get_coingecko_session() -> Optional[ClientSession]:
     """Get a CoinGecko MCP session for testing purposes."""
@@ -103,7 +106,7 @@ async def _get_price_via_api(coin_id: str) -> Optional[str]:
             "include_24hr_change": "true"
         }
         
-        response = requests.get(url, headers=headers, params=params, timeout=5)
+        response = requests.get(url, headers=headers, params=params, timeout=COINGECKO_HTTP_TIMEOUT)
         response.raise_for_status()
         data = response.json()
         
@@ -183,7 +186,7 @@ async def search_crypto(query: str) -> Optional[List[Dict[str, Any]]]:
             }
             params = {"query": query}
             
-            response = requests.get(url, headers=headers, params=params, timeout=5)
+            response = requests.get(url, headers=headers, params=params, timeout=COINGECKO_HTTP_TIMEOUT)
             response.raise_for_status()
             data = response.json()
             
@@ -2,117 +2,784 @@
 Database module for storing Discord conversation history per channel.
 Uses SQLite for lightweight, persistent storage.
 """
+import atexit
+import gzip
+import json
+import math
 import sqlite3
 import datetime
 import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict, deque
+from contextlib import contextmanager
 from typing import List, Dict, Optional
 
 DB_PATH = "conversations.db"
+# Prepared statements cached per connection
+DB_STATEMENT_CACHE_SIZE = 256
+# How long (ms) a connection waits for another process's write lock before failing
+DB_BUSY_TIMEOUT_MS = 5000
+
+_local = threading.local()
+_connections = []  # Every open connection, so they can be closed on shutdown
+_connections_lock = threading.Lock()
+_write_lock = threading.RLock()
+_generation = 0  # Bumped by close_db_connections so every thread reconnects
+
+# Group commit for chat messages: flush after this many, or this long after the oldest was buffered
+MESSAGE_FLUSH_EVERY = int(os.getenv('MESSAGE_FLUSH_EVERY', '50'))
+MESSAGE_FLUSH_MS = float(os.getenv('MESSAGE_FLUSH_MS', '1000'))
+
+# In-memory recent history: messages kept per channel, channels kept, and a cap on the total size
+HISTORY_CACHE_MESSAGES = int(os.getenv('HISTORY_CACHE_MESSAGES', '50'))
+HISTORY_CACHE_MAX_CHANNELS = int(os.getenv('HISTORY_CACHE_MAX_CHANNELS', '200'))
+HISTORY_CACHE_MAX_BYTES = int(os.getenv('HISTORY_CACHE_MAX_BYTES', str(8 * 1024 * 1024)))
+
+# How often (ms) the state cache asks SQLite whether another connection committed
+STATE_CACHE_CHECK_MS = float(os.getenv('STATE_CACHE_CHECK_MS', '1000'))
+# Tables whose changes bump state_version
+STATE_TABLES = ('mood', 'memory', 'recent_happenings')
+
+# Schema version stored in PRAGMA user_version
+# (1: messages.ts + covering index, 2: memory.pinned and memory.embedding)
+SCHEMA_VERSION = 2
+# Rows converted per transaction by the messages.ts backfill, and the pause between batches
+TS_BACKFILL_BATCH = 5000
+TS_BACKFILL_PAUSE = 0.05
+_ts_ready = False  # True once every message row has ts
+# messages.ts from an ISO timestamp column. The ISO timestamps are local time ('utc'
+# converts them to epoch time); unparseable ones get 0 so they sort oldest
+TS_FROM_ISO_SQL = "COALESCE(CAST(round((julianday({column}, 'utc') - 2440587.5) * 86400000) AS INTEGER), 0)"
+
+# Rows added per transaction by the messages_fts backfill
+FTS_BACKFILL_BATCH = 5000
+# Older messages matching the question added to the prompt (0 disables history search)
+HISTORY_SEARCH_RESULTS = int(os.getenv('HISTORY_SEARCH_RESULTS', '5'))
+# Newest matches ranked per search; bounds the work however common the words are
+HISTORY_SEARCH_CANDIDATES = int(os.getenv('HISTORY_SEARCH_CANDIDATES', '200'))
+# Newest messages a word's document frequency is counted over, for ranking
+IDF_WINDOW = 20000
+_fts_available = False  # messages_fts exists (SQLite built with FTS5)
+_auto_vacuum_warned = False  # compact_db found a file without incremental auto-vacuum
+
+# Rows deleted per transaction by retention, and the pause between batches
+RETENTION_BATCH = 2000
+RETENTION_PAUSE = 0.05
 
 def get_db_connection():
-    """Get a database connection."""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row  # Return rows as dict-like objects
+    """Get this thread's database connection, opening it on first use.
+    
+    Connections are long-lived (the bot reaches the database from the event
+    loop and from asyncio.to_thread workers), so a message doesn't cost
+    several connects. WAL mode lets readers such as view_bot_state.py read
+    during the bot's writes, and synchronous=NORMAL fsyncs at checkpoints
+    instead of on every commit."""
+    if getattr(_local, 'generation', None) != _generation:
+        _local.connections = {}
+        _local.generation = _generation
+    connections = _local.connections
+    conn = connections.get(DB_PATH)
+    if conn is None:
+        conn = sqlite3.connect(DB_PATH, timeout=DB_BUSY_TIMEOUT_MS / 1000,
+                               cached_statements=DB_STATEMENT_CACHE_SIZE, check_same_thread=False)
+        conn.row_factory = sqlite3.Row  # Return rows as dict-like objects
+        # Lets maintenance hand freed pages back in steps. Only takes effect on a new
+        # file, and only if set before WAL; older files are converted by compact_db on request
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}")
+        connections[DB_PATH] = conn
+        with _connections_lock:
+            _connections.append(conn)
     return conn
 
-def init_db():
-    """Initialize the database with the messages, memory, and mood tables."""
+@contextmanager
+def write_cursor():
+    """Cursor for one write transaction: committed on success, rolled back on error.
+    Writers from different threads take turns instead of failing on SQLite's lock."""
     conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # Messages table
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS messages (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            channel_id INTEGER NOT NULL,
-            author_name TEXT NOT NULL,
-            author_id INTEGER,
-            content TEXT NOT NULL,
-            is_bot INTEGER DEFAULT 0,
-            timestamp TEXT NOT NULL,
-            created_at TEXT DEFAULT CURRENT_TIMESTAMP
-        )
+    with _write_lock:
+        try:
+            yield conn.cursor()
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+
+def close_db_connections():
+    """Close every thread's connection (shutdown). Later calls reconnect."""
+    global _generation
+    with _connections_lock:
+        connections = list(_connections)
+        _connections.clear()
+        _generation += 1
+    for conn in connections:
+        try:
+            conn.close()
+        except sqlite3.Error as e:
+            print(f"Error closing database connection: {e}")
+
+def init_db(backfill_in_background: bool = True):
+    """Initialize the database with the messages, memory, and mood tables."""
+    with write_cursor() as cursor:
+        # Messages table
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                channel_id INTEGER NOT NULL,
+                author_name TEXT NOT NULL,
+                author_id INTEGER,
+                content TEXT NOT NULL,
+                is_bot INTEGER DEFAULT 0,
+                timestamp TEXT NOT NULL,
+                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                ts INTEGER
+            )
+        """)
+        
+        # Memory bank table for sticky memories (especially from admin)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS memory (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                key TEXT UNIQUE NOT NULL,
+                value TEXT NOT NULL,
+                source TEXT,
+                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                updated_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                pinned INTEGER NOT NULL DEFAULT 0,
+                embedding BLOB
+            )
+        """)
+        
+        # Mood table - tracks bot's current mood state
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS mood (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                mood TEXT NOT NULL,
+                description TEXT,
+                intensity REAL DEFAULT 0.5,
+                updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        
+        # Recent happenings table - bot's current awareness of recent activity
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS recent_happenings (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                content TEXT NOT NULL,
+                updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        
+        # Classification log - every respond/stay-quiet decision, used to train the local relevance gate
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS classification_log (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                channel_id INTEGER NOT NULL,
+                message_id INTEGER,
+                content TEXT NOT NULL,
+                responded INTEGER NOT NULL,
+                source TEXT NOT NULL,
+                gate_score REAL,
+                created_at TEXT DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        
+        # Link verdicts - cached scam/safe decisions per normalized URL or registered domain
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS link_verdicts (
+                key_type TEXT NOT NULL,
+                key TEXT NOT NULL,
+                domain TEXT,
+                is_scam INTEGER NOT NULL,
+                reason TEXT,
+                source TEXT NOT NULL,
+                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                expires_at REAL,
+                PRIMARY KEY (key_type, key)
+            )
+        """)
+        
+        # Confirmed scam messages (seed list + community ban votes) with their embeddings
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS scam_examples (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                content TEXT NOT NULL UNIQUE,
+                reason TEXT,
+                source TEXT NOT NULL,
+                embedding BLOB,
+                created_at TEXT DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        
+        # Rolling summary of each channel's older conversation, through the message at through_ts
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS channel_summaries (
+                channel_id INTEGER PRIMARY KEY,
+                summary TEXT NOT NULL,
+                through_ts INTEGER NOT NULL,
+                folded INTEGER NOT NULL DEFAULT 0,
+                updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        
+        # Change counter for mood/memory/recent_happenings, bumped by triggers so
+        # StateCache also notices writes made by other processes
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS state_version (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                version INTEGER NOT NULL
+            )
+        """)
+        cursor.execute("INSERT OR IGNORE INTO state_version (id, version) VALUES (1, 0)")
+        for table in STATE_TABLES:
+            for event in ('INSERT', 'UPDATE', 'DELETE'):
+                cursor.execute(f"""
+                    CREATE TRIGGER IF NOT EXISTS trg_{table}_{event.lower()}_version
+                    AFTER {event} ON {table}
+                    BEGIN
+                        UPDATE state_version SET version = version + 1 WHERE id = 1;
+                    END
+                """)
+        
+        # Create indexes
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_link_verdicts_domain 
+            ON link_verdicts(domain)
+        """)
+        
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_channel_timestamp 
+            ON messages(channel_id, timestamp DESC)
+        """)
+        
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_memory_key 
+            ON memory(key)
+        """)
+        
+        # get_mood / get_recent_happenings read the newest row
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_mood_updated ON mood(updated_at)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_recent_happenings_updated ON recent_happenings(updated_at)")
+        
+        # Initialize default mood if none exists
+        cursor.execute("SELECT COUNT(*) as count FROM mood")
+        if cursor.fetchone()['count'] == 0:
+            cursor.execute("""
+                INSERT INTO mood (mood, description, intensity, updated_at)
+                VALUES (?, ?, ?, ?)
+            """, ("chill", "Default relaxed mood", 0.5, datetime.datetime.now().isoformat()))
+        
+        _migrate_schema(cursor)
+        _create_message_fts(cursor)
+    print(f"✅ Database initialized at {DB_PATH}")
+    if backfill_in_background:
+        _start_ts_backfill()
+        _start_fts_backfill()
+
+def _migrate_schema(cursor):
+    """Bring an existing database up to SCHEMA_VERSION. Every step is additive,
+    so code that predates it can still read and write the file (a trigger fills
+    in ts for the rows it writes)."""
+    cursor.execute("PRAGMA user_version")
+    version = cursor.fetchone()[0]
+    if version < 1:
+        columns = {row['name'] for row in cursor.execute("PRAGMA table_info(messages)")}
+        if 'ts' not in columns:
+            cursor.execute("ALTER TABLE messages ADD COLUMN ts INTEGER")
+        # Rows the backfill still has to convert
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_messages_ts_missing ON messages(id) WHERE ts IS NULL")
+        print(f"🗄️  Migrated database schema from version {version} to 1")
+    # Code that predates ts still inserts rows without it, also after the backfill
+    # finished; fill it in as they arrive so ts-ordered reads never miss them
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_messages_ts_fill AFTER INSERT ON messages
+        WHEN new.ts IS NULL
+        BEGIN
+            UPDATE messages SET ts = {TS_FROM_ISO_SQL.format(column='new.timestamp')} WHERE id = new.id;
+        END
     """)
+    if version < 2:
+        # Pinned memories are always in the prompt; the rest are picked by embedding similarity
+        columns = {row['name'] for row in cursor.execute("PRAGMA table_info(memory)")}
+        if 'pinned' not in columns:
+            cursor.execute("ALTER TABLE memory ADD COLUMN pinned INTEGER NOT NULL DEFAULT 0")
+        if 'embedding' not in columns:
+            cursor.execute("ALTER TABLE memory ADD COLUMN embedding BLOB")
+        print(f"🗄️  Migrated database schema from version {max(version, 1)} to 2")
+    cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+def _create_ts_indexes():
+    """Indexes over messages.ts, built once ts is filled in: one bulk build is far
+    cheaper than updating them row by row during the backfill."""
+    with write_cursor() as cursor:
+        # Recent history reads only this index; retention deletes use the plain ts index
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_messages_channel_ts
+            ON messages(channel_id, ts DESC, is_bot, author_name, content)
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_messages_ts ON messages(ts)")
+
+def ms_to_iso(ts: int) -> str:
+    return datetime.datetime.fromtimestamp(ts / 1000).isoformat()
+
+def iso_to_ms(timestamp: str) -> int:
+    return int(datetime.datetime.fromisoformat(timestamp).timestamp() * 1000)
+
+def backfill_message_ts(batch_size: int = TS_BACKFILL_BATCH, pause: float = TS_BACKFILL_PAUSE) -> int:
+    """Fill messages.ts from the ISO timestamp, one short transaction per batch
+    so writers are never held up for long. Returns the number of rows converted."""
+    global _ts_ready
+    converted = 0
+    while True:
+        with write_cursor() as cursor:
+            # Unparseable timestamps get 0, so they aren't retried forever
+            cursor.execute(f"""
+                UPDATE messages
+                SET ts = {TS_FROM_ISO_SQL.format(column='timestamp')}
+                WHERE id IN (SELECT id FROM messages WHERE ts IS NULL LIMIT ?)
+            """, (batch_size,))
+            updated = cursor.rowcount
+        if updated <= 0:
+            break
+        converted += updated
+        time.sleep(pause)
+    _create_ts_indexes()
+    _ts_ready = True
+    return converted
+
+def _start_ts_backfill():
+    """Use ts right away if every row has it, otherwise backfill in the background.
     
-    # Memory bank table for sticky memories (especially from admin)
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS memory (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            key TEXT UNIQUE NOT NULL,
-            value TEXT NOT NULL,
-            source TEXT,
-            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-            updated_at TEXT DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
+    Message times are stored as `ts` (epoch ms, what queries sort and filter
+    on) and as the ISO `timestamp`, still written so older code and tools keep
+    working. Queries use the ISO column until the backfill is done."""
+    global _ts_ready
+    missing = get_db_connection().execute("SELECT 1 FROM messages WHERE ts IS NULL LIMIT 1").fetchone()
+    if missing is None:
+        _create_ts_indexes()
+        _ts_ready = True
+        return
     
-    # Mood table - tracks bot's current mood state
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS mood (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            mood TEXT NOT NULL,
-            description TEXT,
-            intensity REAL DEFAULT 0.5,
-            updated_at TEXT DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
+    def run():
+        started = time.perf_counter()
+        try:
+            converted = backfill_message_ts()
+        except sqlite3.Error as e:
+            print(f"Error backfilling message timestamps, using ISO timestamps until restart: {e}")
+            return
+        print(f"🗄️  Backfilled ts for {converted} messages in {time.perf_counter() - started:.1f}s")
+    
+    threading.Thread(target=run, name='db-ts-backfill', daemon=True).start()
+
+def _create_message_fts(cursor):
+    """Create messages_fts and its sync triggers if they don't exist. Rows that
+    predate the index are left to backfill_message_fts.
     
-    # Recent happenings table - bot's current awareness of recent activity
+    The index is external-content (the text stays in messages). db_meta's
+    fts_low_water is the lowest id indexed so far; deletes and updates below
+    it skip the index."""
+    global _fts_available
+    cursor.execute("CREATE TABLE IF NOT EXISTS db_meta (key TEXT PRIMARY KEY, value INTEGER)")
+    exists = cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'messages_fts'").fetchone()
+    if not exists:
+        try:
+            cursor.execute("""
+                CREATE VIRTUAL TABLE messages_fts USING fts5(
+                    content, author_name, channel_id,
+                    content='messages', content_rowid='id',
+                    tokenize='unicode61 remove_diacritics 2'
+                )
+            """)
+        except sqlite3.OperationalError as e:
+            print(f"Full-text history search unavailable: {e}")
+            return
+        # Everything already in messages still has to be indexed
+        cursor.execute("""
+            INSERT OR REPLACE INTO db_meta (key, value)
+            SELECT 'fts_low_water', COALESCE(MAX(id), 0) + 1 FROM messages
+        """)
     cursor.execute("""
-        CREATE TABLE IF NOT EXISTS recent_happenings (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            content TEXT NOT NULL,
-            updated_at TEXT DEFAULT CURRENT_TIMESTAMP
-        )
+        CREATE TRIGGER IF NOT EXISTS trg_messages_fts_insert AFTER INSERT ON messages
+        BEGIN
+            INSERT INTO messages_fts (rowid, content, author_name, channel_id)
+            VALUES (new.id, new.content, new.author_name, new.channel_id);
+        END
     """)
-    
-    # Create indexes
+    # Removing a row that was never indexed would corrupt an external-content index
     cursor.execute("""
-        CREATE INDEX IF NOT EXISTS idx_channel_timestamp 
-        ON messages(channel_id, timestamp DESC)
+        CREATE TRIGGER IF NOT EXISTS trg_messages_fts_delete AFTER DELETE ON messages
+        WHEN old.id >= (SELECT value FROM db_meta WHERE key = 'fts_low_water')
+        BEGIN
+            INSERT INTO messages_fts (messages_fts, rowid, content, author_name, channel_id)
+            VALUES ('delete', old.id, old.content, old.author_name, old.channel_id);
+        END
     """)
-    
     cursor.execute("""
-        CREATE INDEX IF NOT EXISTS idx_memory_key 
-        ON memory(key)
+        CREATE TRIGGER IF NOT EXISTS trg_messages_fts_update AFTER UPDATE OF content, author_name, channel_id ON messages
+        WHEN old.id >= (SELECT value FROM db_meta WHERE key = 'fts_low_water')
+        BEGIN
+            INSERT INTO messages_fts (messages_fts, rowid, content, author_name, channel_id)
+            VALUES ('delete', old.id, old.content, old.author_name, old.channel_id);
+            INSERT INTO messages_fts (rowid, content, author_name, channel_id)
+            VALUES (new.id, new.content, new.author_name, new.channel_id);
+        END
     """)
+    _fts_available = True
+
+def backfill_message_fts(batch_size: int = FTS_BACKFILL_BATCH, pause: float = TS_BACKFILL_PAUSE) -> int:
+    """Index messages that predate messages_fts, newest first (the most useful
+    to search), one short transaction per batch. Returns the number indexed."""
+    indexed = 0
+    while True:
+        with write_cursor() as cursor:
+            low = cursor.execute("SELECT value FROM db_meta WHERE key = 'fts_low_water'").fetchone()[0]
+            if low <= 0:
+                break
+            row = cursor.execute("SELECT id FROM messages WHERE id < ? ORDER BY id DESC LIMIT 1 OFFSET ?",
+                                 (low, batch_size - 1)).fetchone()
+            new_low = row[0] if row is not None else 0
+            cursor.execute("""
+                INSERT INTO messages_fts (rowid, content, author_name, channel_id)
+                SELECT id, content, author_name, channel_id FROM messages WHERE id >= ? AND id < ?
+            """, (new_low, low))
+            indexed += cursor.rowcount
+            cursor.execute("UPDATE db_meta SET value = ? WHERE key = 'fts_low_water'", (new_low,))
+        if new_low <= 0:
+            break
+        time.sleep(pause)
+    return indexed
+
+def _start_fts_backfill():
+    if not _fts_available:
+        return
+    low = get_db_connection().execute("SELECT value FROM db_meta WHERE key = 'fts_low_water'").fetchone()[0]
+    if low <= 0:
+        return
     
-    # Initialize default mood if none exists
-    cursor.execute("SELECT COUNT(*) as count FROM mood")
-    if cursor.fetchone()['count'] == 0:
-        cursor.execute("""
-            INSERT INTO mood (mood, description, intensity, updated_at)
-            VALUES (?, ?, ?, ?)
-        """, ("chill", "Default relaxed mood", 0.5, datetime.datetime.now().isoformat()))
+    def run():
+        started = time.perf_counter()
+        try:
+            indexed = backfill_message_fts()
+        except sqlite3.Error as e:
+            print(f"Error indexing message history for search, older messages stay unsearchable until restart: {e}")
+            return
+        print(f"🔎 Indexed {indexed} older messages for history search in {time.perf_counter() - started:.1f}s")
     
-    conn.commit()
-    conn.close()
-    print(f"✅ Database initialized at {DB_PATH}")
+    threading.Thread(target=run, name='db-fts-backfill', daemon=True).start()
+
+class MessageBuffer:
+    """Chat messages waiting to be inserted, committed in batches by a flusher thread.
+
+    Chat messages are only prompt history, so each one isn't its own commit:
+    they're group-committed every MESSAGE_FLUSH_EVERY messages or
+    MESSAGE_FLUSH_MS milliseconds, whichever comes first. Readers merge the
+    buffer with the table, so a buffered message is never missing from history."""
+
+    def __init__(self, flush_every: int = MESSAGE_FLUSH_EVERY, flush_ms: float = MESSAGE_FLUSH_MS):
+        self.flush_every = max(1, flush_every)
+        self.flush_seconds = flush_ms / 1000
+        self.rows = []  # (channel_id, author_name, author_id, content, is_bot, timestamp, ts)
+        self.first_buffered_at = 0.0
+        self.cond = threading.Condition()
+        # Held while a batch moves from the buffer to the table, and by readers
+        # merging the two, so a reader never sees a message twice or not at all
+        self.flush_lock = threading.Lock()
+        self.thread = None
+        self.stats = {'messages': 0, 'commits': 0, 'max_batch': 0}
+
+    def add(self, row: tuple):
+        with self.cond:
+            if not self.rows:
+                self.first_buffered_at = time.monotonic()
+            self.rows.append(row)
+            self.stats['messages'] += 1
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name='db-message-flush', daemon=True)
+                self.thread.start()
+            if len(self.rows) >= self.flush_every:
+                self.cond.notify()
+
+    def _run(self):
+        while True:
+            with self.cond:
+                self.cond.wait_for(lambda: self.rows)
+                deadline = self.first_buffered_at + self.flush_seconds
+                self.cond.wait_for(lambda: len(self.rows) >= self.flush_every,
+                                   timeout=max(0.0, deadline - time.monotonic()))
+            try:
+                self.flush()
+            except sqlite3.Error as e:
+                print(f"Error flushing buffered messages, will retry: {e}")
+                time.sleep(self.flush_seconds)
+
+    def flush(self) -> int:
+        """Commit everything buffered so far in one transaction. Returns the number of messages."""
+        with self.flush_lock:
+            with self.cond:
+                rows = list(self.rows)
+            if not rows:
+                return 0
+            with write_cursor() as cursor:
+                cursor.executemany("""
+                    INSERT INTO messages (channel_id, author_name, author_id, content, is_bot, timestamp, ts)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                """, rows)
+            with self.cond:
+                del self.rows[:len(rows)]
+                if self.rows:
+                    self.first_buffered_at = time.monotonic()
+            self.stats['commits'] += 1
+            self.stats['max_batch'] = max(self.stats['max_batch'], len(rows))
+        return len(rows)
+
+    def pending(self, channel_id: int) -> List[tuple]:
+        """Buffered rows for one channel, oldest first. Call while holding flush_lock."""
+        with self.cond:
+            return [row for row in self.rows if row[0] == channel_id]
+
+    def report(self) -> str:
+        s = self.stats
+        return (f"Message buffer: {len(self.rows)} pending, {s['messages']} messages in {s['commits']} commits, "
+                f"largest batch {s['max_batch']}")
+
+_message_buffer = MessageBuffer()
+
+class ChannelHistoryCache:
+    """Ring buffer of each active channel's latest messages, LRU-evicted.
+
+    Serves recent history from memory: a channel's last HISTORY_CACHE_MESSAGES
+    messages are loaded on first access and appended to by add_message. Idle
+    channels are evicted first, within a channel count and memory cap."""
+
+    # Rough per-message overhead of the dict and deque slot, on top of the text
+    MESSAGE_OVERHEAD_BYTES = 300
+
+    def __init__(self, per_channel: int = HISTORY_CACHE_MESSAGES, max_channels: int = HISTORY_CACHE_MAX_CHANNELS,
+                 max_bytes: int = HISTORY_CACHE_MAX_BYTES):
+        self.per_channel = max(1, per_channel)
+        self.max_channels = max(1, max_channels)
+        self.max_bytes = max_bytes
+        self.channels: "OrderedDict[int, deque]" = OrderedDict()  # Least recently used first
+        self.sizes: Dict[int, int] = {}
+        self.total_bytes = 0
+        # Held across a channel's load and every append, so a message arriving mid-load isn't lost or doubled
+        self.lock = threading.RLock()
+        self.stats = {'hits': 0, 'loads': 0, 'evictions': 0}
+
+    def _message_size(self, message: Dict) -> int:
+        return len(message['content']) + len(message['author']) + self.MESSAGE_OVERHEAD_BYTES
+
+    def _recount(self, channel_id: int):
+        size = sum(self._message_size(m) for m in self.channels[channel_id])
+        self.total_bytes += size - self.sizes.get(channel_id, 0)
+        self.sizes[channel_id] = size
+
+    def _evict(self):
+        while self.channels and (len(self.channels) > self.max_channels or self.total_bytes > self.max_bytes):
+            if len(self.channels) == 1:
+                break  # Never evict the channel just used
+            channel_id, _ = self.channels.popitem(last=False)
+            self.total_bytes -= self.sizes.pop(channel_id, 0)
+            self.stats['evictions'] += 1
+
+    def get(self, channel_id: int, loader) -> List[Dict]:
+        """The channel's cached messages, oldest first, loading them with loader(limit) on a miss."""
+        with self.lock:
+            messages = self.channels.get(channel_id)
+            if messages is not None:
+                self.channels.move_to_end(channel_id)
+                self.stats['hits'] += 1
+                return list(messages)
+            messages = deque(loader(self.per_channel), maxlen=self.per_channel)
+            self.channels[channel_id] = messages
+            self.stats['loads'] += 1
+            self._recount(channel_id)
+            self._evict()
+            return list(messages)
+
+    def append(self, channel_id: int, message: Dict):
+        """Add a new message to a loaded channel (unloaded channels load it from the database later)."""
+        with self.lock:
+            messages = self.channels.get(channel_id)
+            if messages is None:
+                return
+            if len(messages) == messages.maxlen:
+                self.sizes[channel_id] -= self._message_size(messages[0])
+                self.total_bytes -= self._message_size(messages[0])
+            messages.append(message)
+            self.sizes[channel_id] += self._message_size(message)
+            self.total_bytes += self._message_size(message)
+            self._evict()
+
+    def clear(self):
+        with self.lock:
+            self.channels.clear()
+            self.sizes.clear()
+            self.total_bytes = 0
+
+    def report(self) -> str:
+        s = self.stats
+        return (f"History cache: {len(self.channels)} channels, {self.total_bytes // 1024}KB, "
+                f"{s['hits']} hits / {s['loads']} loads, {s['evictions']} evictions")
+
+_history_cache = ChannelHistoryCache()
+
+class StateCache:
+    """Formatted mood, memories and recent happenings (and the memory rows),
+    kept until one of the state tables changes.
+
+    Triggers bump state_version on any change to those tables, from this
+    process or another (an admin editing the file with sqlite3). The cache
+    checks PRAGMA data_version at most every STATE_CACHE_CHECK_MS and only
+    reads the counter when some commit happened; in-process writes
+    invalidate it directly."""
+
+    def __init__(self, check_ms: float = STATE_CACHE_CHECK_MS):
+        self.check_seconds = check_ms / 1000
+        self.values: Dict[str, object] = {}
+        self.version = None  # state_version.version the values were loaded at
+        # Own connection: its data_version changes whenever any other connection commits
+        self.conn = None
+        self.conn_key = None
+        self.data_version = None
+        self.checked_at = 0.0
+        self.lock = threading.Lock()
+        self.stats = {'hits': 0, 'checks': 0, 'loads': 0, 'invalidations': 0}
+
+    def fresh(self, name: str):
+        """The cached value if it's known to be current without asking the database, else None."""
+        value = self.values.get(name)
+        if value is None or time.monotonic() - self.checked_at >= self.check_seconds:
+            return None
+        self.stats['hits'] += 1
+        return value
+
+    def get(self, name: str, loader):
+        """The cached value, loading it with loader() if a state table changed. Blocking."""
+        value = self.fresh(name)
+        if value is not None:
+            return value
+        with self.lock:
+            self._validate()
+            value = self.values.get(name)
+            if value is None:
+                value = self.values[name] = loader()
+                self.stats['loads'] += 1
+            else:
+                self.stats['hits'] += 1
+            return value
+
+    def _connection(self) -> sqlite3.Connection:
+        if self.conn is None or self.conn_key != (DB_PATH, _generation):
+            self.conn = sqlite3.connect(DB_PATH, timeout=DB_BUSY_TIMEOUT_MS / 1000, check_same_thread=False)
+            self.conn_key = (DB_PATH, _generation)
+            self.data_version = None
+            with _connections_lock:
+                _connections.append(self.conn)
+        return self.conn
+
+    def _validate(self):
+        """Drop the values if the state tables changed since they were loaded."""
+        now = time.monotonic()
+        if now - self.checked_at < self.check_seconds:
+            return
+        self.stats['checks'] += 1
+        try:
+            conn = self._connection()
+            data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+            if data_version != self.data_version:
+                # Something committed (usually chat history); only the counter says whether it was state
+                version = conn.execute("SELECT version FROM state_version WHERE id = 1").fetchone()[0]
+                if version != self.version:
+                    self.values.clear()
+                    self.version = version
+                self.data_version = data_version
+        except sqlite3.Error:
+            # No state_version yet (init_db hasn't run on this file): don't cache
+            self.values.clear()
+            return
+        self.checked_at = now
+
+    def invalidate(self):
+        """Called after this process writes a state table."""
+        with self.lock:
+            self.values.clear()
+            self.checked_at = 0.0
+            self.stats['invalidations'] += 1
+
+    def report(self) -> str:
+        s = self.stats
+        return (f"State cache: {s['hits']} hits, {s['loads']} loads, {s['checks']} version checks, "
+                f"{s['invalidations']} local invalidations")
+
+_state_cache = StateCache()
+
+def flush_messages() -> int:
+    """Write barrier: commit every buffered message now."""
+    return _message_buffer.flush()
+
+def message_buffer_report() -> str:
+    return _message_buffer.report()
+
+def history_cache_report() -> str:
+    return _history_cache.report()
+
+def cached_state(name: str) -> Optional[str]:
+    """'mood', 'memories' or 'happenings' prompt text if the state cache can
+    answer without touching the database, else None (call format_* instead)."""
+    return _state_cache.fresh(name)
+
+def state_cache_report() -> str:
+    return _state_cache.report()
+
+atexit.register(flush_messages)
 
 def add_message(channel_id: int, author_name: str, content: str, 
                 author_id: Optional[int] = None, is_bot: bool = False):
-    """Add a message to the database."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    timestamp = datetime.datetime.now().isoformat()
-    
-    cursor.execute("""
-        INSERT INTO messages (channel_id, author_name, author_id, content, is_bot, timestamp)
-        VALUES (?, ?, ?, ?, ?, ?)
-    """, (channel_id, author_name, author_id, content, 1 if is_bot else 0, timestamp))
-    
-    conn.commit()
-    conn.close()
+    """Add a message to the database (buffered; see MessageBuffer) and the history cache."""
+    now = datetime.datetime.now()
+    timestamp = now.isoformat()
+    ts = int(now.timestamp() * 1000)
+    with _history_cache.lock:
+        _message_buffer.add((channel_id, author_name, author_id, content, 1 if is_bot else 0, timestamp, ts))
+        _history_cache.append(channel_id, {
+            'author': author_name,
+            'content': content,
+            'is_bot': bool(is_bot),
+            'timestamp': timestamp,
+            'ts': ts
+        })
 
 def get_channel_messages(channel_id: int, limit: int = 25, 
                         exclude_bot: bool = False) -> List[Dict]:
-    """Get recent messages for a channel."""
+    """Get recent messages for a channel, from the history cache when it holds enough."""
+    if limit <= 0:
+        return []
+    if limit <= _history_cache.per_channel:
+        cached = _history_cache.get(channel_id, lambda n: _query_channel_messages(channel_id, n))
+        if exclude_bot:
+            # Filtering may leave too few; only a channel with fewer messages than the cache holds is complete
+            humans = [m for m in cached if not m['is_bot']]
+            if len(humans) >= limit or len(cached) < _history_cache.per_channel:
+                return humans[-limit:]
+        else:
+            return cached[-limit:]
+    return _query_channel_messages(channel_id, limit, exclude_bot)
+
+def _query_channel_messages(channel_id: int, limit: int, exclude_bot: bool = False) -> List[Dict]:
+    """Recent messages for a channel from the table plus the group-commit buffer."""
     conn = get_db_connection()
     cursor = conn.cursor()
     
-    query = """
-        SELECT author_name, content, is_bot, timestamp
+    # Until the ts backfill is done, old rows only have the ISO timestamp to sort on
+    order_column = "ts" if _ts_ready else "timestamp"
+    query = f"""
+        SELECT author_name, content, is_bot, {order_column} AS sort_key
         FROM messages
         WHERE channel_id = ?
     """
@@ -121,12 +788,13 @@ def get_channel_messages(channel_id: int, limit: int = 25,
     if exclude_bot:
         query += " AND is_bot = 0"
     
-    query += " ORDER BY timestamp DESC LIMIT ?"
+    query += f" ORDER BY {order_column} DESC LIMIT ?"
     params.append(limit)
     
-    cursor.execute(query, params)
-    rows = cursor.fetchall()
-    conn.close()
+    with _message_buffer.flush_lock:
+        cursor.execute(query, params)
+        rows = cursor.fetchall()
+        buffered = _message_buffer.pending(channel_id)
     
     # Convert to list of dicts and reverse to get chronological order
     messages = []
@@ -135,21 +803,35 @@ def get_channel_messages(channel_id: int, limit: int = 25,
             'author': row['author_name'],
             'content': row['content'],
             'is_bot': bool(row['is_bot']),
-            'timestamp': row['timestamp']
+            'timestamp': ms_to_iso(row['sort_key']) if _ts_ready else row['sort_key'],
+            'ts': row['sort_key'] if _ts_ready else iso_to_ms(row['sort_key'])
         })
     
-    return messages
+    # Messages still waiting for their group commit are the newest ones
+    for _, author_name, _, content, is_bot, timestamp, ts in buffered:
+        if exclude_bot and is_bot:
+            continue
+        messages.append({
+            'author': author_name,
+            'content': content,
+            'is_bot': bool(is_bot),
+            'timestamp': timestamp,
+            'ts': ts
+        })
+    
+    return messages[-limit:]
 
 def get_channel_message_count(channel_id: int) -> int:
     """Get the total number of messages in a channel."""
     conn = get_db_connection()
     cursor = conn.cursor()
     
-    cursor.execute("SELECT COUNT(*) as count FROM messages WHERE channel_id = ?", (channel_id,))
-    result = cursor.fetchone()
-    conn.close()
+    with _message_buffer.flush_lock:
+        cursor.execute("SELECT COUNT(*) as count FROM messages WHERE channel_id = ?", (channel_id,))
+        result = cursor.fetchone()
+        buffered = len(_message_buffer.pending(channel_id))
     
-    return result['count'] if result else 0
+    return (result['count'] if result else 0) + buffered
 
 def format_channel_history(channel_id: int, max_messages: int = 25, 
                           exclude_bot: bool = False) -> str:
@@ -167,40 +849,362 @@ def format_channel_history(channel_id: int, max_messages: int = 25,
     
     return formatted_history
 
-def cleanup_old_messages(days_to_keep: int = 30):
-    """Remove messages older than specified days."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
+# Words too common to say what a message is about
+SEARCH_STOPWORDS = frozenset('''
+    the and for are but not you your all any can had her was one our out has him his how its may new now
+    see two who did get let say she too use that this with have from they will would there their what
+    about which when make like time just know take into year some could them than then look only come
+    over also back after work first well even want because these give most been were said does done
+    yesterday today tomorrow week ago earlier anyone someone something here where why should
+'''.split())
+
+def search_terms(text: str) -> List[str]:
+    """Words as messages_fts indexes them (unicode61: lowercased, accents and
+    punctuation removed, underscores split words)."""
+    text = text.lower()
+    if not text.isascii():
+        text = unicodedata.normalize('NFKD', text)
+        text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    return re.findall(r"[^\W_]+", text)
+
+def query_terms(text: str, max_terms: int = 8) -> List[str]:
+    """The distinctive words of a question, in order, without repeats."""
+    terms = []
+    for word in search_terms(text):
+        if len(word) < 3 or word.isdigit() or word in SEARCH_STOPWORDS or word in terms:
+            continue
+        terms.append(word)
+        if len(terms) == max_terms:
+            break
+    return terms
+
+def fts_match(terms: List[str]) -> Optional[str]:
+    """An FTS5 query matching any of terms in message content, or None if there are none."""
+    if not terms:
+        return None
+    return "content : (" + " OR ".join(f'"{term}"' for term in terms) + ")"
+
+def rank_bm25(rows: List[Dict], terms: List[str], doc_counts: Dict[str, int], total_docs: int,
+              k1: float = 1.2, b: float = 0.75) -> List[float]:
+    """Okapi BM25 score of each row's content for terms."""
+    words = [search_terms(row['content']) for row in rows]
+    lengths = [len(row_words) for row_words in words]
+    average_length = max(1.0, sum(lengths) / max(1, len(lengths)))
+    idf = {term: math.log(1 + (total_docs - doc_counts.get(term, 0) + 0.5) / (doc_counts.get(term, 0) + 0.5))
+           for term in terms}
+    scores = []
+    for row_words, length in zip(words, lengths):
+        counts = {}
+        for word in row_words:
+            if word in idf:
+                counts[word] = counts.get(word, 0) + 1
+        scores.append(sum(idf[term] * count * (k1 + 1) / (count + k1 * (1 - b + b * length / average_length))
+                          for term, count in counts.items()))
+    return scores
+
+def _id_at_ts(ts_ms: int) -> Optional[int]:
+    """Id of the first message at or after ts_ms (ids grow with time), None if there's none."""
+    row = get_db_connection().execute("SELECT id FROM messages WHERE ts >= ? ORDER BY ts LIMIT 1",
+                                      (ts_ms,)).fetchone()
+    return row['id'] if row is not None else None
+
+def search_messages(query: str, channel_id: Optional[int] = None, author: Optional[str] = None,
+                    since_ms: Optional[int] = None, until_ms: Optional[int] = None,
+                    limit: int = 10, candidates: int = HISTORY_SEARCH_CANDIDATES) -> List[Dict]:
+    """Stored messages containing query's words, best match (BM25) first,
+    optionally limited to a channel, an author and a [since_ms, until_ms) time
+    range. With only an author, their newest messages. Chat messages still in
+    the group-commit buffer aren't searched.
     
-    cutoff_date = (datetime.datetime.now() - datetime.timedelta(days=days_to_keep)).isoformat()
+    Only the newest `candidates` matches are ranked: FTS5 walks the index in
+    rowid order and stops there, so a search costs about the same on a large
+    table as on a small one, and old matches of common words never crowd out
+    recent ones. They're ranked with BM25 computed here rather than FTS5's
+    bm25(), which reads every posting of each word: a word is weighed by how
+    many of the newest IDF_WINDOW messages contain it."""
+    if not _fts_available:
+        return []
+    terms = query_terms(query)
+    clauses = []
+    if terms:
+        clauses.append(fts_match(terms))
+    if author:
+        clauses.append('author_name : "' + author.replace('"', '""') + '"')
+    if not clauses:
+        return []
+    if channel_id is not None:
+        clauses.append(f'channel_id : "{int(channel_id)}"')
     
-    cursor.execute("DELETE FROM messages WHERE timestamp < ?", (cutoff_date,))
-    deleted_count = cursor.rowcount
+    where = ["messages_fts MATCH ?"]
+    params = [" AND ".join(clauses)]
+    # The time range as a rowid range lets the index skip straight to it;
+    # the ts conditions then drop the few rows whose clock went backwards
+    if since_ms is not None:
+        first_id = _id_at_ts(since_ms)
+        if first_id is None:
+            return []
+        where.append("messages_fts.rowid >= ? AND m.ts >= ?")
+        params += [first_id, since_ms]
+    if until_ms is not None:
+        end_id = _id_at_ts(until_ms)
+        if end_id is not None:
+            where.append("messages_fts.rowid < ?")
+            params.append(end_id)
+        where.append("m.ts < ?")
+        params.append(until_ms)
+    params.append(candidates if terms else limit)
     
-    conn.commit()
-    conn.close()
+    conn = get_db_connection()
+    rows = conn.execute(f"""
+        SELECT m.id, m.channel_id, m.author_name, m.content, m.is_bot, m.ts
+        FROM messages_fts JOIN messages m ON m.id = messages_fts.rowid
+        WHERE {' AND '.join(where)}
+        ORDER BY messages_fts.rowid DESC LIMIT ?
+    """, params).fetchall()
+    results = [
+        {
+            'id': row['id'],
+            'channel_id': row['channel_id'],
+            'author': row['author_name'],
+            'content': row['content'],
+            'is_bot': bool(row['is_bot']),
+            'ts': row['ts']
+        }
+        for row in rows
+    ]
+    if not terms or not results:
+        return results
     
-    return deleted_count
+    # Document frequencies from a recent window: bounded cost, and it follows what's talked about now.
+    # The id range stands in for the row count; it only scales every word's weight alike
+    ends = conn.execute("SELECT (SELECT MAX(id) FROM messages) AS hi, (SELECT MIN(id) FROM messages) AS lo").fetchone()
+    window_start = max(ends['lo'], ends['hi'] - IDF_WINDOW + 1)
+    total_docs = ends['hi'] - window_start + 1
+    doc_counts = {
+        term: conn.execute("SELECT COUNT(*) FROM messages_fts WHERE messages_fts MATCH ? AND rowid >= ?",
+                           (f'content : "{term}"', window_start)).fetchone()[0]
+        for term in terms
+    }
+    scores = rank_bm25(results, terms, doc_counts, total_docs)
+    ranked = sorted(zip(scores, results), key=lambda pair: (-pair[0], -pair[1]['id']))
+    return [result for _, result in ranked[:limit]]
 
-# Memory bank functions
-def save_memory(key: str, value: str, source: Optional[str] = None):
-    """Save or update a memory. If key exists, updates it."""
+def format_related_history(channel_id: int, query: str, limit: int = HISTORY_SEARCH_RESULTS,
+                           skip_recent: int = 10) -> str:
+    """Older messages in the channel that match query, for questions about
+    earlier conversation. The skip_recent newest messages are left out, since
+    the prompt's recent history already has them."""
+    if limit <= 0 or not _ts_ready:
+        return ""
+    row = get_db_connection().execute(
+        "SELECT ts FROM messages WHERE channel_id = ? ORDER BY ts DESC LIMIT 1 OFFSET ?",
+        (channel_id, max(0, skip_recent - 1))).fetchone()
+    if row is None:
+        return ""
+    matches = search_messages(query, channel_id=channel_id, until_ms=row['ts'], limit=limit)
+    if not matches:
+        return ""
+    
+    formatted = "Related earlier messages in this channel:\n"
+    for msg in sorted(matches, key=lambda m: m['ts']):
+        when = datetime.datetime.fromtimestamp(msg['ts'] / 1000).strftime('%Y-%m-%d %H:%M')
+        formatted += f"[{when}] {msg['author']}: {msg['content']}\n"
+    
+    return formatted
+
+def _archive_rows(archive, rows):
+    """Append rows to an open gzip segment and make sure they're on disk."""
+    gz, raw = archive
+    for row in rows:
+        gz.write((json.dumps(dict(row), ensure_ascii=False) + "\n").encode('utf-8'))
+    gz.flush()
+    raw.flush()
+    os.fsync(raw.fileno())
+
+def cleanup_old_messages(days_to_keep: int = 30, archive_dir: Optional[str] = None,
+                         batch_size: int = RETENTION_BATCH, pause: float = RETENTION_PAUSE) -> int:
+    """Delete messages older than days_to_keep, oldest first, one short
+    transaction per batch. With archive_dir, each batch is appended to a
+    gzipped JSONL segment (one per call) before it's deleted. Returns the
+    number of messages deleted."""
+    if not _ts_ready:
+        # Without idx_messages_ts every batch would scan the table; the next run will do it
+        print("🗄️  Skipping message retention until the ts backfill finishes")
+        return 0
+    cutoff_ms = int((datetime.datetime.now() - datetime.timedelta(days=days_to_keep)).timestamp() * 1000)
     conn = get_db_connection()
-    cursor = conn.cursor()
+    archive = None
+    deleted = 0
+    try:
+        while True:
+            rows = conn.execute("""
+                SELECT id, channel_id, author_name, author_id, content, is_bot, timestamp, ts
+                FROM messages WHERE ts < ? ORDER BY ts LIMIT ?
+            """, (cutoff_ms, batch_size)).fetchall()
+            if not rows:
+                break
+            if archive_dir:
+                if archive is None:
+                    os.makedirs(archive_dir, exist_ok=True)
+                    path = os.path.join(archive_dir, f"messages-{datetime.datetime.now():%Y%m%d-%H%M%S}.jsonl.gz")
+                    raw = open(path, 'ab')
+                    archive = (gzip.GzipFile(fileobj=raw, mode='ab'), raw)
+                _archive_rows(archive, rows)
+            with write_cursor() as cursor:
+                cursor.executemany("DELETE FROM messages WHERE id = ?", [(row['id'],) for row in rows])
+            deleted += len(rows)
+            if len(rows) < batch_size:
+                break
+            time.sleep(pause)
+    finally:
+        if archive is not None:
+            archive[0].close()
+            archive[1].close()
     
-    timestamp = datetime.datetime.now().isoformat()
+    if deleted:
+        _history_cache.clear()
+    return deleted
+
+def _delete_in_batches(table: str, where: str, params: tuple = (),
+                       batch_size: int = RETENTION_BATCH, pause: float = RETENTION_PAUSE) -> int:
+    """DELETE FROM table WHERE where, at most batch_size rows per transaction."""
+    deleted = 0
+    while True:
+        with write_cursor() as cursor:
+            cursor.execute(f"DELETE FROM {table} WHERE rowid IN (SELECT rowid FROM {table} WHERE {where} LIMIT ?)",
+                           (*params, batch_size))
+            count = cursor.rowcount
+        deleted += count
+        if count < batch_size:
+            return deleted
+        time.sleep(pause)
+
+def prune_superseded_state(keep: int = 1) -> Dict[str, int]:
+    """Keep only the newest `keep` rows of mood and recent_happenings; every
+    update adds a row and only the newest one is read."""
+    pruned = {}
+    for table in ('mood', 'recent_happenings'):
+        pruned[table] = _delete_in_batches(
+            table, f"id NOT IN (SELECT id FROM {table} ORDER BY updated_at DESC, id DESC LIMIT ?)", (keep,))
+    return pruned
+
+def cleanup_expired_link_verdicts() -> int:
+    """Delete link verdicts past their expiry (they're already ignored by lookups)."""
+    return _delete_in_batches("link_verdicts", "expires_at IS NOT NULL AND expires_at <= ?",
+                              (datetime.datetime.now().timestamp(),))
+
+def trim_classification_log(keep_per_source: int) -> int:
+    """Keep the newest keep_per_source decisions of each source. The relevance
+    gate trains on the last 5000 Grid decisions, so older ones are unused."""
+    conn = get_db_connection()
+    sources = [row['source'] for row in conn.execute("SELECT DISTINCT source FROM classification_log")]
+    deleted = 0
+    for source in sources:
+        row = conn.execute("SELECT id FROM classification_log WHERE source = ? ORDER BY id DESC LIMIT 1 OFFSET ?",
+                           (source, keep_per_source)).fetchone()
+        if row is not None:
+            deleted += _delete_in_batches("classification_log", "source = ? AND id <= ?", (source, row['id']))
+    return deleted
+
+def merge_message_fts(pages: int = 500):
+    """Merge a bounded amount of messages_fts segments, so the index doesn't keep
+    every small segment (and retention's delete markers) around between writes."""
+    if not _fts_available:
+        return
+    with write_cursor() as cursor:
+        cursor.execute("INSERT INTO messages_fts (messages_fts, rank) VALUES ('merge', ?)", (pages,))
+
+def db_size_info() -> Dict[str, int]:
+    """File size, free space inside it and WAL size, in bytes."""
+    conn = get_db_connection()
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+    freelist = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    wal_path = DB_PATH + "-wal"
+    return {
+        'size': page_size * page_count,
+        'free': page_size * freelist,
+        'wal': os.path.getsize(wal_path) if os.path.exists(wal_path) else 0,
+    }
+
+def compact_db(max_pages: int = 2000, convert: bool = False) -> int:
+    """Return up to max_pages free pages to the filesystem and truncate the WAL.
     
-    cursor.execute("""
-        INSERT INTO memory (key, value, source, created_at, updated_at)
-        VALUES (?, ?, ?, ?, ?)
-        ON CONFLICT(key) DO UPDATE SET
-            value = excluded.value,
-            source = excluded.source,
-            updated_at = excluded.updated_at
-    """, (key, value, source, timestamp, timestamp))
+    Only a file in auto_vacuum=INCREMENTAL mode can give pages back. An older
+    file is converted with one full VACUUM if convert is True - it rewrites the
+    whole file and blocks writers while it runs, so it's opt-in - and is
+    otherwise just checkpointed. Returns pages freed."""
+    global _auto_vacuum_warned
+    conn = get_db_connection()
+    freed = 0
+    with _write_lock:
+        incremental = conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+        if not incremental and convert:
+            started = time.perf_counter()
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.execute("VACUUM")
+            print(f"🗄️  Converted {DB_PATH} to incremental auto-vacuum in {time.perf_counter() - started:.1f}s")
+            incremental = True
+        if incremental:
+            before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            # The pragma frees one page per step and execute() stops after the first;
+            # executescript steps it to completion
+            conn.executescript(f"PRAGMA incremental_vacuum({int(max_pages)});")
+            freed = before - conn.execute("PRAGMA freelist_count").fetchone()[0]
+        elif not _auto_vacuum_warned:
+            _auto_vacuum_warned = True
+            print(f"⚠️  {DB_PATH} predates incremental auto-vacuum, so free pages aren't returned to the "
+                  f"filesystem; set MAINTENANCE_CONVERT_AUTO_VACUUM=true to convert it (one full VACUUM)")
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+    conn.execute("PRAGMA optimize")
+    return freed
+
+# Memory bank functions
+def save_memory(key: str, value: str, source: Optional[str] = None, pinned: Optional[bool] = None):
+    """Save or update a memory. If key exists, updates it (pinned=None keeps its pin)."""
+    with write_cursor() as cursor:
+        timestamp = datetime.datetime.now().isoformat()
+        pin = None if pinned is None else int(pinned)
+        
+        # A changed value needs a new embedding
+        cursor.execute("""
+            INSERT INTO memory (key, value, source, created_at, updated_at, pinned)
+            VALUES (?, ?, ?, ?, ?, COALESCE(?, 0))
+            ON CONFLICT(key) DO UPDATE SET
+                value = excluded.value,
+                source = excluded.source,
+                updated_at = excluded.updated_at,
+                pinned = COALESCE(?, memory.pinned),
+                embedding = CASE WHEN memory.value = excluded.value THEN memory.embedding END
+        """, (key, value, source, timestamp, timestamp, pin, pin))
+    _state_cache.invalidate()
+
+def set_memory_pinned(key: str, pinned: bool) -> bool:
+    """Pin (always include in prompts) or unpin a memory. False if there's no such key."""
+    with write_cursor() as cursor:
+        cursor.execute("UPDATE memory SET pinned = ? WHERE key = ?", (int(pinned), key))
+        updated = cursor.rowcount > 0
     
-    conn.commit()
-    conn.close()
+    if updated:
+        _state_cache.invalidate()
+    return updated
+
+def get_memory_rows() -> List[Dict]:
+    """Every memory with its pin and embedding (raw float32 bytes or None),
+    newest first. Cached until the memory table changes - don't modify the rows."""
+    return _state_cache.get('memory_rows', _load_memory_rows)
+
+def _load_memory_rows() -> List[Dict]:
+    conn = get_db_connection()
+    rows = conn.execute("""
+        SELECT id, key, value, source, updated_at, pinned, embedding FROM memory
+        ORDER BY updated_at DESC
+    """).fetchall()
+    return [dict(row) for row in rows]
+
+def set_memory_embedding(memory_id: int, embedding: bytes):
+    with write_cursor() as cursor:
+        cursor.execute("UPDATE memory SET embedding = ? WHERE id = ?", (embedding, memory_id))
 
 def get_memory(key: str) -> Optional[str]:
     """Get a memory by key."""
@@ -209,7 +1213,6 @@ def get_memory(key: str) -> Optional[str]:
     
     cursor.execute("SELECT value FROM memory WHERE key = ?", (key,))
     row = cursor.fetchone()
-    conn.close()
     
     return row['value'] if row else None
 
@@ -218,45 +1221,50 @@ def get_all_memories() -> List[Dict]:
     conn = get_db_connection()
     cursor = conn.cursor()
     
-    cursor.execute("SELECT key, value, source, updated_at FROM memory ORDER BY updated_at DESC")
+    cursor.execute("SELECT key, value, source, updated_at, pinned FROM memory ORDER BY updated_at DESC")
     rows = cursor.fetchall()
-    conn.close()
     
     return [
         {
             'key': row['key'],
             'value': row['value'],
             'source': row['source'],
-            'updated_at': row['updated_at']
+            'updated_at': row['updated_at'],
+            'pinned': bool(row['pinned'])
         }
         for row in rows
     ]
 
 def format_memories() -> str:
-    """Format all memories for use in prompts."""
-    memories = get_all_memories()
-    
+    """Format all memories for use in prompts (cached until the memory table changes)."""
+    return _state_cache.get('memories', _format_memories)
+
+def _format_memories() -> str:
+    return format_memory_block(get_all_memories())
+
+def format_memory_line(mem: Dict) -> str:
+    source_info = f" (from {mem['source']})" if mem['source'] else ""
+    return f"- {mem['key']}: {mem['value']}{source_info}\n"
+
+def format_memory_block(memories: List[Dict]) -> str:
+    """Memories in the prompt's Memory Bank format ("" if there are none)."""
     if not memories:
         return ""
     
     formatted = "Memory Bank (important things to remember):\n"
     for mem in memories:
-        source_info = f" (from {mem['source']})" if mem['source'] else ""
-        formatted += f"- {mem['key']}: {mem['value']}{source_info}\n"
+        formatted += format_memory_line(mem)
     
     return formatted
 
 def delete_memory(key: str) -> bool:
     """Delete a memory by key."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute("DELETE FROM memory WHERE key = ?", (key,))
-    deleted = cursor.rowcount > 0
-    
-    conn.commit()
-    conn.close()
+    with write_cursor() as cursor:
+        cursor.execute("DELETE FROM memory WHERE key = ?", (key,))
+        deleted = cursor.rowcount > 0
     
+    if deleted:
+        _state_cache.invalidate()
     return deleted
 
 # Mood functions
@@ -267,7 +1275,6 @@ def get_mood() -> Dict:
     
     cursor.execute("SELECT mood, description, intensity FROM mood ORDER BY updated_at DESC LIMIT 1")
     row = cursor.fetchone()
-    conn.close()
     
     if row:
         return {
@@ -285,35 +1292,34 @@ def get_mood() -> Dict:
 
 def set_mood(mood: str, description: Optional[str] = None, intensity: float = 0.5):
     """Set the bot's mood."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    timestamp = datetime.datetime.now().isoformat()
-    
-    if description is None:
-        # Generate description based on mood
-        mood_descriptions = {
-            'chill': 'Relaxed and casual',
-            'excited': 'Energetic and enthusiastic',
-            'focused': 'Serious and attentive',
-            'sarcastic': 'Playfully snarky',
-            'helpful': 'Eager to assist',
-            'curious': 'Interested and inquisitive',
-            'tired': 'Low energy, less talkative',
-            'happy': 'Positive and upbeat'
-        }
-        description = mood_descriptions.get(mood.lower(), f'Currently feeling {mood}')
-    
-    cursor.execute("""
-        INSERT INTO mood (mood, description, intensity, updated_at)
-        VALUES (?, ?, ?, ?)
-    """, (mood.lower(), description, intensity, timestamp))
-    
-    conn.commit()
-    conn.close()
+    with write_cursor() as cursor:
+        timestamp = datetime.datetime.now().isoformat()
+        
+        if description is None:
+            # Generate description based on mood
+            mood_descriptions = {
+                'chill': 'Relaxed and casual',
+                'excited': 'Energetic and enthusiastic',
+                'focused': 'Serious and attentive',
+                'sarcastic': 'Playfully snarky',
+                'helpful': 'Eager to assist',
+                'curious': 'Interested and inquisitive',
+                'tired': 'Low energy, less talkative',
+                'happy': 'Positive and upbeat'
+            }
+            description = mood_descriptions.get(mood.lower(), f'Currently feeling {mood}')
+        
+        cursor.execute("""
+            INSERT INTO mood (mood, description, intensity, updated_at)
+            VALUES (?, ?, ?, ?)
+        """, (mood.lower(), description, intensity, timestamp))
+    _state_cache.invalidate()
 
 def format_mood() -> str:
-    """Format current mood for use in prompts."""
+    """Format current mood for use in prompts (cached until the mood table changes)."""
+    return _state_cache.get('mood', _format_mood)
+
+def _format_mood() -> str:
     mood_data = get_mood()
     return f"Current mood: {mood_data['mood']} ({mood_data['description']}, intensity: {mood_data['intensity']:.1f})"
 
@@ -325,34 +1331,183 @@ def get_recent_happenings() -> str:
     
     cursor.execute("SELECT content FROM recent_happenings ORDER BY updated_at DESC LIMIT 1")
     row = cursor.fetchone()
-    conn.close()
     
     return row['content'] if row else ""
 
 def set_recent_happenings(content: str):
     """Set the recent happenings summary. Max 1000 tokens (~750 words)."""
+    with write_cursor() as cursor:
+        timestamp = datetime.datetime.now().isoformat()
+        
+        # Truncate if too long (rough estimate: 1 token ≈ 0.75 words, so 1000 tokens ≈ 750 words)
+        # Being conservative, limit to ~600 words or ~4500 chars
+        if len(content) > 4500:
+            content = content[:4500] + "..."
+        
+        cursor.execute("""
+            INSERT INTO recent_happenings (content, updated_at)
+            VALUES (?, ?)
+        """, (content, timestamp))
+    _state_cache.invalidate()
+
+def format_recent_happenings() -> str:
+    """Format recent happenings for use in prompts (cached until the table changes)."""
+    return _state_cache.get('happenings', _format_recent_happenings)
+
+def _format_recent_happenings() -> str:
+    happenings = get_recent_happenings()
+    if not happenings:
+        return ""
+    return f"Recent happenings across the server:\n{happenings}"
+
+# Channel summary functions
+def get_channel_summary(channel_id: int) -> Optional[Dict]:
+    """The channel's rolling summary (summary, through_ts, folded, updated_at), or None."""
+    row = get_db_connection().execute(
+        "SELECT summary, through_ts, folded, updated_at FROM channel_summaries WHERE channel_id = ?",
+        (channel_id,)).fetchone()
+    return dict(row) if row else None
+
+def save_channel_summary(channel_id: int, summary: str, through_ts: int, folded: int):
+    """Replace the channel's summary; folded is how many messages the new one added."""
+    with write_cursor() as cursor:
+        cursor.execute("""
+            INSERT INTO channel_summaries (channel_id, summary, through_ts, folded, updated_at)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(channel_id) DO UPDATE SET
+                summary = excluded.summary,
+                through_ts = excluded.through_ts,
+                folded = channel_summaries.folded + excluded.folded,
+                updated_at = excluded.updated_at
+        """, (channel_id, summary, through_ts, folded, datetime.datetime.now().isoformat()))
+
+def get_channel_summaries() -> List[Dict]:
+    """Every channel summary, most recently updated first."""
+    rows = get_db_connection().execute(
+        "SELECT channel_id, summary, through_ts, folded, updated_at FROM channel_summaries ORDER BY updated_at DESC")
+    return [dict(row) for row in rows]
+
+# Classification log functions
+def log_classification(channel_id: int, message_id: Optional[int], content: str, responded: bool,
+                       source: str = "llm", gate_score: Optional[float] = None):
+    """Record a respond/stay-quiet decision.
+    
+    source is "llm" for Grid decisions (training data), "gate" for messages the
+    local relevance gate filtered out, and "forced" for mentions/replies."""
+    with write_cursor() as cursor:
+        cursor.execute("""
+            INSERT INTO classification_log (channel_id, message_id, content, responded, source, gate_score, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (channel_id, message_id, content, 1 if responded else 0, source, gate_score,
+              datetime.datetime.now().isoformat()))
+
+def get_classification_log(source: str = "llm", limit: int = 5000) -> List[Dict]:
+    """Get the most recent logged decisions from one source, oldest first."""
     conn = get_db_connection()
     cursor = conn.cursor()
     
-    timestamp = datetime.datetime.now().isoformat()
+    cursor.execute("""
+        SELECT content, responded FROM classification_log
+        WHERE source = ?
+        ORDER BY id DESC LIMIT ?
+    """, (source, limit))
+    rows = cursor.fetchall()
     
-    # Truncate if too long (rough estimate: 1 token ≈ 0.75 words, so 1000 tokens ≈ 750 words)
-    # Being conservative, limit to ~600 words or ~4500 chars
-    if len(content) > 4500:
-        content = content[:4500] + "..."
+    return [{'content': row['content'], 'responded': bool(row['responded'])} for row in reversed(rows)]
+
+# Link verdict functions
+def get_link_verdicts(keys: List[tuple]) -> Dict[tuple, Dict]:
+    """Get unexpired verdicts for (key_type, key) pairs, keyed the same way."""
+    if not keys:
+        return {}
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    clauses = " OR ".join(["(key_type = ? AND key = ?)"] * len(keys))
+    params = [part for pair in keys for part in pair]
+    cursor.execute(f"""
+        SELECT key_type, key, is_scam, reason, source, expires_at FROM link_verdicts
+        WHERE ({clauses}) AND (expires_at IS NULL OR expires_at > ?)
+    """, params + [datetime.datetime.now().timestamp()])
+    rows = cursor.fetchall()
+    
+    return {
+        (row['key_type'], row['key']): {
+            'is_scam': bool(row['is_scam']),
+            'reason': row['reason'],
+            'source': row['source'],
+            'expires_at': row['expires_at'],
+        }
+        for row in rows
+    }
+
+def save_link_verdict(key_type: str, key: str, is_scam: bool, reason: str, source: str,
+                      ttl_seconds: Optional[float] = None, domain: Optional[str] = None):
+    """Store a verdict. ttl_seconds=None never expires. Automatic verdicts
+    never replace an admin override."""
+    with write_cursor() as cursor:
+        now = datetime.datetime.now()
+        expires_at = now.timestamp() + ttl_seconds if ttl_seconds is not None else None
+        cursor.execute("""
+            INSERT INTO link_verdicts (key_type, key, domain, is_scam, reason, source, created_at, expires_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(key_type, key) DO UPDATE SET
+                domain = excluded.domain,
+                is_scam = excluded.is_scam,
+                reason = excluded.reason,
+                source = excluded.source,
+                created_at = excluded.created_at,
+                expires_at = excluded.expires_at
+            WHERE link_verdicts.source != 'admin' OR excluded.source = 'admin'
+        """, (key_type, key, domain, 1 if is_scam else 0, reason, source, now.isoformat(), expires_at))
+
+def count_domain_url_verdicts(domain: str) -> Dict[str, int]:
+    """Count unexpired URL verdicts under a registered domain: {'safe': n, 'scam': n}."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
     
     cursor.execute("""
-        INSERT INTO recent_happenings (content, updated_at)
-        VALUES (?, ?)
-    """, (content, timestamp))
+        SELECT is_scam, COUNT(*) as count FROM link_verdicts
+        WHERE key_type = 'url' AND domain = ? AND (expires_at IS NULL OR expires_at > ?)
+        GROUP BY is_scam
+    """, (domain, datetime.datetime.now().timestamp()))
+    rows = cursor.fetchall()
     
-    conn.commit()
-    conn.close()
+    counts = {'safe': 0, 'scam': 0}
+    for row in rows:
+        counts['scam' if row['is_scam'] else 'safe'] = row['count']
+    return counts
 
-def format_recent_happenings() -> str:
-    """Format recent happenings for use in prompts."""
-    happenings = get_recent_happenings()
-    if not happenings:
-        return ""
-    return f"Recent happenings across the server:\n{happenings}"
+def delete_link_verdict(key_type: str, key: str) -> bool:
+    """Delete a cached verdict or override."""
+    with write_cursor() as cursor:
+        cursor.execute("DELETE FROM link_verdicts WHERE key_type = ? AND key = ?", (key_type, key))
+        deleted = cursor.rowcount > 0
+    return deleted
+
+# Scam example functions
+def get_scam_examples() -> List[Dict]:
+    """Get every stored scam example, oldest first. embedding is raw float32 bytes or None."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    cursor.execute("SELECT id, content, reason, source, embedding FROM scam_examples ORDER BY id")
+    rows = cursor.fetchall()
+    
+    return [dict(row) for row in rows]
+
+def add_scam_example(content: str, reason: str, source: str, embedding: Optional[bytes] = None) -> Optional[int]:
+    """Store a scam example. Returns its id, or None if the same text is already stored."""
+    with write_cursor() as cursor:
+        cursor.execute("""
+            INSERT INTO scam_examples (content, reason, source, embedding, created_at)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(content) DO NOTHING
+        """, (content, reason, source, embedding, datetime.datetime.now().isoformat()))
+        example_id = cursor.lastrowid if cursor.rowcount > 0 else None
+    return example_id
 
+def set_scam_example_embedding(example_id: int, embedding: bytes):
+    """Store (or replace) the embedding of a scam example."""
+    with write_cursor() as cursor:
+        cursor.execute("UPDATE scam_examples SET embedding = ? WHERE id = ?", (embedding, example_id))
@@ -0,0 +1,127 @@
+"""
+Async front end for conversation_db, so SQLite I/O never runs on the event loop.
+
+Reads run on a small dedicated thread pool (WAL lets them run alongside the
+writer). Writes go on a queue drained by a single writer thread: the caller
+doesn't wait for the disk, and writes land in the order they were queued.
+flush() is a barrier for the rare caller that needs its writes on disk (it
+also commits chat messages waiting in conversation_db's group-commit buffer).
+
+Mood, memories and recent happenings are answered on the loop itself while
+conversation_db's state cache knows they're current.
+
+Every operation is timed per function (queue wait + run) and a monitor task
+samples event-loop lag, so !stats shows disk latency staying off the loop.
+"""
+import asyncio
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable
+
+from conversation_db import (close_db_connections, flush_messages, message_buffer_report, history_cache_report,
+                             cached_state, state_cache_report)
+from pipeline_metrics import PipelineMetrics
+
+# Threads serving reads
+DB_READ_THREADS = int(os.getenv('DB_READ_THREADS', '2'))
+# How often (seconds) the event-loop lag monitor wakes up
+LOOP_LAG_INTERVAL = 0.5
+
+_STOP = object()
+
+class ConversationStore:
+    """Reads on a thread pool, writes on one queue-fed writer thread."""
+
+    def __init__(self, read_threads: int = DB_READ_THREADS):
+        self.reads = ThreadPoolExecutor(max_workers=max(1, read_threads), thread_name_prefix='db-read')
+        self.writes = queue.Queue()
+        self.writer = threading.Thread(target=self._write_loop, name='db-write', daemon=True)
+        self.writer.start()
+        self.metrics = PipelineMetrics()
+        self.write_errors = 0
+        self.lag_task = None
+
+    def _timed(self, fn: Callable, args, kwargs, queued_at: float):
+        """Run fn, recording its latency from the moment it was queued."""
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self.metrics.record(fn.__name__, (time.perf_counter() - queued_at) * 1000)
+
+    async def read(self, fn: Callable, *args, **kwargs):
+        """Run a conversation_db read on the read pool and return its result."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.reads, self._timed, fn, args, kwargs, time.perf_counter())
+
+    async def read_state(self, name: str, fn: Callable):
+        """Mood, memories or happenings prompt text: straight from the state
+        cache when it's current (no thread hop, no query), else fn on the read pool."""
+        cached = cached_state(name)
+        if cached is not None:
+            return cached
+        return await self.read(fn)
+
+    def write_nowait(self, fn: Callable, *args, **kwargs) -> Future:
+        """Queue a write and return immediately. Errors are logged by the writer."""
+        future = Future()
+        self.writes.put((fn, args, kwargs, time.perf_counter(), future))
+        return future
+
+    async def write(self, fn: Callable, *args, **kwargs):
+        """Queue a write and wait for it to land, returning its result."""
+        return await asyncio.wrap_future(self.write_nowait(fn, *args, **kwargs))
+
+    async def flush(self):
+        """Wait until every write queued so far, and every buffered message, is on disk."""
+        await self.write(flush_messages)
+
+    def _write_loop(self):
+        while True:
+            item = self.writes.get()
+            if item is _STOP:
+                return
+            fn, args, kwargs, queued_at, future = item
+            # A caller that stopped waiting still gets its write; it just won't see the result
+            waiting = future.set_running_or_notify_cancel()
+            try:
+                result = self._timed(fn, args, kwargs, queued_at)
+            except Exception as e:
+                self.write_errors += 1
+                print(f"Error in database write {fn.__name__}: {e}")
+                if waiting:
+                    future.set_exception(e)
+                continue
+            if waiting:
+                future.set_result(result)
+
+    async def monitor_loop_lag(self, interval: float = LOOP_LAG_INTERVAL):
+        """Record how late the event loop wakes up from a timed sleep."""
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(interval)
+            self.metrics.record("event loop lag", (time.perf_counter() - started - interval) * 1000)
+
+    def start_lag_monitor(self):
+        if self.lag_task is None or self.lag_task.done():
+            self.lag_task = asyncio.create_task(self.monitor_loop_lag())
+
+    def close(self, timeout: float = 10.0):
+        """Finish queued writes, stop the threads and close the connections (shutdown)."""
+        if self.lag_task is not None:
+            self.lag_task.cancel()
+        pending = self.writes.qsize()
+        self.writes.put(_STOP)
+        self.writer.join(timeout)
+        self.reads.shutdown(wait=True)
+        flush_messages()
+        close_db_connections()
+        print(f"Conversation store closed ({pending} queued write(s) flushed)")
+
+    def report(self) -> list:
+        lines = [f"Conversation store: {self.writes.qsize()} writes queued, {self.write_errors} failed",
+                 "  " + message_buffer_report(), "  " + history_cache_report(), "  " + state_cache_report()]
+        lines += [f"  {name}: {stats.summary()}" for name, stats in sorted(self.metrics.stages.items())]
+        return lines
@@ -0,0 +1,113 @@
+"""
+Background maintenance for conversations.db.
+
+Without it the database only grows: every chat message, classification and
+mood change adds a row. Each run (every MAINTENANCE_INTERVAL_MINUTES, first
+one shortly after startup):
+
+1. archives messages older than MESSAGE_RETENTION_DAYS to a gzipped JSONL
+   segment in MESSAGE_ARCHIVE_DIR, then deletes them
+2. deletes expired link verdicts and trims the classification log
+3. prunes superseded mood and recent_happenings rows
+4. merges full-text index segments a step at a time
+5. returns freed pages to the filesystem (incremental vacuum) and truncates the WAL.
+   A database created before incremental auto-vacuum can't do that until it's
+   converted by a full VACUUM, which only runs with MAINTENANCE_CONVERT_AUTO_VACUUM
+
+Every delete is a short batch (conversation_db.RETENTION_BATCH rows), so chat
+writes queued behind it wait milliseconds, not the whole run. The run itself
+is blocking and happens on a worker thread, never on the event loop.
+"""
+import asyncio
+import datetime
+import os
+import time
+from typing import Dict, Optional
+
+from conversation_db import (cleanup_old_messages, cleanup_expired_link_verdicts, trim_classification_log,
+                             prune_superseded_state, merge_message_fts, compact_db, db_size_info)
+
+MAINTENANCE_ENABLED = os.getenv('MAINTENANCE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+MAINTENANCE_INTERVAL_MINUTES = float(os.getenv('MAINTENANCE_INTERVAL_MINUTES', '60'))
+# Chat messages older than this are archived and deleted
+MESSAGE_RETENTION_DAYS = int(os.getenv('MESSAGE_RETENTION_DAYS', '30'))
+# Where archived messages go; empty deletes them without an archive
+MESSAGE_ARCHIVE_DIR = os.getenv('MESSAGE_ARCHIVE_DIR', 'archive')
+# Logged respond/stay-quiet decisions kept per source
+CLASSIFICATION_LOG_KEEP = int(os.getenv('CLASSIFICATION_LOG_KEEP', '20000'))
+# Free pages handed back per run (4KB each)
+MAINTENANCE_VACUUM_PAGES = int(os.getenv('MAINTENANCE_VACUUM_PAGES', '25000'))
+# Convert an older database to incremental auto-vacuum with one full VACUUM (writes wait while it runs)
+MAINTENANCE_CONVERT_AUTO_VACUUM = os.getenv('MAINTENANCE_CONVERT_AUTO_VACUUM', 'false').lower() in ('1', 'true', 'yes')
+# Give startup (init_db, ts backfill, gate training) a head start
+MAINTENANCE_FIRST_DELAY = 120
+
+class MaintenanceScheduler:
+    """Runs retention, archival and compaction on a fixed interval."""
+
+    def __init__(self, interval_minutes: float = MAINTENANCE_INTERVAL_MINUTES,
+                 retention_days: int = MESSAGE_RETENTION_DAYS, archive_dir: str = MESSAGE_ARCHIVE_DIR,
+                 enabled: bool = MAINTENANCE_ENABLED):
+        self.interval = interval_minutes * 60
+        self.retention_days = retention_days
+        self.archive_dir = archive_dir or None
+        self.enabled = enabled
+        self.task = None
+        self.runs = 0
+        self.failures = 0
+        self.totals = {'messages': 0, 'link_verdicts': 0, 'classifications': 0, 'state_rows': 0, 'pages': 0}
+        self.last_run: Optional[Dict] = None
+
+    def run_once(self) -> Dict:
+        """One full maintenance pass. Blocking - run it off the event loop."""
+        started = time.perf_counter()
+        result = {
+            'messages': cleanup_old_messages(self.retention_days, archive_dir=self.archive_dir),
+            'link_verdicts': cleanup_expired_link_verdicts(),
+            'classifications': trim_classification_log(CLASSIFICATION_LOG_KEEP),
+            'state_rows': sum(prune_superseded_state().values()),
+        }
+        merge_message_fts()
+        result['pages'] = compact_db(MAINTENANCE_VACUUM_PAGES, convert=MAINTENANCE_CONVERT_AUTO_VACUUM)
+        for key, count in result.items():
+            self.totals[key] += count
+        result['seconds'] = time.perf_counter() - started
+        result['at'] = datetime.datetime.now()
+        result.update(db_size_info())
+        self.runs += 1
+        self.last_run = result
+        print(f"🧹 Database maintenance: {result['messages']} messages archived/deleted, "
+              f"{result['link_verdicts']} expired link verdicts, {result['classifications']} old classifications, "
+              f"{result['state_rows']} old mood/happenings rows, {result['pages']} pages freed "
+              f"in {result['seconds']:.1f}s (now {result['size'] / 2**20:.1f}MB)")
+        return result
+
+    async def run_forever(self):
+        await asyncio.sleep(MAINTENANCE_FIRST_DELAY)
+        while True:
+            try:
+                await asyncio.to_thread(self.run_once)
+            except Exception as e:
+                self.failures += 1
+                print(f"Error in database maintenance: {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self.enabled and (self.task is None or self.task.done()):
+            self.task = asyncio.create_task(self.run_forever())
+
+    def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+
+    def report(self) -> str:
+        if not self.enabled:
+            return "Database maintenance: disabled"
+        if self.last_run is None:
+            return f"Database maintenance: not run yet (every {self.interval / 60:.0f}m, keeping {self.retention_days}d)"
+        last = self.last_run
+        t = self.totals
+        return (f"Database maintenance: {self.runs} runs ({self.failures} failed), last {last['at']:%H:%M} "
+                f"in {last['seconds']:.1f}s; db {last['size'] / 2**20:.1f}MB ({last['free'] / 2**20:.1f}MB free, "
+                f"WAL {last['wal'] / 2**20:.1f}MB); removed {t['messages']} messages, {t['link_verdicts']} link verdicts, "
+                f"{t['classifications']} classifications, {t['state_rows']} mood/happenings rows")
@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the AI Power Grid text API, for tests and load runs.
+
+Implements the endpoints GridClient uses:
+  POST   /api/v2/generate/text/async        submit a generation (202 + id)
+  GET    /api/v2/generate/text/status/{id}  poll it
+  DELETE /api/v2/generate/text/status/{id}  cancel it
+plus GET /fake/stats with counters for load runs.
+
+Jobs wait in a simulated queue, get picked up by a fixed pool of fake
+workers, and take a random processing time. Faults, HTTP errors and
+stalled jobs can be injected at configurable rates.
+
+Usage:
+  python fake_grid_server.py --port 7001 --workers 4 --processing lognormal:1.0,0.5
+  GRID_API_BASE_URL=http://localhost:7001/api python bot.py
+"""
+import argparse
+import json
+import random
+import time
+import uuid
+from typing import Dict, Any, List, Optional
+
+from aiohttp import web
+
+DEFAULT_CANNED_OUTPUTS = ['{"respond": false}']
+# Jobs nobody polled to the end or cancelled (e.g. stalled, client gone) are dropped this long after submit
+JOB_TTL_SECONDS = 600
+
+def parse_distribution(spec: str):
+    """Turn "fixed:2", "uniform:1,5", "exp:3" or "lognormal:mu,sigma" into a sampler (seconds)."""
+    kind, _, args = spec.partition(':')
+    values = [float(v) for v in args.split(',') if v.strip()] if args else []
+    kind = kind.strip().lower()
+
+    if kind == 'fixed':
+        return lambda rng: values[0]
+    if kind == 'uniform':
+        return lambda rng: rng.uniform(values[0], values[1])
+    if kind == 'exp':
+        return lambda rng: rng.expovariate(1.0 / values[0])
+    if kind == 'lognormal':
+        return lambda rng: rng.lognormvariate(values[0], values[1])
+    raise ValueError(f"Unknown distribution '{spec}' (use fixed:, uniform:, exp: or lognormal:)")
+
+class FakeGrid:
+    """In-memory job table with simulated queueing, workers and faults."""
+
+    def __init__(self, queue_delay: float = 0.0, processing: str = 'fixed:2',
+                 model_processing: Optional[Dict[str, str]] = None, workers: int = 4,
+                 fault_rate: float = 0.0, stall_rate: float = 0.0,
+                 submit_error_rate: float = 0.0, status_error_rate: float = 0.0,
+                 output_mode: str = 'canned', canned_outputs: Optional[List[str]] = None,
+                 require_apikey: bool = True, seed: Optional[int] = None, job_ttl: float = JOB_TTL_SECONDS):
+        self.rng = random.Random(seed)
+        self.queue_delay = queue_delay
+        self.processing = parse_distribution(processing)
+        self.model_processing = {
+            model: parse_distribution(spec) for model, spec in (model_processing or {}).items()
+        }
+        self.worker_free_at = [0.0] * max(1, workers)
+        self.fault_rate = fault_rate
+        self.stall_rate = stall_rate
+        self.submit_error_rate = submit_error_rate
+        self.status_error_rate = status_error_rate
+        self.output_mode = output_mode
+        self.canned_outputs = canned_outputs or DEFAULT_CANNED_OUTPUTS
+        self.require_apikey = require_apikey
+        self.jobs = {}  # Oldest submit first
+        self.job_ttl = job_ttl
+        self.stats = {
+            'submitted': 0,
+            'submit_errors': 0,
+            'status_polls': 0,
+            'status_errors': 0,
+            'completed': 0,
+            'faulted': 0,
+            'cancelled': 0,
+            'cancelled_after_finish': 0,
+            'expired': 0,
+        }
+        self._canned_index = 0
+
+    def _output_for(self, prompt: str, max_length: int) -> str:
+        if self.output_mode == 'echo':
+            # Roughly max_length tokens' worth of the prompt's tail
+            return prompt.strip()[-max_length * 4:]
+        text = self.canned_outputs[self._canned_index % len(self.canned_outputs)]
+        self._canned_index += 1
+        return text
+
+    def _expire_jobs(self, now: float):
+        while self.jobs:
+            job_id, job = next(iter(self.jobs.items()))
+            if now - job['submitted_at'] < self.job_ttl:
+                break
+            del self.jobs[job_id]
+            self.stats['expired'] += 1
+
+    def submit(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        now = time.monotonic()
+        self._expire_jobs(now)
+        models = body.get('models') or ['fake/model']
+        model = models[0]
+        params = body.get('params') or {}
+        sampler = self.model_processing.get(model, self.processing)
+
+        # Earliest free fake worker takes the job once it has sat in the queue
+        worker = min(range(len(self.worker_free_at)), key=self.worker_free_at.__getitem__)
+        start_at = max(now + self.queue_delay, self.worker_free_at[worker])
+        stalled = self.rng.random() < self.stall_rate
+        done_at = float('inf') if stalled else start_at + max(0.0, sampler(self.rng))
+        if not stalled:
+            self.worker_free_at[worker] = done_at
+
+        job_id = str(uuid.uuid4())
+        self.jobs[job_id] = {
+            'model': model,
+            'submitted_at': now,
+            'start_at': start_at,
+            'done_at': done_at,
+            'faulted': self.rng.random() < self.fault_rate,
+            'text': self._output_for(body.get('prompt', ''), int(params.get('max_length', 512))),
+        }
+        self.stats['submitted'] += 1
+        return {'id': job_id, 'kudos': 1}
+
+    def status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = self.jobs.get(job_id)
+        if job is None:
+            return None
+
+        now = time.monotonic()
+        if now < job['start_at']:
+            return {'done': False, 'faulted': False, 'waiting': 1, 'processing': 0, 'finished': 0,
+                    'queue_position': 1, 'wait_time': int(job['start_at'] - now)}
+        if now < job['done_at']:
+            return {'done': False, 'faulted': False, 'waiting': 0, 'processing': 1, 'finished': 0}
+        if job['faulted']:
+            return {'done': False, 'faulted': True, 'faulted_message': 'Fake worker faulted',
+                    'waiting': 0, 'processing': 0, 'finished': 0}
+        return {
+            'done': True, 'faulted': False, 'waiting': 0, 'processing': 0, 'finished': 1,
+            'generations': [{'text': job['text'], 'model': job['model'], 'worker_id': 'fake-worker',
+                             'worker_name': 'fake-grid-server', 'state': 'ok'}],
+        }
+
+    def poll(self, job_id: str) -> Optional[Dict[str, Any]]:
+        status = self.status(job_id)
+        if status is None:
+            return None
+        # A job is forgotten once its final status has been read, like a finished job on the Grid
+        if status.get('done'):
+            del self.jobs[job_id]
+            self.stats['completed'] += 1
+        elif status.get('faulted'):
+            del self.jobs[job_id]
+            self.stats['faulted'] += 1
+        return status
+
+    def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        status = self.status(job_id)
+        if status is None:
+            return None
+        del self.jobs[job_id]
+        if status.get('done'):
+            self.stats['cancelled_after_finish'] += 1
+        else:
+            self.stats['cancelled'] += 1
+        return status
+
+def create_app(grid: FakeGrid) -> web.Application:
+    """Build the aiohttp app around a FakeGrid (importable for tests)."""
+
+    def unauthorized(request):
+        return grid.require_apikey and not request.headers.get('apikey')
+
+    async def submit(request):
+        if unauthorized(request):
+            return web.json_response({'message': 'No API key provided'}, status=401)
+        if grid.rng.random() < grid.submit_error_rate:
+            grid.stats['submit_errors'] += 1
+            return web.json_response({'message': 'Injected submit failure'}, status=500)
+        try:
+            body = await request.json()
+        except json.JSONDecodeError:
+            return web.json_response({'message': 'Invalid JSON'}, status=400)
+        if not body.get('prompt'):
+            return web.json_response({'message': 'Missing prompt'}, status=400)
+        return web.json_response(grid.submit(body), status=202)
+
+    async def status(request):
+        grid.stats['status_polls'] += 1
+        if grid.rng.random() < grid.status_error_rate:
+            grid.stats['status_errors'] += 1
+            return web.json_response({'message': 'Injected status failure'}, status=500)
+        result = grid.poll(request.match_info['job_id'])
+        if result is None:
+            return web.json_response({'message': 'Generation not found'}, status=404)
+        return web.json_response(result)
+
+    async def cancel(request):
+        result = grid.cancel(request.match_info['job_id'])
+        if result is None:
+            return web.json_response({'message': 'Generation not found'}, status=404)
+        return web.json_response(result)
+
+    async def stats(request):
+        return web.json_response(dict(grid.stats, pending=len(grid.jobs)))
+
+    app = web.Application()
+    app.router.add_post('/api/v2/generate/text/async', submit)
+    app.router.add_get('/api/v2/generate/text/status/{job_id}', status)
+    app.router.add_delete('/api/v2/generate/text/status/{job_id}', cancel)
+    app.router.add_get('/fake/stats', stats)
+    return app
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a fake AI Power Grid text API locally')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=7001)
+    parser.add_argument('--workers', type=int, default=4, help='Number of fake workers (jobs beyond this queue up)')
+    parser.add_argument('--queue-delay', type=float, default=0.0, help='Minimum seconds a job waits before a worker picks it up')
+    parser.add_argument('--processing', default='fixed:2',
+                        help='Processing time distribution: fixed:S, uniform:A,B, exp:MEAN or lognormal:MU,SIGMA')
+    parser.add_argument('--model-processing', action='append', default=[], metavar='MODEL=DIST',
+                        help='Per-model processing distribution override (repeatable)')
+    parser.add_argument('--fault-rate', type=float, default=0.0, help='Share of jobs that end faulted')
+    parser.add_argument('--stall-rate', type=float, default=0.0, help='Share of jobs that never finish')
+    parser.add_argument('--submit-error-rate', type=float, default=0.0, help='Share of submits answered with HTTP 500')
+    parser.add_argument('--status-error-rate', type=float, default=0.0, help='Share of status polls answered with HTTP 500')
+    parser.add_argument('--output-mode', choices=['canned', 'echo'], default='canned',
+                        help='canned: cycle through --canned outputs; echo: return the tail of the prompt')
+    parser.add_argument('--canned', action='append', default=[], help='Canned output text (repeatable)')
+    parser.add_argument('--canned-file', help='JSON list of canned outputs')
+    parser.add_argument('--no-auth', action='store_true', help="Don't require an apikey header")
+    parser.add_argument('--seed', type=int, help='Random seed for repeatable runs')
+    parser.add_argument('--job-ttl', type=float, default=JOB_TTL_SECONDS,
+                        help='Seconds after submit a job that was never polled to the end or cancelled is dropped')
+    args = parser.parse_args()
+
+    canned = list(args.canned)
+    if args.canned_file:
+        with open(args.canned_file, encoding='utf-8') as f:
+            canned.extend(json.load(f))
+
+    model_processing = {}
+    for item in args.model_processing:
+        model, _, spec = item.partition('=')
+        model_processing[model] = spec
+
+    grid = FakeGrid(
+        queue_delay=args.queue_delay,
+        processing=args.processing,
+        model_processing=model_processing,
+        workers=args.workers,
+        fault_rate=args.fault_rate,
+        stall_rate=args.stall_rate,
+        submit_error_rate=args.submit_error_rate,
+        status_error_rate=args.status_error_rate,
+        output_mode=args.output_mode,
+        canned_outputs=canned or None,
+        require_apikey=not args.no_auth,
+        seed=args.seed,
+        job_ttl=args.job_ttl,
+    )
+    print(f"Fake Grid API on http://{args.host}:{args.port}/api ({args.workers} workers, processing {args.processing})")
+    web.run_app(create_app(grid), host=args.host, port=args.port, print=None)
+
+if __name__ == "__main__":
+    main()
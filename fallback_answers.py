@@ -0,0 +1,89 @@
+"""
+Non-LLM answers for when AI Power Grid is unavailable.
+Matches questions against the FAQ document first, then falls back to
+quoting the best retrieved documentation chunk.
+"""
+import os
+import re
+from typing import List, Dict, Any, Optional
+
+FAQ_DIR = 'docs'
+FAQ_MIN_SCORE = 0.35  # Share of the question's keywords that must appear in the FAQ question
+MAX_FALLBACK_CHARS = 1500  # Stay well under Discord's 2000 character limit
+
+STOPWORDS = {
+    'a', 'an', 'the', 'is', 'are', 'was', 'were', 'do', 'does', 'did', 'i', 'you', 'we',
+    'to', 'of', 'in', 'on', 'for', 'and', 'or', 'it', 'my', 'me', 'can', 'how', 'what',
+    'where', 'when', 'why', 'which', 'who', 'with', 'be', 'this', 'that', 'there', 'about',
+    'any', 'have', 'has', 'get', 'so', 'if', 'at', 'by', 'from', 'your', 'our',
+}
+
+def _keywords(text: str) -> set:
+    words = re.findall(r"[a-z0-9]+", text.lower())
+    return {w for w in words if w not in STOPWORDS and len(w) > 1}
+
+class FAQIndex:
+    """Question/answer pairs parsed from the FAQ markdown docs ("### Question" headings)."""
+
+    def __init__(self, docs_dir: str = FAQ_DIR):
+        self.entries = []  # [(question, answer, keywords)]
+        if not os.path.isdir(docs_dir):
+            return
+        for filename in sorted(os.listdir(docs_dir)):
+            if 'faq' in filename.lower() and filename.endswith(('.md', '.mdx')):
+                with open(os.path.join(docs_dir, filename), encoding='utf-8') as f:
+                    self._parse(f.read())
+        print(f"Loaded {len(self.entries)} FAQ entries for fallback answers")
+
+    def _parse(self, markdown: str):
+        question, lines = None, []
+        for line in markdown.splitlines() + ['### ']:
+            if line.startswith('#'):
+                if question and any(l.strip() for l in lines):
+                    answer = "\n".join(lines).strip()
+                    self.entries.append((question, answer, _keywords(question)))
+                question = line.lstrip('#').strip() if line.startswith('### ') else None
+                lines = []
+            elif question:
+                lines.append(line)
+
+    def match(self, question: str) -> Optional[Dict[str, Any]]:
+        """Best FAQ entry for a question, or None if nothing is close enough."""
+        asked = _keywords(question)
+        if not asked:
+            return None
+
+        best, best_score = None, 0.0
+        for faq_question, answer, keywords in self.entries:
+            if not keywords:
+                continue
+            overlap = len(asked & keywords)
+            # Reward covering both the user's words and the FAQ question's words
+            score = (overlap / len(asked) + overlap / len(keywords)) / 2
+            if score > best_score:
+                best, best_score = (faq_question, answer), score
+
+        if best is None or best_score < FAQ_MIN_SCORE:
+            return None
+        return {'question': best[0], 'answer': best[1], 'score': best_score}
+
+def _clip(text: str, limit: int = MAX_FALLBACK_CHARS) -> str:
+    text = text.strip()
+    if len(text) <= limit:
+        return text
+    return text[:limit].rsplit(' ', 1)[0] + "..."
+
+def build_fallback_answer(question: str, context: List[Dict[str, Any]],
+                          faq: Optional[FAQIndex] = None) -> str:
+    """Answer without the LLM: FAQ match, else the top retrieved chunk, else an apology."""
+    if faq is not None:
+        hit = faq.match(question)
+        if hit:
+            return _clip(f"(AI's taking a break, so here's the FAQ answer)\n**{hit['question']}**\n{hit['answer']}")
+
+    if context:
+        top = context[0]
+        source = top.get('source', 'docs')
+        return _clip(f"(AI's taking a break, here's the closest thing from the docs - {source})\n{top['text']}")
+
+    return "can't reach AI Power Grid right now, try again in a bit"
@@ -2,38 +2,299 @@ import os
 import json
 import time
 import re
+import asyncio
 import requests
-from typing import List, Dict, Any
+from collections import deque
+from typing import List, Dict, Any, Optional
 from dotenv import load_dotenv
+from prompt_builder import PromptBuilder, MAX_CONTEXT_LENGTH, MAX_LENGTH
 
 # Load environment variables
 load_dotenv()
 GRID_API_KEY = os.getenv('GRID_API_KEY')
 GRID_MODEL = os.getenv('GRID_MODEL', 'grid/meta-llama/llama-4-maverick-17b-128e-instruct')
 
-# API endpoints from example
-TEXT_GENERATION_ENDPOINT = 'https://api.aipowergrid.io/api/v2/generate/text/async'
-TEXT_GENERATION_STATUS_ENDPOINT = 'https://api.aipowergrid.io/api/v2/generate/text/status'
+# Ordered candidate models (comma-separated). Falls back to the single GRID_MODEL.
+GRID_MODELS = [m.strip() for m in os.getenv('GRID_MODELS', '').split(',') if m.strip()] or [GRID_MODEL]
+
+# Hedging: if the first request is slower than the model's usual p90, send a
+# second request to the next candidate and keep whichever answers first
+GRID_HEDGE_ENABLED = os.getenv('GRID_HEDGE_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+GRID_HEDGE_DEFAULT_DELAY = float(os.getenv('GRID_HEDGE_DEFAULT_DELAY', '20'))  # Used until we have latency samples
+GRID_HEDGE_MIN_DELAY = float(os.getenv('GRID_HEDGE_MIN_DELAY', '5'))
+GRID_HEDGE_MAX_DELAY = float(os.getenv('GRID_HEDGE_MAX_DELAY', '60'))
+
+# Circuit breaker: stop calling the Grid for a while once recent calls mostly fail or stall
+GRID_BREAKER_FAILURE_RATE = float(os.getenv('GRID_BREAKER_FAILURE_RATE', '0.5'))
+GRID_BREAKER_SLOW_SECONDS = float(os.getenv('GRID_BREAKER_SLOW_SECONDS', '60'))
+GRID_BREAKER_OPEN_SECONDS = float(os.getenv('GRID_BREAKER_OPEN_SECONDS', '60'))
+
+# Per-HTTP-call timeout so a stalled API can't hang a request forever
+GRID_HTTP_TIMEOUT = float(os.getenv('GRID_HTTP_TIMEOUT', '15'))
+
+# Returned by get_answer while the breaker is open (or half-open with its probe slots taken)
+GRID_UNAVAILABLE_MESSAGE = "Error: AI Power Grid is temporarily unavailable"
+
+# Instruction text get_answer wraps around every question (for token budgeting)
+ANSWER_PROMPT_OVERHEAD = """You are a helpful assistant answering questions about AI Power Grid.
+Use only the following context and previous conversation to answer the question. 
+If you don't know the answer based on the context, respond naturally like "not sure about that" or "can't find info on that" - be casual, not formal.
+CONTEXT:
+CONVERSATION HISTORY AND CURRENT QUESTION:
+ANSWER:"""
+
+# API endpoints from example. Point GRID_API_BASE_URL at fake_grid_server.py for local runs.
+GRID_API_BASE_URL = os.getenv('GRID_API_BASE_URL', 'https://api.aipowergrid.io/api').rstrip('/')
+TEXT_GENERATION_ENDPOINT = f'{GRID_API_BASE_URL}/v2/generate/text/async'
+TEXT_GENERATION_STATUS_ENDPOINT = f'{GRID_API_BASE_URL}/v2/generate/text/status'
+
+def is_error_response(text: str) -> bool:
+    """True for the error strings get_answer and generate return in place of text."""
+    return text.startswith(("Error: ", "API Error (", "Error calling AI Power Grid API"))
+
+class ModelProfile:
+    """Rolling latency and failure profile for a single Grid model."""
+    
+    def __init__(self, model: str, window: int = 20, min_samples: int = 3,
+                 max_failure_rate: float = 0.5, retry_after_seconds: float = 120):
+        self.model = model
+        self.latencies = deque(maxlen=window)  # Seconds from submit to finished text
+        self.outcomes = deque(maxlen=window)  # True for success, False for failure
+        self.min_samples = min_samples
+        self.max_failure_rate = max_failure_rate
+        self.retry_after_seconds = retry_after_seconds
+        self.last_failure_at = 0.0
+    
+    def record_success(self, latency: float):
+        self.latencies.append(latency)
+        self.outcomes.append(True)
+    
+    def record_failure(self):
+        self.outcomes.append(False)
+        self.last_failure_at = time.monotonic()
+    
+    def record_abandoned(self, elapsed: float):
+        """We stopped waiting after `elapsed` seconds (lost a hedge race).
+        The true latency is at least that long, so keep it as a sample."""
+        self.latencies.append(elapsed)
+    
+    @property
+    def failure_rate(self) -> float:
+        if not self.outcomes:
+            return 0.0
+        return self.outcomes.count(False) / len(self.outcomes)
+    
+    def percentile(self, pct: float) -> Optional[float]:
+        """Latency percentile (0-100), or None until we have enough samples."""
+        if len(self.latencies) < self.min_samples:
+            return None
+        ordered = sorted(self.latencies)
+        index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+        return ordered[index]
+    
+    def is_healthy(self) -> bool:
+        """Unhealthy models get another chance once retry_after_seconds has passed."""
+        if len(self.outcomes) < self.min_samples or self.failure_rate < self.max_failure_rate:
+            return True
+        return time.monotonic() - self.last_failure_at > self.retry_after_seconds
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'model': self.model,
+            'samples': len(self.latencies),
+            'p50': self.percentile(50),
+            'p90': self.percentile(90),
+            'failure_rate': round(self.failure_rate, 2),
+            'healthy': self.is_healthy(),
+        }
+
+class CircuitBreaker:
+    """Closed/open/half-open breaker over a rolling window of recent Grid calls.
+    
+    A call counts against the Grid if it failed or took longer than
+    slow_call_seconds. Once the share of bad calls reaches failure_rate the
+    breaker opens and callers should fail fast. After open_seconds it goes
+    half-open and lets a few probe calls through: one good probe closes it,
+    one bad probe opens it again."""
+    
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+    
+    def __init__(self, window: int = 20, min_calls: int = 5,
+                 failure_rate: float = GRID_BREAKER_FAILURE_RATE,
+                 slow_call_seconds: float = GRID_BREAKER_SLOW_SECONDS,
+                 open_seconds: float = GRID_BREAKER_OPEN_SECONDS,
+                 half_open_max_calls: int = 1):
+        self.window = deque(maxlen=window)  # True for a bad (failed/slow) call
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.open_seconds = open_seconds
+        self.half_open_max_calls = half_open_max_calls
+        self._state = self.CLOSED
+        self.opened_at = 0.0
+        self.half_open_calls = 0
+        self.times_opened = 0
+        self.rejected = 0
+    
+    @property
+    def state(self) -> str:
+        if self._state == self.OPEN and time.monotonic() - self.opened_at >= self.open_seconds:
+            self._state = self.HALF_OPEN
+            self.half_open_calls = 0
+            print("🟡 Grid circuit breaker half-open, allowing probe requests")
+        return self._state
+    
+    def can_request(self) -> bool:
+        """True if allow_request would let a call through right now (takes no slot)."""
+        state = self.state
+        return state == self.CLOSED or (state == self.HALF_OPEN and self.half_open_calls < self.half_open_max_calls)
+    
+    def allow_request(self) -> bool:
+        """Take a slot for a call, or return False if the caller should fail fast."""
+        state = self.state
+        if state == self.CLOSED:
+            return True
+        if state == self.HALF_OPEN and self.half_open_calls < self.half_open_max_calls:
+            self.half_open_calls += 1
+            return True
+        self.rejected += 1
+        return False
+    
+    def release(self):
+        """Give back a half-open slot for a call that ended without an outcome (cancelled)."""
+        if self._state == self.HALF_OPEN and self.half_open_calls > 0:
+            self.half_open_calls -= 1
+    
+    def record(self, success: bool, latency: float = 0.0):
+        bad = not success or latency > self.slow_call_seconds
+        state = self.state
+        
+        if state == self.HALF_OPEN:
+            if bad:
+                self._open("probe request failed")
+            else:
+                print("🟢 Grid circuit breaker closed, probe request succeeded")
+                self._state = self.CLOSED
+                self.window.clear()
+            return
+        
+        if state == self.OPEN:
+            return  # Stragglers from before we opened
+        
+        self.window.append(bad)
+        if len(self.window) >= self.min_calls and self.window.count(True) / len(self.window) >= self.failure_rate:
+            self._open(f"{self.window.count(True)}/{len(self.window)} recent calls failed or were slow")
+    
+    def _open(self, reason: str):
+        self._state = self.OPEN
+        self.opened_at = time.monotonic()
+        self.times_opened += 1
+        self.window.clear()
+        print(f"🔴 Grid circuit breaker open for {self.open_seconds:.0f}s: {reason}")
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'state': self.state,
+            'times_opened': self.times_opened,
+            'rejected': self.rejected,
+        }
 
 class GridClient:
     """Client for interacting with AI Power Grid API."""
     
-    def __init__(self):
-        """Initialize the Grid client."""
+    def __init__(self, models: Optional[List[str]] = None, hedge: Optional[bool] = None,
+                 base_url: Optional[str] = None):
+        """Initialize the Grid client.
+        
+        Args:
+            models: Ordered candidate models (default: GRID_MODELS). Earlier entries win ties.
+            hedge: Send a hedged second request when the first is slow (default: GRID_HEDGE_ENABLED)
+            base_url: API root, e.g. http://localhost:7001/api (default: GRID_API_BASE_URL)
+        """
+        if base_url:
+            base_url = base_url.rstrip('/')
+            self.generation_endpoint = f'{base_url}/v2/generate/text/async'
+            self.status_endpoint = f'{base_url}/v2/generate/text/status'
+        else:
+            self.generation_endpoint = TEXT_GENERATION_ENDPOINT
+            self.status_endpoint = TEXT_GENERATION_STATUS_ENDPOINT
+        
+        self.models = list(models or GRID_MODELS)
+        self.hedge = GRID_HEDGE_ENABLED if hedge is None else hedge
+        self.profiles = {model: ModelProfile(model) for model in self.models}
+        self.breaker = CircuitBreaker()
+        
+        # Generations submitted to the Grid that we are still waiting on
+        self.active_generations = set()
+        # DELETEs running on worker threads (see _cancel_in_background)
+        self.pending_cancels = set()
+        
+        # Counters for generations we gave up on
+        # cancelled: stopped on the Grid before any output was produced
+        # wasted: the Grid finished the work but nobody used the result
+        self.stats = {
+            'submitted': 0,
+            'completed': 0,
+            'timed_out': 0,
+            'cancelled': 0,
+            'wasted': 0,
+            'hedged': 0,
+            'hedge_wins': 0,
+        }
+        
         if not GRID_API_KEY:
             print("Warning: GRID_API_KEY not set in environment variables")
         else:
-            print(f"Using model: {GRID_MODEL}")
+            print(f"Using model(s): {', '.join(self.models)}" + (" (hedging enabled)" if self.hedge else ""))
+        if self.generation_endpoint != 'https://api.aipowergrid.io/api/v2/generate/text/async':
+            print(f"Using Grid API at: {self.generation_endpoint.rsplit('/v2/', 1)[0]}")
+    
+    def is_available(self) -> bool:
+        """False while the circuit breaker is open, or half-open with its probe
+        slots taken - callers should skip optional Grid calls and use a non-LLM
+        fallback instead of waiting on a dead API."""
+        return bool(GRID_API_KEY) and self.breaker.can_request()
+    
+    def rank_models(self) -> List[str]:
+        """Order candidate models fastest-healthy first.
+        
+        Models without enough samples are scored optimistically (as fast as the
+        best known model) so they get tried; ties keep the configured order."""
+        known = [p for p in (self.profiles[m].percentile(50) for m in self.models) if p is not None]
+        optimistic = min(known) if known else 0.0
+        
+        def score(item):
+            position, model = item
+            profile = self.profiles[model]
+            p50 = profile.percentile(50)
+            return (not profile.is_healthy(), optimistic if p50 is None else p50, position)
+        
+        return [model for _, model in sorted(enumerate(self.models), key=score)]
+    
+    def _hedge_delay(self, model: str) -> float:
+        """Wait this long for the primary before hedging: its p90, clamped."""
+        p90 = self.profiles[model].percentile(90)
+        if p90 is None:
+            return GRID_HEDGE_DEFAULT_DELAY
+        return max(GRID_HEDGE_MIN_DELAY, min(GRID_HEDGE_MAX_DELAY, p90))
     
     async def get_answer(self, question: str, context: List[Dict[str, Any]]) -> str:
         """Get answer from AI Power Grid API using retrieved context."""
         if not GRID_API_KEY:
             return "Error: AI Power Grid API key not configured"
         
-        # Format context into a single string
+        # Format context into a single string, dropping the lowest-ranked
+        # documents if question + context would overflow the context window
         formatted_context = ""
-        for i, item in enumerate(context):
-            formatted_context += f"[Document {i+1}] {item['text']}\n\n"
+        if context:
+            prompt_budget = PromptBuilder(label="answer prompt")
+            prompt_budget.add_fixed(ANSWER_PROMPT_OVERHEAD)
+            prompt_budget.add('question', question, required=True)
+            prompt_budget.add('context', [f"[Document {i+1}] {item['text']}" for i, item in enumerate(context)],
+                              separator="\n\n")
+            formatted_context = prompt_budget.build()['context'] + "\n\n"
         
         # Check if this is a follow-up question
         is_followup = "previous question:" in question.lower() or "follow-up question:" in question.lower()
@@ -68,79 +329,218 @@ ANSWER:
 """
         
         try:
-            # Prepare request payload based on example
-            request_body = {
-                "prompt": prompt,
-                "params": {
-                    "max_length": 1024,  # Maximum allowed by the API
-                    "max_context_length": 8192,
-                    "temperature": 0.7,
-                    "rep_pen": 1.1,
-                    "top_p": 0.92,
-                    "top_k": 100,
-                    "stop_sequence": ["<|endoftext|>"],  # Removed "\n\n" which was causing truncation
-                },
-                "models": [GRID_MODEL],  # Use model from environment variables
-            }
-            
-            # Set headers
-            headers = {
-                'Content-Type': 'application/json',
-                'apikey': GRID_API_KEY,
-                'Client-Agent': 'GridRAGBot:1.0'
-            }
-            
-            # Print request details for debugging
-            print(f"Using API key: {GRID_API_KEY[:5]}...")
-            print(f"Using model: {GRID_MODEL}")
-            
-            # Step 1: Submit the generation request
-            print("Sending request to API...")
-            response = requests.post(
-                TEXT_GENERATION_ENDPOINT,
-                headers=headers,
-                json=request_body
-            )
-            
-            # Print response details for debugging
-            print(f"Response status code: {response.status_code}")
+            return self._result_text(await self._generate(prompt))
+        except requests.RequestException as e:
+            return f"Error calling AI Power Grid API: {str(e)}"
+    
+    async def generate(self, prompt: str) -> str:
+        """Run a raw prompt (no answer template) for background work such as
+        summaries. Returns the text, or an "Error: ..." string.
+        
+        It takes no breaker slot and records no outcome: the breaker tracks
+        whether people get answers, and a background job shouldn't trip it or
+        use up its half-open probes. Callers check is_available() first."""
+        if not GRID_API_KEY:
+            return "Error: AI Power Grid API key not configured"
+        try:
+            return self._result_text(await self._generate(prompt, breaker=False))
+        except requests.RequestException as e:
+            return f"Error calling AI Power Grid API: {str(e)}"
+    
+    def _result_text(self, generation_result: Dict[str, Any]) -> str:
+        """The generated text of a _generate result, or the error to show instead."""
+        if generation_result.get("message"):
+            return generation_result["message"]
+        
+        if generation_result.get("error"):
+            return f"Error: {generation_result['error']}"
             
-            # Check response - 202 is success for async operations
-            if response.status_code == 202:
-                # This is the expected success code for async operations
-                result = response.json()
-            elif response.status_code != 200:
-                try:
-                    error_detail = response.json()
-                    return f"API Error ({response.status_code}): {json.dumps(error_detail)}"
-                except:
-                    return f"API Error ({response.status_code}): {response.text}"
+        if not generation_result.get("text"):
+            return "Error: No text was generated"
+        
+        return self._normalize_api_text(generation_result["text"])
+    
+    async def _generate(self, prompt: str, breaker: bool = True) -> Dict[str, Any]:
+        """Run a prompt and feed the outcome to the circuit breaker (unless breaker is False).
+        
+        The breaker sees one outcome per call, however many hedge legs ran:
+        the call takes one slot, and the latency is what the caller waited, so
+        a slow primary that was hedged away still counts as slow. Returns
+        {"message": GRID_UNAVAILABLE_MESSAGE} if the breaker has no slot."""
+        if not breaker:
+            return await self._generate_hedged(prompt)
+        started = time.monotonic()
+        outcome = None  # Stays None if we're cancelled before we know
+        if not self.breaker.allow_request():
+            return {"message": GRID_UNAVAILABLE_MESSAGE}
+        try:
+            result = await self._generate_hedged(prompt)
+            outcome = bool(result.get("text"))
+            return result
+        except requests.RequestException:
+            outcome = False
+            raise
+        finally:
+            if outcome is None:
+                self.breaker.release()
             else:
-                # Parse JSON response for 200 responses
-                result = response.json()
+                self.breaker.record(outcome, time.monotonic() - started)
+    
+    async def _generate_hedged(self, prompt: str) -> Dict[str, Any]:
+        """Run a prompt on the best candidate model, hedging to the next one if it is slow."""
+        ranked = self.rank_models()
+        primary_model = ranked[0]
+        started = time.monotonic()
+        primary = asyncio.ensure_future(self._generate_with_model(prompt, primary_model))
+        
+        if not self.hedge:
+            return await primary
+        
+        # Hedge onto the next candidate, or the same model if it's the only one
+        hedge_model = ranked[1] if len(ranked) > 1 else primary_model
+        delay = self._hedge_delay(primary_model)
+        
+        pending = {primary}
+        try:
+            done, pending = await asyncio.wait(pending, timeout=delay)
+            if primary in done:
+                return primary.result()
             
-            # Get the generation ID
-            if not result or not result.get("id"):
-                return "Error: Failed to start text generation. No generation ID received."
+            print(f"⏱️  {primary_model} slower than {delay:.1f}s, hedging with {hedge_model}")
+            self.stats['hedged'] += 1
+            hedge_started = time.monotonic()
+            hedge = asyncio.ensure_future(self._generate_with_model(prompt, hedge_model))
+            pending.add(hedge)
             
-            generation_id = result["id"]
-            print(f"Text generation request submitted with ID: {generation_id}")
+            result = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    try:
+                        result = task.result()
+                    except requests.RequestException as e:
+                        # Only this leg failed; the other may still answer
+                        result = {"error": f"Error calling AI Power Grid API: {e}"}
+                    if result.get("text"):
+                        now = time.monotonic()
+                        if task is hedge:
+                            self.stats['hedge_wins'] += 1
+                            if primary in pending:
+                                self.profiles[primary_model].record_abandoned(now - started)
+                        elif hedge in pending:
+                            self.profiles[hedge_model].record_abandoned(now - hedge_started)
+                        return result
             
-            # Step 2: Poll for the results
+            # Both failed - report the last error we saw
+            return result
+        finally:
+            # Cancel the loser; its own cancellation handler DELETEs the generation
+            for task in pending:
+                task.cancel()
+    
+    async def _generate_with_model(self, prompt: str, model: str) -> Dict[str, Any]:
+        """Run a prompt on one model.
+        
+        Returns the poll result dict ("text"/"error"), or {"message": ...} for
+        submit errors that get_answer passes through unchanged."""
+        profile = self.profiles.setdefault(model, ModelProfile(model))
+        return await self._submit_and_poll(prompt, model, profile)
+    
+    async def _submit_and_poll(self, prompt: str, model: str, profile: ModelProfile) -> Dict[str, Any]:
+        """Submit the generation request for one model and poll it to completion."""
+        started = time.monotonic()
+        
+        # Prepare request payload based on example
+        request_body = {
+            "prompt": prompt,
+            "params": {
+                "max_length": MAX_LENGTH,  # Maximum allowed by the API
+                "max_context_length": MAX_CONTEXT_LENGTH,
+                "temperature": 0.7,
+                "rep_pen": 1.1,
+                "top_p": 0.92,
+                "top_k": 100,
+                "stop_sequence": ["<|endoftext|>"],  # Removed "\n\n" which was causing truncation
+            },
+            "models": [model],
+        }
+        
+        # Set headers
+        headers = {
+            'Content-Type': 'application/json',
+            'apikey': GRID_API_KEY,
+            'Client-Agent': 'GridRAGBot:1.0'
+        }
+        
+        # Print request details for debugging
+        print(f"Using API key: {GRID_API_KEY[:5]}...")
+        print(f"Using model: {model}")
+        
+        # Step 1: Submit the generation request
+        print("Sending request to API...")
+        try:
+            # requests blocks, so every Grid call runs on a worker thread, off the event loop
+            response = await asyncio.to_thread(
+                requests.post,
+                self.generation_endpoint,
+                headers=headers,
+                json=request_body,
+                timeout=GRID_HTTP_TIMEOUT
+            )
+        except requests.RequestException:
+            profile.record_failure()
+            raise
+        
+        # Print response details for debugging
+        print(f"Response status code: {response.status_code}")
+        
+        # Check response - 202 is success for async operations
+        if response.status_code == 202:
+            # This is the expected success code for async operations
+            result = response.json()
+        elif response.status_code != 200:
+            profile.record_failure()
+            try:
+                error_detail = response.json()
+                return {"message": f"API Error ({response.status_code}): {json.dumps(error_detail)}"}
+            except:
+                return {"message": f"API Error ({response.status_code}): {response.text}"}
+        else:
+            # Parse JSON response for 200 responses
+            result = response.json()
+        
+        # Get the generation ID
+        if not result or not result.get("id"):
+            profile.record_failure()
+            return {"message": "Error: Failed to start text generation. No generation ID received."}
+        
+        generation_id = result["id"]
+        print(f"Text generation request submitted with ID: {generation_id} ({model})")
+        self.stats['submitted'] += 1
+        self.active_generations.add(generation_id)
+        
+        # Step 2: Poll for the results
+        try:
             generation_result = await self._poll_for_text_results(generation_id)
-            
-            # Step 3: Process and return the result
-            if generation_result.get("error"):
-                return f"Error: {generation_result['error']}"
-                
-            if not generation_result.get("text"):
-                return "Error: No text was generated"
-            
-            # Return the generated text
-            return self._normalize_api_text(generation_result["text"])
-            
-        except requests.RequestException as e:
-            return f"Error calling AI Power Grid API: {str(e)}"
+        except asyncio.CancelledError:
+            # Caller no longer wants the answer (superseded, deleted, hedge loser, shutting down)
+            self._cancel_in_background(generation_id, reason="request cancelled")
+            raise
+        
+        if generation_result.get("done"):
+            self.active_generations.discard(generation_id)
+            self.stats['completed'] += 1
+        else:
+            # Timed out or polling broke - stop the Grid from finishing work we'll never read
+            self.stats['timed_out'] += 1
+            self._cancel_in_background(generation_id, reason=generation_result.get("error", "polling stopped"))
+        
+        if generation_result.get("text"):
+            profile.record_success(time.monotonic() - started)
+        else:
+            profile.record_failure()
+        
+        return generation_result
     
     async def _poll_for_text_results(self, generation_id, max_wait_time_seconds=120):
         """Poll for text generation results."""
@@ -154,21 +554,26 @@ ANSWER:
             
             # Poll in a loop until max attempts reached
             while attempts < max_attempts:
+                # Don't keep waiting on a Grid that the breaker has given up on
+                if self.breaker.state == CircuitBreaker.OPEN:
+                    return {"error": "AI Power Grid is temporarily unavailable", "done": False}
+                
                 attempts += 1
                 print(f"Polling attempt {attempts}/{max_attempts} for text generation...")
                 
                 # Sleep between polling attempts to avoid rate limiting
                 if attempts > 1:
-                    import asyncio
                     await asyncio.sleep(poll_interval_seconds)
                 
                 # Make the API request to check the status
-                status_response = requests.get(
-                    f"{TEXT_GENERATION_STATUS_ENDPOINT}/{generation_id}", 
+                status_response = await asyncio.to_thread(
+                    requests.get,
+                    f"{self.status_endpoint}/{generation_id}",
                     headers={
                         'apikey': GRID_API_KEY,
                         'Client-Agent': 'GridRAGBot:1.0'
-                    }
+                    },
+                    timeout=GRID_HTTP_TIMEOUT
                 )
                 
                 status_data = status_response.json()
@@ -209,6 +614,74 @@ ANSWER:
         except Exception as e:
             return {"error": str(e), "done": False}
     
+    def cancel_generation(self, generation_id, reason=""):
+        """Cancel a pending generation via DELETE on the status endpoint.
+        
+        Returns True if the Grid accepted the cancellation. Generations the Grid
+        had already finished are counted as wasted, the rest as cancelled."""
+        if generation_id not in self.active_generations:
+            return False  # Already finished or cancelled (e.g. by cancel_all_generations)
+        self.active_generations.discard(generation_id)
+        return self._delete_generation(generation_id, reason)
+    
+    def _cancel_in_background(self, generation_id, reason=""):
+        """cancel_generation with the DELETE on a worker thread, so neither the
+        event loop nor the caller waits on it."""
+        if generation_id not in self.active_generations:
+            return
+        self.active_generations.discard(generation_id)
+        task = asyncio.ensure_future(asyncio.to_thread(self._delete_generation, generation_id, reason))
+        self.pending_cancels.add(task)
+        task.add_done_callback(self.pending_cancels.discard)
+    
+    def _delete_generation(self, generation_id, reason=""):
+        """DELETE a generation we walked away from and count it. Blocking."""
+        try:
+            response = requests.delete(
+                f"{self.status_endpoint}/{generation_id}",
+                headers={
+                    'apikey': GRID_API_KEY,
+                    'Client-Agent': 'GridRAGBot:1.0'
+                },
+                timeout=10
+            )
+        except requests.RequestException as e:
+            # We still walked away from it, so whatever it produces is wasted
+            self.stats['wasted'] += 1
+            print(f"Failed to cancel generation {generation_id}: {e}")
+            return False
+        
+        status_data = {}
+        try:
+            status_data = response.json()
+        except ValueError:
+            pass
+        
+        if status_data.get("finished", 0) > 0 or status_data.get("generations"):
+            self.stats['wasted'] += 1
+            print(f"🗑️  Generation {generation_id} finished before cancel ({reason}) - result wasted")
+        else:
+            self.stats['cancelled'] += 1
+            print(f"🛑 Cancelled generation {generation_id} ({reason}), status {response.status_code}")
+        
+        return response.status_code in (200, 202, 204)
+    
+    def cancel_all_generations(self, reason="shutdown"):
+        """Cancel every generation still pending, e.g. when the bot shuts down."""
+        pending = list(self.active_generations)
+        for generation_id in pending:
+            self.cancel_generation(generation_id, reason=reason)
+        return len(pending)
+    
+    def get_stats(self):
+        """Return a copy of the generation counters and per-model profiles."""
+        return dict(
+            self.stats,
+            active=len(self.active_generations),
+            breaker=self.breaker.to_dict(),
+            models=[self.profiles[m].to_dict() for m in self.rank_models()]
+        )
+    
     def _normalize_api_text(self, text):
         """Normalize text from AI Power Grid API responses."""
         if not text:
@@ -0,0 +1,170 @@
+"""
+Cached scam verdicts for links.
+
+Every link that isn't caught by the forbidden-type rules used to go to the
+Grid for analysis, so the same docs, X and explorer links were re-analyzed
+each time someone posted them. Verdicts are stored in conversations.db
+(link_verdicts) per normalized URL and per registered domain:
+
+- AI verdicts are cached per URL, safe ones for a shorter time than scams
+  (a safe site can be compromised later; scam sites rarely turn legit).
+- A domain gets its own verdict once enough distinct URLs on it agree and
+  none disagree, so new paths on known sites skip the Grid too.
+- Admin overrides (!trustlink / !blocklink) never expire and win over
+  everything else.
+"""
+import os
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+from conversation_db import (
+    get_link_verdicts, save_link_verdict, count_domain_url_verdicts, delete_link_verdict
+)
+
+LINK_VERDICT_SAFE_TTL_HOURS = float(os.getenv('LINK_VERDICT_SAFE_TTL_HOURS', '72'))
+LINK_VERDICT_SCAM_TTL_HOURS = float(os.getenv('LINK_VERDICT_SCAM_TTL_HOURS', '720'))
+# Distinct URLs with the same AI verdict (and none contradicting) before the whole domain gets it
+LINK_DOMAIN_PROMOTE_AFTER = int(os.getenv('LINK_DOMAIN_PROMOTE_AFTER', '3'))
+
+# Query parameters that only track clicks and never change what a link points to
+TRACKING_PARAMS = {'fbclid', 'gclid', 'igshid', 'mc_cid', 'mc_eid', 'ref', 'ref_src', 's', 'si', 't'}
+
+# Public suffixes with two labels, so "evil.co.uk" registers as evil.co.uk rather than co.uk.
+# Not the full Public Suffix List - just the ones that show up in practice.
+MULTI_PART_SUFFIXES = {
+    'co.uk', 'org.uk', 'ac.uk', 'gov.uk', 'com.au', 'net.au', 'org.au', 'co.nz', 'co.jp', 'co.kr',
+    'co.in', 'com.br', 'com.cn', 'com.mx', 'com.tr', 'com.sg', 'com.hk', 'co.za', 'com.ar',
+    'github.io', 'gitlab.io', 'pages.dev', 'workers.dev', 'vercel.app', 'netlify.app',
+    'herokuapp.com', 'web.app', 'firebaseapp.com', 'blogspot.com', 'azurewebsites.net',
+}
+
+def normalize_url(url: str) -> Optional[str]:
+    """Canonical form of a URL for cache keys: lowercase scheme/host, no www.,
+    default port, fragment or tracking params, sorted query, no trailing slash."""
+    url = url.strip().rstrip('.,;:!?\'">')
+    if not url.lower().startswith(('http://', 'https://')):
+        url = 'https://' + url
+    try:
+        parts = urlsplit(url)
+        host = (parts.hostname or '').rstrip('.')
+        port = parts.port
+    except ValueError:
+        return None
+    if not host:
+        return None
+    if host.startswith('www.'):
+        host = host[4:]
+    if port and port not in (80, 443):
+        host = f"{host}:{port}"
+
+    query = sorted(
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if key.lower() not in TRACKING_PARAMS and not key.lower().startswith('utm_')
+    )
+    path = parts.path.rstrip('/')
+    # http and https point at the same thing as far as a verdict goes
+    return urlunsplit(('https', host, path, urlencode(query), ''))
+
+def registered_domain(url: str) -> Optional[str]:
+    """The registrable part of a URL's host ("docs.aipowergrid.io" -> "aipowergrid.io")."""
+    normalized = normalize_url(url)
+    if normalized is None:
+        return None
+    host = urlsplit(normalized).hostname or ''
+    labels = host.split('.')
+    if len(labels) <= 2 or host.replace('.', '').isdigit():
+        return host
+    if '.'.join(labels[-2:]) in MULTI_PART_SUFFIXES:
+        return '.'.join(labels[-3:])
+    return '.'.join(labels[-2:])
+
+def parse_link_target(target: str):
+    """Turn an admin's argument into a cache key: a bare domain ("example.com")
+    targets the registered domain, anything with a path targets the URL."""
+    target = target.strip().strip('<>')
+    bare = target.split('://', 1)[-1].rstrip('/')
+    if '/' not in bare and '?' not in bare:
+        domain = registered_domain(target)
+        return ('domain', domain) if domain else None
+    url = normalize_url(target)
+    return ('url', url) if url else None
+
+class LinkVerdictCache:
+    """Looks up and records per-URL / per-domain scam verdicts."""
+
+    def __init__(self, safe_ttl_hours: float = LINK_VERDICT_SAFE_TTL_HOURS,
+                 scam_ttl_hours: float = LINK_VERDICT_SCAM_TTL_HOURS,
+                 promote_after: int = LINK_DOMAIN_PROMOTE_AFTER):
+        self.safe_ttl = safe_ttl_hours * 3600
+        self.scam_ttl = scam_ttl_hours * 3600
+        self.promote_after = promote_after
+        self.stats = {'hits': 0, 'misses': 0, 'promoted': 0}
+
+    def lookup(self, urls: List[str]) -> Dict[str, Optional[Dict]]:
+        """Verdict for each URL (None if unknown). Precedence: admin override on
+        the URL, then on the domain, then cached URL verdict, then domain verdict."""
+        keys = {}
+        for url in urls:
+            normalized, domain = normalize_url(url), registered_domain(url)
+            keys[url] = (('url', normalized) if normalized else None, ('domain', domain) if domain else None)
+        found = get_link_verdicts([key for pair in keys.values() for key in pair if key])
+
+        verdicts = {}
+        for url, (url_key, domain_key) in keys.items():
+            url_verdict, domain_verdict = found.get(url_key), found.get(domain_key)
+            candidates = [v for v in (url_verdict, domain_verdict) if v]
+            admin = [v for v in candidates if v['source'] == 'admin']
+            verdict = (admin or candidates or [None])[0]
+            verdicts[url] = verdict
+            self.stats['hits' if verdict else 'misses'] += 1
+        return verdicts
+
+    def record(self, urls: List[str], is_scam: bool, reason: str):
+        """Cache an AI verdict for these URLs and promote their domains if they've earned it."""
+        ttl = self.scam_ttl if is_scam else self.safe_ttl
+        domains = set()
+        for url in urls:
+            normalized, domain = normalize_url(url), registered_domain(url)
+            if not normalized:
+                continue
+            save_link_verdict('url', normalized, is_scam, reason, source='ai', ttl_seconds=ttl, domain=domain)
+            domains.add(domain)
+
+        existing = get_link_verdicts([('domain', domain) for domain in domains])
+        for domain in domains:
+            current = existing.get(('domain', domain))
+            if current and (current['source'] == 'admin' or current['is_scam'] == is_scam):
+                continue
+            if current:
+                # A contradicting link means the domain-wide verdict was too broad
+                delete_link_verdict('domain', domain)
+                print(f"🗂️  Dropped the domain-wide verdict for {domain} after a contradicting link")
+            counts = count_domain_url_verdicts(domain)
+            agreeing, contradicting = (counts['scam'], counts['safe']) if is_scam else (counts['safe'], counts['scam'])
+            if agreeing >= self.promote_after and contradicting == 0:
+                save_link_verdict('domain', domain, is_scam,
+                                  f"{agreeing} links on {domain} judged {'scam' if is_scam else 'safe'}",
+                                  source='promoted', ttl_seconds=ttl)
+                self.stats['promoted'] += 1
+                print(f"🗂️  Promoted {domain} to a domain-wide {'scam' if is_scam else 'safe'} verdict")
+
+    def override(self, target: str, is_scam: bool, reason: str) -> Optional[tuple]:
+        """Admin override for a URL or domain. Returns the key it was stored under."""
+        key = parse_link_target(target)
+        if key is None:
+            return None
+        key_type, value = key
+        domain = registered_domain(target) if key_type == 'url' else None
+        save_link_verdict(key_type, value, is_scam, reason, source='admin', ttl_seconds=None, domain=domain)
+        return key
+
+    def forget(self, target: str) -> bool:
+        """Drop the cached verdict or override for a URL or domain."""
+        key = parse_link_target(target)
+        return key is not None and delete_link_verdict(*key)
+
+    def report(self) -> str:
+        lookups = self.stats['hits'] + self.stats['misses']
+        hit_rate = f"{self.stats['hits'] / lookups:.0%}" if lookups else "n/a"
+        return (f"Link verdict cache: {self.stats['hits']}/{lookups} URLs known ({hit_rate}), "
+                f"{self.stats['promoted']} domain promotions")
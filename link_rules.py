@@ -0,0 +1,253 @@
+"""
+Rule engine for forbidden link types (Discord invites, fake support desks,
+DEXes, DeFi platforms), loaded from link_rules.json.
+
+URLs are parsed into host and path instead of substring-matched as a whole,
+so "help" or "pool" somewhere in an innocent path no longer flags it:
+
+- Domain rules (allow and deny) live in a suffix trie over reversed host
+  labels, so "app.uniswap.org" hits the "uniswap.org" rule in a few dict
+  lookups no matter how many rules there are. The most specific matching
+  domain decides; a rule can also require a path prefix ("discord.com/invite/").
+- Keyword rules are compiled into one prefix-factored regex for hosts and one
+  for paths. Keywords match whole tokens ("help" matches help.example.com or
+  help-center.xyz but not helpful.com); "*uniswap*" matches anywhere.
+
+The file is re-read when its mtime changes, so rules can be edited without a
+restart. See bench_link_rules.py for timings.
+"""
+import json
+import os
+import re
+import time
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit, unquote
+
+LINK_RULES_PATH = os.getenv('LINK_RULES_PATH', 'link_rules.json')
+# How often (seconds) to check the rules file for changes
+LINK_RULES_RELOAD_SECONDS = float(os.getenv('LINK_RULES_RELOAD_SECONDS', '5'))
+
+ALLOW = 'allow'
+_TERMINAL = ''  # Trie key holding a node's rules (host labels are never empty)
+_WORD_CHAR = '[a-z0-9]'
+
+def split_url(url: str) -> Tuple[Optional[str], str]:
+    """Lowercased (host, path) of a URL, tolerating a missing scheme."""
+    url = url.strip().rstrip('.,;:!?\'">)')
+    if not url.lower().startswith(('http://', 'https://')):
+        url = 'http://' + url
+    try:
+        parts = urlsplit(url)
+        host = (parts.hostname or '').rstrip('.')
+    except ValueError:
+        return None, ''
+    if not host:
+        return None, ''
+    return host, unquote(parts.path).lower()
+
+class DomainTrie:
+    """Domain suffix trie over reversed labels: com -> uniswap -> app."""
+
+    def __init__(self):
+        self.root = {}
+        self.size = 0
+
+    def add(self, domain: str, value):
+        node = self.root
+        for label in reversed(domain.lower().strip('.').split('.')):
+            node = node.setdefault(label, {})
+        node.setdefault(_TERMINAL, []).append(value)
+        self.size += 1
+
+    def matches(self, host: str) -> List[list]:
+        """Rule lists for every suffix of host that has rules, most specific first."""
+        found = []
+        node = self.root
+        for label in reversed(host.split('.')):
+            node = node.get(label)
+            if node is None:
+                break
+            if _TERMINAL in node:
+                found.append(node[_TERMINAL])
+        found.reverse()
+        return found
+
+def _trie_regex(words: List[str]) -> str:
+    """Prefix-factored alternation of literal words ("swap", "sushi", "sushiswap"
+    -> "s(?:ushi(?:swap)?|wap)"), which the regex engine matches without trying
+    every word at every position."""
+    trie = {}
+    for word in filter(None, words):
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[_TERMINAL] = {}
+
+    def build(node) -> str:
+        optional = _TERMINAL in node
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char != _TERMINAL]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        if optional:
+            return '(?:' + body + ')?' if len(branches) > 1 or len(branches[0]) > 1 else body + '?'
+        return body
+
+    return build(trie)
+
+def _compile_keywords(keywords: Dict[str, str]):
+    """One regex for all keywords. "word" must be a whole token, "*word*" can be
+    inside one, "*word"/"word*" only need the right/left edge to be a token edge."""
+    groups = {}
+    for keyword in keywords:
+        literal = keyword.strip('*')
+        key = (not keyword.startswith('*'), not keyword.endswith('*'))
+        groups.setdefault(key, []).append(literal)
+    if not groups:
+        return None
+
+    alternatives = []
+    for (left_edge, right_edge), literals in sorted(groups.items()):
+        pattern = '(?:' + _trie_regex(literals) + ')'
+        if left_edge:
+            pattern = f'(?<!{_WORD_CHAR})' + pattern
+        if right_edge:
+            pattern += f'(?!{_WORD_CHAR})'
+        alternatives.append(pattern)
+    return re.compile('|'.join(alternatives))
+
+class LinkRules:
+    """Compiled link rules with mtime-based hot reload."""
+
+    def __init__(self, path: str = LINK_RULES_PATH, reload_seconds: float = LINK_RULES_RELOAD_SECONDS):
+        self.path = path
+        self.reload_seconds = reload_seconds
+        self.mtime = None
+        self.checked_at = 0.0
+        self._compile({})
+        self.maybe_reload(force=True)
+
+    def maybe_reload(self, force: bool = False) -> bool:
+        """Recompile if the rules file changed. A broken file keeps the old rules."""
+        now = time.monotonic()
+        if not force and now - self.checked_at < self.reload_seconds:
+            return False
+        self.checked_at = now
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            if force:
+                print(f"Warning: link rules file {self.path} not found, no forbidden link rules loaded")
+            return False
+        if mtime == self.mtime:
+            return False
+
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                config = json.load(f)
+            self._compile(config)
+        except (OSError, ValueError, KeyError, TypeError, AttributeError, re.error) as e:
+            print(f"Error loading link rules from {self.path}, keeping previous rules: {e}")
+            self.mtime = mtime  # Don't retry a broken file until it changes again
+            return False
+        self.mtime = mtime
+        print(f"🔗 Loaded link rules from {self.path}: {self.domains.size} domain rules, "
+              f"{len(self.host_keywords)} host / {len(self.path_keywords)} path keywords")
+        return True
+
+    def _compile(self, config: Dict):
+        domains = DomainTrie()
+        host_keywords, path_keywords = {}, {}
+        reasons, exemptions = {}, {}
+
+        for domain in config.get('allow_domains', []):
+            domains.add(domain, (ALLOW, ''))
+
+        for name, category in config.get('categories', {}).items():
+            reasons[name] = category['reason']
+            for rule in category.get('domains', []):
+                domain, slash, path = rule.partition('/')
+                domains.add(domain, (name, slash + path.lower()))
+            for keyword in category.get('host_keywords', []):
+                host_keywords.setdefault(keyword.lower(), name)
+            for keyword in category.get('path_keywords', []):
+                path_keywords.setdefault(keyword.lower(), name)
+            mentions = category.get('exempt_if_message_mentions', [])
+            if mentions:
+                exemptions[name] = re.compile('|'.join(re.escape(m.lower()) for m in mentions))
+
+        host_matcher = _compile_keywords(host_keywords)
+        path_matcher = _compile_keywords(path_keywords)
+
+        # Swap everything in at once so a failed reload never leaves a half-built rule set
+        self.domains = domains
+        self.host_keywords = {k.strip('*'): v for k, v in host_keywords.items()}
+        self.path_keywords = {k.strip('*'): v for k, v in path_keywords.items()}
+        self.host_matcher = host_matcher
+        self.path_matcher = path_matcher
+        self.reasons = reasons
+        self.exemptions = exemptions
+        self.config = config
+
+    def _exempt(self, category: str, message_lower: str) -> bool:
+        exemption = self.exemptions.get(category)
+        return bool(exemption and exemption.search(message_lower))
+
+    def check(self, url: str, message_content: str = "") -> Tuple[bool, str]:
+        """(is_forbidden, reason) for one URL posted in message_content."""
+        self.maybe_reload()
+        host, path = split_url(url)
+        if host is None:
+            return False, ""
+        if host.startswith('www.'):
+            host = host[4:]
+        message_lower = message_content.lower()
+
+        # Domain rules: the most specific domain with an applicable rule decides
+        for rules in self.domains.matches(host):
+            applicable = [category for category, prefix in rules if path.startswith(prefix)]
+            if not applicable:
+                continue
+            for category in applicable:
+                if category != ALLOW and not self._exempt(category, message_lower):
+                    return True, self.reasons[category]
+            return False, ""
+
+        # Keyword rules on the host, then the path
+        for text, matcher, keywords in ((host, self.host_matcher, self.host_keywords),
+                                        (path, self.path_matcher, self.path_keywords)):
+            if matcher is None:
+                continue
+            for match in matcher.finditer(text):
+                category = keywords[match.group(0)]
+                if not self._exempt(category, message_lower):
+                    return True, self.reasons[category]
+        return False, ""
+
+    def is_allowed(self, host: str) -> bool:
+        """True if the most specific domain rule for host is in allow_domains."""
+        self.maybe_reload()
+        host = host.lower()
+        for rules in self.domains.matches(host[4:] if host.startswith('www.') else host):
+            if any(prefix == '' for _, prefix in rules):
+                return all(category == ALLOW for category, prefix in rules if prefix == '')
+        return False
+
+    def is_allowed_url(self, url: str) -> bool:
+        """True if the URL's host is in allow_domains (see is_allowed)."""
+        host, _ = split_url(url)
+        return host is not None and self.is_allowed(host)
+
+    def find_in_text(self, text: str, category: str) -> Optional[str]:
+        """Find a link for a category's domain rules anywhere in free text, even
+        without a scheme ("join discord.gg/abc"). Returns the matched text."""
+        self.maybe_reload()
+        rules = self.config.get('categories', {}).get(category, {}).get('domains', [])
+        patterns = []
+        for rule in rules:
+            domain, _, path = rule.partition('/')
+            patterns.append(re.escape(domain.lower()) + '/' + re.escape(path.lower()) + r'\w+')
+        if not patterns:
+            return None
+        match = re.search(f"(?<![a-z0-9.-])(?:{'|'.join(patterns)})", text.lower())
+        return match.group(0) if match else None
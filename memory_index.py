@@ -0,0 +1,143 @@
+"""
+Relevance-ranked retrieval from the memory bank.
+
+format_memories() puts every memory into the prompt, so prompt size and Grid
+latency grew with the bank. Instead, each memory ("key: value") is embedded
+with the retriever's bge-small model and only the memories closest to the
+message being answered go in: pinned memories first, then up to
+MEMORY_TOP_K by cosine similarity, within MEMORY_TOKEN_BUDGET.
+
+Embeddings are kept in memory.embedding, so a memory is only embedded again
+when its value changes or the model does. The rows come from
+conversation_db's state cache, so the index is rebuilt only when the memory
+table changes, from this process or another. A bank that fits the budget
+whole is included as-is, without embedding the query.
+"""
+import os
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from conversation_db import get_memory_rows, set_memory_embedding, format_memory_block, format_memory_line
+from prompt_builder import estimate_tokens
+
+MEMORY_INDEX_ENABLED = os.getenv('MEMORY_INDEX_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+# Unpinned memories picked per prompt, and the prompt tokens all picked memories may use
+MEMORY_TOP_K = int(os.getenv('MEMORY_TOP_K', '8'))
+MEMORY_TOKEN_BUDGET = int(os.getenv('MEMORY_TOKEN_BUDGET', '600'))
+# Unpinned memories less similar than this to the message are left out
+MEMORY_MIN_SIMILARITY = float(os.getenv('MEMORY_MIN_SIMILARITY', '0.3'))
+
+def memory_text(mem: Dict) -> str:
+    return f"{mem['key']}: {mem['value']}"
+
+class MemoryIndex:
+    """Embeddings of the memory bank, searched by cosine similarity."""
+
+    def __init__(self, embed_fn: Callable[[List[str]], Optional[List[List[float]]]],
+                 top_k: int = MEMORY_TOP_K, token_budget: int = MEMORY_TOKEN_BUDGET,
+                 min_similarity: float = MEMORY_MIN_SIMILARITY, enabled: bool = MEMORY_INDEX_ENABLED):
+        self.embed_fn = embed_fn
+        self.top_k = top_k
+        self.token_budget = token_budget
+        self.min_similarity = min_similarity
+        self.enabled = enabled
+        # (rows signature, pinned rows, unpinned rows, their normalized embeddings or None) swapped as one
+        self.index: Tuple[Optional[tuple], List[Dict], List[Dict], Optional[np.ndarray]] = (None, [], [], None)
+        self.lock = threading.Lock()  # Serializes rebuilds
+        self.stats = {'prompts': 0, 'whole_bank': 0, 'ranked': 0, 'recency': 0, 'embedded': 0}
+
+    def _embed(self, texts: List[str]) -> Optional[np.ndarray]:
+        vectors = self.embed_fn(texts)
+        if vectors is None:
+            return None
+        matrix = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix / np.maximum(norms, 1e-8)
+
+    def _current(self):
+        """The index for the current memory rows, rebuilt if they changed. Blocking."""
+        rows = get_memory_rows()
+        signature = tuple((row['id'], row['updated_at'], row['pinned']) for row in rows)
+        if self.index[0] == signature:
+            return self.index
+        with self.lock:
+            if self.index[0] != signature:
+                self.index = self._build(signature, rows)
+            return self.index
+
+    def _build(self, signature: tuple, rows: List[Dict]):
+        pinned = [row for row in rows if row['pinned']]
+        unpinned = [row for row in rows if not row['pinned']]
+        if not self.enabled or not unpinned:
+            return signature, pinned, unpinned, None
+        probe = self._embed(["probe"])
+        if probe is None:
+            return signature, pinned, unpinned, None
+
+        # Embeddings from another model (different size) are redone along with missing ones
+        row_bytes = probe.shape[1] * 4
+        vectors = {row['id']: row['embedding'] for row in unpinned
+                   if row['embedding'] is not None and len(row['embedding']) == row_bytes}
+        stale = [row for row in unpinned if row['id'] not in vectors]
+        if stale:
+            for row, vector in zip(stale, self._embed([memory_text(row) for row in stale])):
+                vectors[row['id']] = vector.tobytes()
+                set_memory_embedding(row['id'], vectors[row['id']])
+            self.stats['embedded'] += len(stale)
+            print(f"🧠 Embedded {len(stale)} memories")
+        matrix = np.stack([np.frombuffer(vectors[row['id']], dtype=np.float32) for row in unpinned])
+        return signature, pinned, unpinned, matrix
+
+    def _within_budget(self, memories: List[Dict]) -> List[Dict]:
+        """The memories, in order, that fit the token budget together."""
+        picked = []
+        tokens = estimate_tokens(format_memory_block([{'key': '', 'value': '', 'source': None}]))
+        for mem in memories:
+            cost = estimate_tokens(format_memory_line(mem))
+            if tokens + cost > self.token_budget:
+                continue  # A shorter one further down may still fit
+            picked.append(mem)
+            tokens += cost
+        return picked
+
+    def select(self, query: str) -> List[Dict]:
+        """Pinned memories, then the unpinned ones most relevant to query, within the budget. Blocking."""
+        _, pinned, unpinned, matrix = self._current()
+        self.stats['prompts'] += 1
+        if len(unpinned) <= self.top_k:
+            everything = self._within_budget(pinned + unpinned)
+            if len(everything) == len(pinned) + len(unpinned):
+                self.stats['whole_bank'] += 1
+                return everything
+
+        ranked = None
+        if matrix is not None and query.strip():
+            vectors = self._embed([query])
+            if vectors is not None:
+                similarities = matrix @ vectors[0]
+                order = np.argsort(-similarities)[:self.top_k]
+                ranked = [unpinned[i] for i in order if similarities[i] >= self.min_similarity]
+                self.stats['ranked'] += 1
+        if ranked is None:
+            # No embeddings: the most recently updated memories, like format_memories' order
+            ranked = unpinned[:self.top_k]
+            self.stats['recency'] += 1
+        return self._within_budget(pinned + ranked)
+
+    def format_for(self, query: str) -> str:
+        """Memory Bank prompt block for a message. Blocking (may run the embedding model)."""
+        return format_memory_block(self.select(query))
+
+    def refresh(self):
+        """Embed any new memories now instead of on the first prompt. Blocking."""
+        self._current()
+
+    def report(self) -> str:
+        _, pinned, unpinned, matrix = self.index
+        s = self.stats
+        return (f"Memory index: {len(pinned)} pinned + {len(unpinned)} memories"
+                f"{'' if matrix is not None or not unpinned else ' (no embeddings)'}, top {self.top_k} within "
+                f"{self.token_budget} tokens; {s['prompts']} prompts: {s['whole_bank']} whole bank, "
+                f"{s['ranked']} ranked, {s['recency']} by recency")
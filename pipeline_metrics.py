@@ -0,0 +1,82 @@
+"""
+Per-stage timing for the message pipeline.
+
+bot.on_message runs every message through fixed stages (scam screening,
+commands, intake, routing, gate, response). Each stage is timed with a
+PipelineTrace and folded into rolling per-stage stats, shown by !stats, so
+it's clear where a slow reply spent its time.
+"""
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, List
+
+# Recent samples kept per stage for percentiles
+PIPELINE_SAMPLE_WINDOW = 500
+
+class StageStats:
+    """Count, max and rolling percentiles of one stage's duration (ms)."""
+
+    def __init__(self, window: int = PIPELINE_SAMPLE_WINDOW):
+        self.count = 0
+        self.max_ms = 0.0
+        self.samples = deque(maxlen=window)
+
+    def record(self, elapsed_ms: float):
+        self.count += 1
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        self.samples.append(elapsed_ms)
+
+    def percentile(self, pct: float) -> float:
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+    def summary(self) -> str:
+        return (f"n={self.count} p50={self.percentile(0.5):.0f}ms "
+                f"p95={self.percentile(0.95):.0f}ms max={self.max_ms:.0f}ms")
+
+class PipelineTrace:
+    """Timings for one message (or one batch) as it moves through the stages."""
+
+    def __init__(self, metrics: "PipelineMetrics", label: str):
+        self.metrics = metrics
+        self.label = label
+        self.started = time.perf_counter()
+        self.timings = []
+
+    @contextmanager
+    def stage(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            self.timings.append((name, elapsed_ms))
+            self.metrics.record(name, elapsed_ms)
+
+    def finish(self, outcome: str):
+        """Log the per-stage breakdown and count the outcome."""
+        total_ms = (time.perf_counter() - self.started) * 1000
+        self.metrics.outcomes[outcome] = self.metrics.outcomes.get(outcome, 0) + 1
+        stages = " ".join(f"{name}={elapsed_ms:.0f}ms" for name, elapsed_ms in self.timings)
+        print(f"⏱️  {self.label} -> {outcome} in {total_ms:.0f}ms: {stages}")
+
+class PipelineMetrics:
+    """Process-wide stage timings and outcome counts."""
+
+    def __init__(self):
+        self.stages: Dict[str, StageStats] = {}
+        self.outcomes: Dict[str, int] = {}
+
+    def trace(self, label: str) -> PipelineTrace:
+        return PipelineTrace(self, label)
+
+    def record(self, stage: str, elapsed_ms: float):
+        self.stages.setdefault(stage, StageStats()).record(elapsed_ms)
+
+    def report(self) -> List[str]:
+        lines = ["Pipeline: " + ", ".join(f"{outcome}={count}" for outcome, count in sorted(self.outcomes.items()))]
+        lines += [f"  {stage}: {stats.summary()}" for stage, stats in self.stages.items()]
+        return lines
@@ -0,0 +1,172 @@
+"""
+Token accounting for prompts sent to AI Power Grid.
+Estimates tokens per prompt section and trims sections to fit per-section
+and total budgets, in a fixed priority order, so prompts never overflow
+the worker's context window.
+"""
+import math
+from typing import List, Dict, Optional
+
+# Matches the params GridClient sends with every request
+MAX_CONTEXT_LENGTH = 8192
+MAX_LENGTH = 1024
+
+# Headroom for GridClient.get_answer's own wrapper text and estimate error
+TEMPLATE_RESERVE_TOKENS = 250
+
+# Whatever is left of the context window once the answer has room to be generated
+DEFAULT_PROMPT_BUDGET = MAX_CONTEXT_LENGTH - MAX_LENGTH - TEMPLATE_RESERVE_TOKENS
+
+# Llama-family tokenizers average ~4 chars/token on English; 3.5 errs on the safe side
+CHARS_PER_TOKEN = 3.5
+
+def estimate_tokens(text: str) -> int:
+    """Cheap, deterministic token estimate (no tokenizer download needed)."""
+    if not text:
+        return 0
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+def split_section(text: str):
+    """Split a formatted block like "Recent chat (last messages):\\nA: hi\\nB: yo"
+    into its header line and item lines, so it can be trimmed line by line."""
+    if not text:
+        return "", []
+    lines = text.strip("\n").split("\n")
+    if lines[0].rstrip().endswith(":"):
+        return lines[0], lines[1:]
+    return "", lines
+
+class PromptSection:
+    """One named part of a prompt, made of items that can be dropped one at a time.
+
+    keep="head" drops items from the end (ranked lists: docs, memories);
+    keep="tail" drops items from the start (chronological: chat history)."""
+
+    def __init__(self, name: str, items: List[str], header: str = "", priority: int = 0,
+                 max_tokens: Optional[int] = None, keep: str = "head",
+                 required: bool = False, separator: str = "\n"):
+        self.name = name
+        self.items = [item for item in items if item]
+        self.header = header
+        self.priority = priority
+        self.max_tokens = max_tokens
+        self.keep = keep
+        self.required = required
+        self.separator = separator
+        self.original_tokens = self.tokens
+        self.dropped_items = 0
+        self.truncated = False
+
+    def render(self) -> str:
+        if not self.items:
+            return ""
+        body = self.separator.join(self.items)
+        return f"{self.header}\n{body}" if self.header else body
+
+    @property
+    def tokens(self) -> int:
+        return estimate_tokens(self.render())
+
+    def trim(self, excess_tokens: int) -> int:
+        """Shed roughly excess_tokens. Returns how many tokens were freed."""
+        before = self.tokens
+        if before == 0 or excess_tokens <= 0:
+            return 0
+
+        # Whole items first, while they fit inside what still has to go
+        index = 0 if self.keep == "tail" else -1
+        while len(self.items) > 1:
+            still_over = excess_tokens - (before - self.tokens)
+            if still_over <= 0 or estimate_tokens(self.items[index]) > still_over:
+                break
+            self.items.pop(index)
+            self.dropped_items += 1
+
+        # Then cut into the last remaining item
+        still_over = excess_tokens - (before - self.tokens)
+        if still_over > 0 and self.items:
+            item = self.items[index]
+            keep_chars = len(item) - math.ceil(still_over * CHARS_PER_TOKEN) - 3
+            if keep_chars <= 0:
+                self.items.pop(index)
+                self.dropped_items += 1
+            else:
+                self.items[index] = "..." + item[-keep_chars:] if self.keep == "tail" else item[:keep_chars] + "..."
+                self.truncated = True
+
+        return before - self.tokens
+
+class PromptBuilder:
+    """Collects prompt sections and fits them into a token budget.
+
+    Each section is first held to its own max_tokens. If the total is still
+    over budget, sections are trimmed lowest priority first (ties go to the
+    section added last) until it fits. Required sections are never trimmed."""
+
+    def __init__(self, total_budget: int = DEFAULT_PROMPT_BUDGET, label: str = "prompt"):
+        self.total_budget = total_budget
+        self.label = label
+        self.sections = []
+        self.fixed_tokens = 0
+
+    def add_fixed(self, text: str):
+        """Account for template text that's always in the prompt (instructions etc.)."""
+        self.fixed_tokens += estimate_tokens(text)
+
+    def add(self, name: str, items, **kwargs) -> PromptSection:
+        if isinstance(items, str):
+            items = [items]
+        section = PromptSection(name, list(items), **kwargs)
+        self.sections.append(section)
+        return section
+
+    def add_block(self, name: str, text: str, **kwargs) -> PromptSection:
+        """Add an already-formatted block, splitting off its header line."""
+        header, lines = split_section(text)
+        return self.add(name, lines, header=header, **kwargs)
+
+    @property
+    def total_tokens(self) -> int:
+        return self.fixed_tokens + sum(section.tokens for section in self.sections)
+
+    def build(self) -> Dict[str, str]:
+        """Apply budgets and return {section name: rendered text}."""
+        for section in self.sections:
+            if section.max_tokens is not None and not section.required:
+                section.trim(section.tokens - section.max_tokens)
+
+        trim_order = sorted(
+            (s for s in self.sections if not s.required),
+            key=lambda s: (s.priority, -self.sections.index(s))
+        )
+        for section in trim_order:
+            excess = self.total_tokens - self.total_budget
+            if excess <= 0:
+                break
+            section.trim(excess)
+            # A section left with nothing useful shouldn't waste its header
+            if section.items and section.tokens <= estimate_tokens(section.header) + 1:
+                section.items = []
+
+        self.log_breakdown()
+        return {section.name: section.render() for section in self.sections}
+
+    def breakdown(self) -> Dict[str, int]:
+        result = {'fixed': self.fixed_tokens}
+        for section in self.sections:
+            result[section.name] = section.tokens
+        result['total'] = self.total_tokens
+        return result
+
+    def log_breakdown(self):
+        parts = [f"fixed={self.fixed_tokens}"]
+        for section in self.sections:
+            part = f"{section.name}={section.tokens}"
+            if section.tokens != section.original_tokens:
+                part += f"(from {section.original_tokens}"
+                if section.dropped_items:
+                    part += f", -{section.dropped_items} items"
+                part += ")"
+            parts.append(part)
+        status = "" if self.total_tokens <= self.total_budget else " ⚠️ OVER BUDGET"
+        print(f"📏 {self.label} tokens ~{self.total_tokens}/{self.total_budget}: {' '.join(parts)}{status}")
@@ -0,0 +1,188 @@
+"""
+Local second-stage relevance gate for automatic responses.
+
+Messages that pass the keyword skim in bot.has_obvious_trigger usually end
+with the LLM deciding {"respond": false}. This gate is a small logistic
+regression over bge-small embeddings, trained on the LLM's own logged
+decisions (classification_log in conversations.db). It filters out messages
+that almost certainly don't need a reply before a Grid call is made.
+"""
+import os
+import random
+import threading
+import time
+from typing import Callable, List, Optional, Dict, Any
+
+import numpy as np
+
+from conversation_db import get_classification_log
+
+RELEVANCE_GATE_ENABLED = os.getenv('RELEVANCE_GATE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+# Skip the Grid when the predicted chance the LLM would respond is below this
+RELEVANCE_GATE_SKIP_BELOW = float(os.getenv('RELEVANCE_GATE_SKIP_BELOW', '0.15'))
+# Don't gate anything until we have this many logged LLM decisions
+RELEVANCE_GATE_MIN_SAMPLES = int(os.getenv('RELEVANCE_GATE_MIN_SAMPLES', '200'))
+# Share of would-be-skipped messages still sent to the LLM, to keep measuring agreement
+RELEVANCE_GATE_SHADOW_RATE = float(os.getenv('RELEVANCE_GATE_SHADOW_RATE', '0.05'))
+# Retrain after this many new LLM decisions
+RELEVANCE_GATE_RETRAIN_EVERY = int(os.getenv('RELEVANCE_GATE_RETRAIN_EVERY', '100'))
+
+class RelevanceGate:
+    """Predicts whether the LLM would respond to a message, from its embedding."""
+
+    def __init__(self, embed_fn: Callable[[List[str]], Optional[List[List[float]]]],
+                 skip_below: float = RELEVANCE_GATE_SKIP_BELOW,
+                 min_samples: int = RELEVANCE_GATE_MIN_SAMPLES,
+                 shadow_rate: float = RELEVANCE_GATE_SHADOW_RATE,
+                 retrain_every: int = RELEVANCE_GATE_RETRAIN_EVERY,
+                 enabled: bool = RELEVANCE_GATE_ENABLED):
+        self.embed_fn = embed_fn
+        self.skip_below = skip_below
+        self.min_samples = min_samples
+        self.shadow_rate = shadow_rate
+        self.retrain_every = retrain_every
+        self.enabled = enabled
+        self.weights = None
+        self.bias = 0.0
+        self.trained_on = 0
+        self.decisions_since_training = 0
+        self.train_lock = threading.Lock()  # Held by a running train(); they re-embed the whole log, so one at a time
+        self.holdout = {}
+        self.metrics = {
+            'checked': 0,      # Messages scored by the gate
+            'skipped': 0,      # Grid calls avoided
+            'shadowed': 0,     # Would have skipped, sent to the LLM anyway to measure agreement
+            'compared': 0,     # Gate prediction vs LLM decision pairs
+            'agreed': 0,
+            'missed_responses': 0,  # Gate said skip, LLM responded (the costly mistake)
+        }
+
+    @property
+    def ready(self) -> bool:
+        return self.enabled and self.weights is not None
+
+    def _embed(self, texts: List[str]) -> Optional[np.ndarray]:
+        vectors = self.embed_fn(texts)
+        if vectors is None:
+            return None
+        matrix = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix / np.maximum(norms, 1e-8)
+
+    def train(self) -> bool:
+        """(Re)train from the logged LLM decisions. Blocking - run it off the event loop."""
+        if not self.enabled or not self.train_lock.acquire(blocking=False):
+            return False
+        try:
+            return self._train()
+        finally:
+            self.train_lock.release()
+
+    def _train(self) -> bool:
+        started = time.perf_counter()
+        rows = get_classification_log(source="llm")
+        labels = np.array([1.0 if row['responded'] else 0.0 for row in rows], dtype=np.float32)
+        if len(rows) < self.min_samples or labels.min(initial=1) == labels.max(initial=0):
+            print(f"Relevance gate: {len(rows)} logged decisions, need {self.min_samples} with both outcomes to train")
+            return False
+
+        features = self._embed([row['content'] for row in rows])
+        if features is None:
+            print("Relevance gate: local embeddings unavailable, gate disabled")
+            return False
+
+        # Hold out the newest 20% to report how well the gate tracks the LLM
+        split = int(len(rows) * 0.8)
+        weights, bias = self._fit(features[:split], labels[:split])
+        self.holdout = self._evaluate(features[split:], labels[split:], weights, bias)
+
+        # Final model uses everything
+        self.weights, self.bias = self._fit(features, labels)
+        self.trained_on = len(rows)
+        print(f"🧠 Relevance gate trained on {len(rows)} decisions in {time.perf_counter() - started:.1f}s, "
+              f"holdout: {self.holdout}")
+        return True
+
+    @staticmethod
+    def _fit(features: np.ndarray, labels: np.ndarray, epochs: int = 300,
+             learning_rate: float = 0.5, l2: float = 1e-3):
+        """Class-balanced logistic regression by batch gradient descent."""
+        positives = max(labels.sum(), 1.0)
+        negatives = max(len(labels) - labels.sum(), 1.0)
+        sample_weights = np.where(labels == 1, len(labels) / (2 * positives), len(labels) / (2 * negatives))
+
+        weights = np.zeros(features.shape[1], dtype=np.float32)
+        bias = 0.0
+        for _ in range(epochs):
+            predictions = 1.0 / (1.0 + np.exp(-(features @ weights + bias)))
+            error = (predictions - labels) * sample_weights
+            weights -= learning_rate * (features.T @ error / len(labels) + l2 * weights)
+            bias -= learning_rate * float(error.mean())
+        return weights, bias
+
+    def _evaluate(self, features, labels, weights, bias) -> Dict[str, Any]:
+        if len(labels) == 0:
+            return {}
+        scores = 1.0 / (1.0 + np.exp(-(features @ weights + bias)))
+        passed = scores >= self.skip_below
+        responded = labels == 1
+        return {
+            'samples': int(len(labels)),
+            'agreement': round(float((passed == responded).mean()), 3),
+            'skip_rate': round(float((~passed).mean()), 3),
+            'response_recall': round(float(passed[responded].mean()), 3) if responded.any() else None,
+        }
+
+    def score(self, text: str) -> Optional[float]:
+        """Probability the LLM would respond, or None if the gate can't score yet.
+        Blocking (runs the embedding model)."""
+        if not self.ready:
+            return None
+        features = self._embed([text])
+        if features is None:
+            return None
+        return float(1.0 / (1.0 + np.exp(-(features[0] @ self.weights + self.bias))))
+
+    def check(self, text: str):
+        """Decide whether a message should go to the LLM. Returns (call_llm, score)."""
+        score = self.score(text)
+        if score is None:
+            return True, None
+
+        self.metrics['checked'] += 1
+        if score >= self.skip_below:
+            return True, score
+        if random.random() < self.shadow_rate:
+            self.metrics['shadowed'] += 1
+            return True, score
+        self.metrics['skipped'] += 1
+        return False, score
+
+    def record_llm_decision(self, score: Optional[float], responded: bool) -> bool:
+        """Track agreement for a message the LLM decided on. Returns True when it's time to retrain.
+        The count restarts as soon as a retrain is due, whether or not it ends up
+        training (too few samples, one class, no embeddings), and no retrain is
+        due while one is running."""
+        if score is not None:
+            predicted = score >= self.skip_below
+            self.metrics['compared'] += 1
+            if predicted == responded:
+                self.metrics['agreed'] += 1
+            if responded and not predicted:
+                self.metrics['missed_responses'] += 1
+        self.decisions_since_training += 1
+        if not self.enabled or self.train_lock.locked() or self.decisions_since_training < self.retrain_every:
+            return False
+        self.decisions_since_training = 0
+        return True
+
+    def report(self) -> str:
+        m = self.metrics
+        if not self.ready:
+            return f"Relevance gate: not trained ({'enabled' if self.enabled else 'disabled'}, need {self.min_samples} logged decisions)"
+        agreement = f"{m['agreed'] / m['compared']:.0%}" if m['compared'] else "n/a"
+        saved = f"{m['skipped'] / m['checked']:.0%}" if m['checked'] else "n/a"
+        return (f"Relevance gate: trained on {self.trained_on}, threshold {self.skip_below}, "
+                f"skipped {m['skipped']}/{m['checked']} Grid calls ({saved}), "
+                f"live agreement {agreement} over {m['compared']}, missed responses {m['missed_responses']} "
+                f"(shadowed {m['shadowed']}), holdout {self.holdout}")
@@ -1,6 +1,6 @@
 import os
 import shutil
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 import requests
 from dotenv import load_dotenv
 from llama_index.core import (
@@ -41,10 +41,12 @@ class DocumentRetriever:
         # Configure embedding model first
         # Use HuggingFace embeddings for better results
         self.embedding_dim = 384  # Default for BAAI/bge-small-en-v1.5
+        self.has_local_embeddings = False  # True once the bge-small model is loaded
         
         if HuggingFaceEmbedding is not None:
             try:
                 Settings.embed_model = HuggingFaceEmbedding(model_name="BAAI/bge-small-en-v1.5")
+                self.has_local_embeddings = True
                 print("Using HuggingFace embeddings")
             except Exception as e:
                 print(f"Failed to load HuggingFace embeddings: {str(e)}")
@@ -339,6 +341,13 @@ class DocumentRetriever:
         
         return context
     
+    def embed_texts(self, texts: List[str]) -> Optional[List[List[float]]]:
+        """Embed texts with the same local model used for documents.
+        Returns None if only the default (remote/mock) embeddings are available."""
+        if not self.has_local_embeddings:
+            return None
+        return Settings.embed_model.get_text_embedding_batch(texts)
+    
     def list_documents(self) -> List[Dict[str, Any]]:
         """List all documents in the docs directory."""
         if not os.path.exists('docs'):
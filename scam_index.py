@@ -0,0 +1,166 @@
+"""
+Nearest-neighbour index of confirmed scam messages.
+
+Scam templates recur ("open a ticket here", "claim your airdrop", "wallet
+migration required") with new links and light rewording each time. Link
+messages are embedded with the retriever's bge-small model and compared
+against every known scam message by cosine similarity (one matrix-vector
+product - the index stays small). A close match is flagged without a Grid
+call.
+
+The index starts from scam_seeds.json and grows from community votes: the
+message behind every ban vote that reaches BAN_VOTE_THRESHOLD is added.
+Examples and their embeddings are kept in the scam_examples table, so they
+are only embedded again when the model changes.
+"""
+import json
+import os
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from conversation_db import get_scam_examples, add_scam_example, set_scam_example_embedding
+from spam_waves import URL_PATTERN, MENTION_PATTERN
+
+SCAM_INDEX_ENABLED = os.getenv('SCAM_INDEX_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+# Cosine similarity to a known scam at which a message is flagged without the Grid
+SCAM_INDEX_MATCH_AT = float(os.getenv('SCAM_INDEX_MATCH_AT', '0.9'))
+SCAM_SEEDS_PATH = os.getenv('SCAM_SEEDS_PATH', 'scam_seeds.json')
+# Messages shorter than this (links and mentions removed) are too generic to compare
+SCAM_INDEX_MIN_CHARS = 20
+# New examples this close to an existing one add nothing
+SCAM_INDEX_DUPLICATE_AT = 0.97
+
+def scam_text(content: str) -> str:
+    """The template part of a message: links and mentions replaced, whitespace collapsed."""
+    text = URL_PATTERN.sub(' link ', content)
+    text = MENTION_PATTERN.sub(' ', text)
+    return ' '.join(text.split())[:1000]
+
+class ScamIndex:
+    """Embeddings of known scam messages, searched by cosine similarity."""
+
+    def __init__(self, embed_fn: Callable[[List[str]], Optional[List[List[float]]]],
+                 match_at: float = SCAM_INDEX_MATCH_AT, seeds_path: str = SCAM_SEEDS_PATH,
+                 enabled: bool = SCAM_INDEX_ENABLED):
+        self.embed_fn = embed_fn
+        self.match_at = match_at
+        self.seeds_path = seeds_path
+        self.enabled = enabled
+        # (normalized embedding matrix, examples) swapped as one, so searches never see a half-added example
+        self.index: Tuple[Optional[np.ndarray], List[Dict]] = (None, [])
+        self.lock = threading.Lock()  # Serializes load/add
+        self.stats = {'checked': 0, 'matched': 0, 'added': 0}
+
+    @property
+    def ready(self) -> bool:
+        return self.enabled and self.index[0] is not None
+
+    def _embed(self, texts: List[str]) -> Optional[np.ndarray]:
+        vectors = self.embed_fn(texts)
+        if vectors is None:
+            return None
+        matrix = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix / np.maximum(norms, 1e-8)
+
+    def _load_seeds(self):
+        try:
+            with open(self.seeds_path, encoding='utf-8') as f:
+                seeds = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Scam index: couldn't read seeds from {self.seeds_path}: {e}")
+            return
+        for seed in seeds:
+            text = scam_text(seed.get('content', ''))
+            if text:
+                add_scam_example(text, seed.get('reason', 'known scam template'), source='seed')
+
+    def load(self) -> bool:
+        """Store the seeds, embed examples that need it and build the index.
+        Blocking - run it off the event loop."""
+        if not self.enabled:
+            return False
+        with self.lock:
+            self._load_seeds()
+            rows = get_scam_examples()
+            probe = self._embed(["probe"])
+            if probe is None:
+                print("Scam index: local embeddings unavailable, index disabled")
+                return False
+
+            # Embeddings from another model (different size) are redone along with missing ones
+            row_bytes = probe.shape[1] * 4
+            stale = [row for row in rows if row['embedding'] is None or len(row['embedding']) != row_bytes]
+            if stale:
+                vectors = self._embed([row['content'] for row in stale])
+                if vectors is None:
+                    print("Scam index: embedding examples failed, index disabled")
+                    return False
+                for row, vector in zip(stale, vectors):
+                    row['embedding'] = vector.tobytes()
+                    set_scam_example_embedding(row['id'], row['embedding'])
+
+            examples = [{'id': row['id'], 'content': row['content'], 'reason': row['reason'],
+                         'source': row['source']} for row in rows]
+            matrix = (np.stack([np.frombuffer(row['embedding'], dtype=np.float32) for row in rows])
+                      if rows else np.zeros((0, probe.shape[1]), dtype=np.float32))
+            self.index = (matrix, examples)
+        print(f"🧬 Scam index loaded: {len(examples)} examples ({len(stale)} newly embedded)")
+        return True
+
+    def _nearest(self, vector: np.ndarray) -> Optional[Tuple[float, Dict]]:
+        matrix, examples = self.index
+        if matrix is None or not examples:
+            return None
+        similarities = matrix @ vector
+        best = int(np.argmax(similarities))
+        return float(similarities[best]), examples[best]
+
+    def match(self, content: str) -> Optional[Tuple[float, Dict]]:
+        """(similarity, example) for the closest known scam if it's at least
+        match_at, else None. Blocking (runs the embedding model)."""
+        text = scam_text(content)
+        if not self.ready or len(text) < SCAM_INDEX_MIN_CHARS:
+            return None
+        vectors = self._embed([text])
+        if vectors is None:
+            return None
+        self.stats['checked'] += 1
+        nearest = self._nearest(vectors[0])
+        if nearest is None or nearest[0] < self.match_at:
+            return None
+        self.stats['matched'] += 1
+        return nearest
+
+    def add(self, content: str, reason: str, source: str = 'vote') -> bool:
+        """Add a confirmed scam message. Returns False if it's too short, a
+        near-duplicate, or the index isn't ready. Blocking."""
+        text = scam_text(content)
+        if not self.ready or len(text) < SCAM_INDEX_MIN_CHARS:
+            return False
+        vectors = self._embed([text])
+        if vectors is None:
+            return False
+        vector = vectors[0]
+        with self.lock:
+            nearest = self._nearest(vector)
+            if nearest is not None and nearest[0] >= SCAM_INDEX_DUPLICATE_AT:
+                return False
+            example_id = add_scam_example(text, reason, source, vector.tobytes())
+            if example_id is None:
+                return False
+            matrix, examples = self.index
+            self.index = (np.vstack([matrix, vector[None, :]]),
+                          examples + [{'id': example_id, 'content': text, 'reason': reason, 'source': source}])
+            self.stats['added'] += 1
+        print(f"🧬 Added scam example #{example_id} ({source}): '{text[:80]}'")
+        return True
+
+    def report(self) -> str:
+        if not self.ready:
+            return f"Scam index: not loaded ({'enabled' if self.enabled else 'disabled'})"
+        s = self.stats
+        return (f"Scam index: {len(self.index[1])} examples, threshold {self.match_at}, "
+                f"{s['matched']}/{s['checked']} messages matched, {s['added']} added from votes")
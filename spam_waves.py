@@ -0,0 +1,177 @@
+"""
+Sliding-window fingerprints for cross-channel spam waves.
+
+Scam raids post the same (or lightly mutated) text in many channels within
+seconds. Each link-bearing message is fingerprinted by an exact hash of its
+normalized text plus a 64-bit SimHash. Near-duplicates are found through LSH
+buckets (8 bands of 8 bits): two SimHashes within 7 bits always share a
+band, so a lookup is a handful of dict probes however many messages the raid
+posts. Copies join the first message's wave and are added to its ban vote
+instead of each getting their own Grid analysis and vote. Only the expensive
+part of the verdict is shared: links are reduced to their domain here, so
+each copy still runs the link rules, admin overrides and verdict cache on
+its own links, and takes the first copy's verdict only where that came from
+the Grid or the scam index.
+"""
+import asyncio
+import hashlib
+import os
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from link_cache import registered_domain
+
+# A wave is forgotten this long after its last copy
+SPAM_WAVE_WINDOW_SECONDS = float(os.getenv('SPAM_WAVE_WINDOW_SECONDS', '300'))
+# SimHash bits two messages may differ by and still count as copies. Reworded raid
+# copies land within ~10 bits, unrelated messages 20+ apart; up to 7 keeps LSH recall exact
+SPAM_WAVE_MAX_DISTANCE = int(os.getenv('SPAM_WAVE_MAX_DISTANCE', '7'))
+# Messages with fewer normalized tokens only match exactly (SimHash is noisy on tiny texts)
+SPAM_WAVE_MIN_TOKENS = 5
+# Newest waves kept per LSH bucket, so similar-but-distinct floods can't make lookups linear
+SPAM_WAVE_BUCKET_CAP = 32
+
+SIMHASH_BITS = 64
+LSH_BANDS = 8
+BAND_BITS = SIMHASH_BITS // LSH_BANDS
+# Verdict sources that hold for every copy of the text; the rest depend on the exact links
+SHARED_VERDICT_SOURCES = ('similarity', 'grid')
+
+URL_PATTERN = re.compile(r'(?:https?://|www\.)[^\s)>]+', re.IGNORECASE)
+MENTION_PATTERN = re.compile(r'<[@#][!&]?\d+>|@everyone|@here')
+
+def normalize_text(text: str) -> List[str]:
+    """Tokens that survive the usual raid mutations: case, accents, mentions,
+    punctuation/emoji, and links swapped for others on the same domain."""
+    text = MENTION_PATTERN.sub(' ', text)
+    text = URL_PATTERN.sub(lambda m: f" url{(registered_domain(m.group(0)) or '').replace('.', '')} ", text)
+    text = unicodedata.normalize('NFKD', text.lower())
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    return re.findall(r'[a-z0-9]+', text)
+
+def simhash(tokens: List[str]) -> int:
+    """64-bit SimHash over words and word pairs."""
+    features = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+    digests = b''.join(hashlib.blake2b(f.encode('utf-8'), digest_size=8).digest() for f in features)
+    bits = np.unpackbits(np.frombuffer(digests, dtype=np.uint8).reshape(len(features), 8), axis=1)
+    majority = bits.sum(axis=0) * 2 > len(features)
+    return int.from_bytes(np.packbits(majority).tobytes(), 'big')
+
+def _bands(value: int) -> List[Tuple[int, int]]:
+    mask = (1 << BAND_BITS) - 1
+    return [(band, value >> (band * BAND_BITS) & mask) for band in range(LSH_BANDS)]
+
+class SpamWave:
+    """Copies of one message. The first copy's screening resolves `verdict`
+    with (is_scam, reason, source); the rest await it."""
+
+    def __init__(self, wave_id: int, exact_key: str, fingerprint: Optional[int], now: float):
+        self.id = wave_id
+        self.exact_key = exact_key
+        self.fingerprint = fingerprint
+        self.first_seen = now
+        self.last_seen = now
+        self.copies = 0
+        self.channels = set()
+        self.authors = set()
+        self.verdict = asyncio.get_running_loop().create_future()
+        self.vote_message_id = None
+
+    def resolve(self, is_scam: bool, reason: str, source: str):
+        if not self.verdict.done():
+            self.verdict.set_result((is_scam, reason, source))
+
+    def shared_verdict(self) -> Optional[Tuple[bool, str, str]]:
+        """The first copy's verdict if it's resolved and applies to every copy, else None."""
+        if self.verdict.done() and self.verdict.result()[2] in SHARED_VERDICT_SOURCES:
+            return self.verdict.result()
+        return None
+
+class SpamWaveIndex:
+    """Exact + SimHash/LSH index of recent link-bearing messages."""
+
+    def __init__(self, window: float = SPAM_WAVE_WINDOW_SECONDS, max_distance: int = SPAM_WAVE_MAX_DISTANCE,
+                 min_tokens: int = SPAM_WAVE_MIN_TOKENS):
+        self.window = window
+        self.max_distance = max_distance
+        self.min_tokens = min_tokens
+        self.waves: "OrderedDict[int, SpamWave]" = OrderedDict()  # Least recently seen first
+        self.exact: Dict[str, SpamWave] = {}
+        self.buckets: Dict[Tuple[int, int], List[SpamWave]] = {}
+        self.next_id = 1
+        self.stats = {'messages': 0, 'waves': 0, 'repeats': 0, 'near_repeats': 0}
+
+    def _evict(self, now: float):
+        while self.waves:
+            wave = next(iter(self.waves.values()))
+            if now - wave.last_seen < self.window:
+                break
+            del self.waves[wave.id]
+            if self.exact.get(wave.exact_key) is wave:
+                del self.exact[wave.exact_key]
+            if wave.fingerprint is not None:
+                for band in _bands(wave.fingerprint):
+                    bucket = self.buckets.get(band, [])
+                    if wave in bucket:
+                        bucket.remove(wave)
+                    if not bucket:
+                        self.buckets.pop(band, None)
+
+    def _find_near(self, fingerprint: int) -> Optional[SpamWave]:
+        for band in _bands(fingerprint):
+            for wave in reversed(self.buckets.get(band, ())):
+                if (wave.fingerprint ^ fingerprint).bit_count() <= self.max_distance:
+                    return wave
+        return None
+
+    def observe(self, content: str, channel_id: int, author_id: int):
+        """Add a message. Returns (wave, is_first) - is_first means this message
+        has to be screened and must resolve the wave's verdict."""
+        now = time.monotonic()
+        self._evict(now)
+        self.stats['messages'] += 1
+
+        tokens = normalize_text(content)
+        exact_key = hashlib.sha1(' '.join(tokens).encode('utf-8')).hexdigest()
+        fingerprint = None
+
+        wave = self.exact.get(exact_key)
+        if wave is not None:
+            self.stats['repeats'] += 1
+        elif len(tokens) >= self.min_tokens:
+            fingerprint = simhash(tokens)
+            wave = self._find_near(fingerprint)
+            if wave is not None:
+                self.stats['near_repeats'] += 1
+
+        is_first = wave is None
+        if is_first:
+            wave = SpamWave(self.next_id, exact_key, fingerprint, now)
+            self.next_id += 1
+            self.stats['waves'] += 1
+            self.waves[wave.id] = wave
+            self.exact[exact_key] = wave
+            if fingerprint is not None:
+                for band in _bands(fingerprint):
+                    bucket = self.buckets.setdefault(band, [])
+                    bucket.append(wave)
+                    if len(bucket) > SPAM_WAVE_BUCKET_CAP:
+                        del bucket[0]
+        else:
+            wave.last_seen = now
+            self.waves.move_to_end(wave.id)
+
+        wave.copies += 1
+        wave.channels.add(channel_id)
+        wave.authors.add(author_id)
+        return wave, is_first
+
+    def report(self) -> str:
+        s = self.stats
+        return (f"Spam waves: {s['messages']} link messages, {s['waves']} distinct, "
+                f"{s['repeats']} exact / {s['near_repeats']} near copies, {len(self.waves)} in window")
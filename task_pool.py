@@ -0,0 +1,82 @@
+"""
+Bounded background work for the bot.
+
+BoundedWorkerPool runs queued coroutines on a fixed number of worker tasks,
+so slow jobs (scam screening waits on the Grid) can't pile up without limit
+or hold up on_message. spawn() keeps a reference to lightweight
+fire-and-forget tasks so they aren't garbage-collected mid-flight and can
+all be cancelled on shutdown.
+"""
+import asyncio
+import time
+from typing import Awaitable, Callable
+
+class BoundedWorkerPool:
+    """A fixed set of workers draining a bounded queue of coroutine factories."""
+
+    def __init__(self, name: str, workers: int, queue_size: int):
+        self.name = name
+        self.worker_count = max(1, workers)
+        self.queue = None  # Created on first use, inside the running event loop
+        self.queue_size = queue_size
+        self.workers = []
+        self.tasks = set()
+        self.stats = {'submitted': 0, 'completed': 0, 'failed': 0, 'rejected': 0,
+                      'max_wait_ms': 0, 'max_run_ms': 0}
+
+    def _start(self):
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self.workers = [asyncio.create_task(self._worker()) for _ in range(self.worker_count)]
+
+    def submit(self, job: Callable[[], Awaitable], label: str = "") -> bool:
+        """Queue job() to run on a worker. False if the queue is full."""
+        if self.queue is None:
+            self._start()
+        try:
+            self.queue.put_nowait((job, label, time.perf_counter()))
+        except asyncio.QueueFull:
+            self.stats['rejected'] += 1
+            return False
+        self.stats['submitted'] += 1
+        return True
+
+    def spawn(self, coro: Awaitable) -> asyncio.Task:
+        """Run a coroutine outside the workers, keeping track of it until it finishes."""
+        task = asyncio.create_task(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
+
+    async def _worker(self):
+        while True:
+            job, label, queued_at = await self.queue.get()
+            started = time.perf_counter()
+            self.stats['max_wait_ms'] = max(self.stats['max_wait_ms'], round((started - queued_at) * 1000))
+            try:
+                await job()
+                self.stats['completed'] += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.stats['failed'] += 1
+                print(f"Error in {self.name} job {label}: {e}")
+            finally:
+                self.stats['max_run_ms'] = max(self.stats['max_run_ms'], round((time.perf_counter() - started) * 1000))
+                self.queue.task_done()
+
+    @property
+    def pending(self) -> int:
+        return self.queue.qsize() if self.queue else 0
+
+    def cancel_all(self) -> int:
+        """Cancel the workers and every spawned task (shutdown). Returns how many were running."""
+        running = [task for task in self.workers + list(self.tasks) if not task.done()]
+        for task in running:
+            task.cancel()
+        return len(running)
+
+    def report(self) -> str:
+        s = self.stats
+        return (f"{self.name}: {self.worker_count} workers, {self.pending} queued, "
+                f"{s['completed']}/{s['submitted']} done, {s['failed']} failed, {s['rejected']} rejected (queue full), "
+                f"max wait {s['max_wait_ms']}ms, max run {s['max_run_ms']}ms")
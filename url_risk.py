@@ -0,0 +1,215 @@
+"""
+Offline lexical risk score for links, so obvious cases skip the Grid.
+
+Each URL gets a deterministic 0-1 score from features of the URL alone (no
+network): lookalike hosts for protected brands (punycode/IDN homoglyphs and
+digit swaps like d1scord), typosquats by edit distance, brand names on
+unofficial domains, suspicious TLDs, URL shorteners, raw IPs, credential
+tricks and random-looking paths. Features combine as a noisy-OR, so each one
+raises the score without ever pushing it past 1.
+
+screen_links decides clearly safe (trusted domains only) and clearly
+malicious messages locally; the ambiguous middle still goes to the Grid.
+"""
+import math
+import os
+import re
+import unicodedata
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit, unquote
+
+from link_cache import registered_domain
+
+URL_RISK_ENABLED = os.getenv('URL_RISK_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+# At or below: decided safe without the Grid
+URL_RISK_SAFE_BELOW = float(os.getenv('URL_RISK_SAFE_BELOW', '0.2'))
+# At or above: decided scam without the Grid
+URL_RISK_SCAM_AT = float(os.getenv('URL_RISK_SCAM_AT', '0.8'))
+
+# Brands scammers impersonate in this server, and the domains they really use
+PROTECTED_BRANDS = {
+    'aipowergrid': {'aipowergrid.io'},
+    'discord': {'discord.com', 'discord.gg', 'discordapp.com', 'discord.media', 'discordapp.net'},
+    'uniswap': {'uniswap.org'},
+    'metamask': {'metamask.io'},
+}
+
+SUSPICIOUS_TLDS = {
+    'xyz', 'top', 'click', 'gq', 'tk', 'ml', 'cf', 'ga', 'zip', 'mov', 'gift', 'icu', 'cyou',
+    'buzz', 'rest', 'monster', 'sbs', 'cfd', 'lol', 'quest', 'support', 'claims',
+}
+
+URL_SHORTENERS = {
+    'bit.ly', 'tinyurl.com', 't.co', 'goo.gl', 'is.gd', 'cutt.ly', 'rebrand.ly', 'shorturl.at',
+    'ow.ly', 'buff.ly', 'tiny.cc', 'rb.gy', 't.ly', 'v.gd', 'shorturl.me',
+}
+
+PHISHING_PATH_WORDS = {
+    'claim', 'airdrop', 'verify', 'verification', 'validate', 'connect-wallet', 'wallet-connect',
+    'walletconnect', 'restore', 'recovery', 'seed', 'giveaway', 'nitro', 'reward', 'rewards', 'mint',
+}
+
+# Characters that look alike, folded to one canonical form ("skeleton").
+# Covers the Cyrillic/Greek letters and digit swaps seen in practice, not all of Unicode's confusables.
+CONFUSABLES = {
+    'а': 'a', 'е': 'e', 'о': 'o', 'р': 'p', 'с': 'c', 'у': 'y', 'х': 'x', 'і': 'l', 'ј': 'j',
+    'ԁ': 'd', 'ɡ': 'g', 'ӏ': 'l', 'ո': 'n', 'ѕ': 's', 'ԛ': 'q', 'ԝ': 'w', 'к': 'k', 'м': 'm',
+    'т': 't', 'в': 'b', 'н': 'h', 'α': 'a', 'ο': 'o', 'ρ': 'p', 'ν': 'v', 'τ': 't', 'ι': 'l',
+    'κ': 'k', 'υ': 'u', 'ε': 'e', 'ı': 'l',
+    '0': 'o', '1': 'l', 'i': 'l', '|': 'l', '3': 'e', '4': 'a', '5': 's', '7': 't', '8': 'b', '9': 'g',
+}
+MULTI_CHAR_CONFUSABLES = [('rn', 'm'), ('vv', 'w'), ('cl', 'd')]
+
+# Feature weights (each is the chance the feature alone means a scam)
+WEIGHTS = {
+    'unfamiliar_domain': 0.3,
+    'homoglyph': 0.95,
+    'lookalike': 0.85,
+    'typosquat': 0.7,
+    'brand_on_unofficial_domain': 0.6,
+    'suspicious_tld': 0.2,
+    'shortener': 0.5,
+    'ip_host': 0.5,
+    'userinfo': 0.6,
+    'phishing_path': 0.15,
+    'random_path': 0.15,
+    'deep_subdomains': 0.1,
+}
+
+def skeleton(text: str) -> str:
+    """Fold lookalike characters so "dіsс0rd" and "discord" compare equal."""
+    text = unicodedata.normalize('NFKD', text.lower())
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    text = ''.join(CONFUSABLES.get(ch, ch) for ch in text)
+    for sequence, replacement in MULTI_CHAR_CONFUSABLES:
+        text = text.replace(sequence, replacement)
+    return text
+
+def edit_distance(a: str, b: str, limit: int = 3) -> int:
+    """Levenshtein distance, giving up (returning limit) once it's clearly above limit."""
+    if abs(len(a) - len(b)) >= limit:
+        return limit
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        if min(current) >= limit:
+            return limit
+        previous = current
+    return min(previous[-1], limit)
+
+def shannon_entropy(text: str) -> float:
+    if not text:
+        return 0.0
+    counts = {}
+    for char in text:
+        counts[char] = counts.get(char, 0) + 1
+    return -sum(n / len(text) * math.log2(n / len(text)) for n in counts.values())
+
+def decode_host(host: str) -> str:
+    """Unicode form of a punycode (xn--) host; unchanged if it isn't one or won't decode."""
+    labels = []
+    for label in host.split('.'):
+        if label.startswith('xn--'):
+            try:
+                label = label.encode('ascii').decode('idna')
+            except UnicodeError:
+                pass
+        labels.append(label)
+    return '.'.join(labels)
+
+def _brand_features(host: str, domain: str) -> Dict[str, str]:
+    """Impersonation features for the protected brands."""
+    features = {}
+    unicode_host = decode_host(host)
+    is_idn = unicode_host != host or not host.isascii()
+    tokens = [token for token in re.split(r'[.\-_]', unicode_host) if token]
+
+    for brand, official in PROTECTED_BRANDS.items():
+        if domain in official:
+            continue
+        brand_skeleton = skeleton(brand)
+        for token in tokens:
+            token_skeleton = skeleton(token)
+            if token == brand or (brand_skeleton in token_skeleton and len(token) > len(brand)):
+                features.setdefault('brand_on_unofficial_domain', f"uses '{brand}' on unofficial domain {domain}")
+            elif token_skeleton == brand_skeleton:
+                if is_idn or not token.isascii():
+                    features['homoglyph'] = f"lookalike characters imitating '{brand}' ({unicode_host})"
+                else:
+                    features['lookalike'] = f"'{token}' imitates '{brand}'"
+            elif len(brand) >= 6 and edit_distance(token_skeleton, brand_skeleton) <= 2:
+                features.setdefault('typosquat', f"'{token}' is a misspelling of '{brand}'")
+    return features
+
+def score_url(url: str, trusted: Optional[Callable[[str], bool]] = None) -> Tuple[float, List[str]]:
+    """(risk 0-1, reasons) for one URL. trusted(host) marks known-good domains (score 0)."""
+    raw = url.strip().rstrip('.,;:!?\'">)')
+    if not raw.lower().startswith(('http://', 'https://')):
+        raw = 'http://' + raw
+    try:
+        parts = urlsplit(raw)
+        host = (parts.hostname or '').rstrip('.')
+    except ValueError:
+        return WEIGHTS['unfamiliar_domain'], ["unparseable URL"]
+    if not host:
+        return WEIGHTS['unfamiliar_domain'], ["URL without a host"]
+    if host.startswith('www.'):
+        host = host[4:]
+
+    if trusted and trusted(host):
+        return 0.0, []
+    domain = registered_domain(raw) or host
+    if any(domain in official for official in PROTECTED_BRANDS.values()):
+        return 0.0, []
+
+    features = {}
+    is_ip = bool(re.fullmatch(r'[\d.]+', host)) or ':' in host
+    if is_ip:
+        features['ip_host'] = "links to a raw IP address"
+    elif domain in URL_SHORTENERS:
+        features['shortener'] = f"URL shortener ({domain}) hides the destination"
+    else:
+        features['unfamiliar_domain'] = f"unfamiliar domain {domain}"
+    if not is_ip:
+        features.update(_brand_features(host, domain))
+
+    tld = host.rsplit('.', 1)[-1]
+    if tld in SUSPICIOUS_TLDS:
+        features['suspicious_tld'] = f"suspicious TLD .{tld}"
+    if parts.username:
+        features['userinfo'] = "hides the real host behind user@host"
+    if not is_ip and host.count('.') >= 3:
+        features['deep_subdomains'] = f"{host.count('.') + 1} host labels"
+
+    path = unquote(parts.path + ('?' + parts.query if parts.query else '')).lower()
+    path_tokens = set(re.split(r'[^a-z0-9\-]+', path))
+    phishing_words = sorted(path_tokens & PHISHING_PATH_WORDS)
+    if phishing_words:
+        features['phishing_path'] = f"path mentions {', '.join(phishing_words)}"
+    longest_token = max(re.split(r'[/?&=._\-]+', parts.path + parts.query), key=len, default='')
+    if len(longest_token) >= 24 and shannon_entropy(longest_token) >= 4.0:
+        features['random_path'] = "random-looking path token"
+
+    safe_probability = 1.0
+    for name in features:
+        safe_probability *= 1.0 - WEIGHTS[name]
+    ranked = sorted(features, key=WEIGHTS.get, reverse=True)
+    return round(1.0 - safe_probability, 3), [features[name] for name in ranked]
+
+def assess_links(urls: List[str], trusted: Optional[Callable[[str], bool]] = None,
+                 safe_below: float = URL_RISK_SAFE_BELOW, scam_at: float = URL_RISK_SCAM_AT):
+    """Decide a message's links locally when the score is clear.
+
+    Returns (verdict, score, reason) where verdict is "safe", "scam" or
+    "ambiguous" (ask the Grid). The message is as risky as its riskiest link."""
+    if not URL_RISK_ENABLED or not urls:
+        return "ambiguous", None, ""
+    scored = [(score_url(url, trusted), url) for url in urls]
+    (score, reasons), url = max(scored, key=lambda item: item[0][0])
+    if score >= scam_at:
+        return "scam", score, f"suspicious link {url}: {'; '.join(reasons[:2])}"
+    if score <= safe_below:
+        return "safe", score, "trusted domain" if not reasons else '; '.join(reasons)
+    return "ambiguous", score, '; '.join(reasons)
@@ -2,7 +2,7 @@
 """
 View bot's current mood and memories from the database.
 """
-from conversation_db import get_mood, get_all_memories, format_mood, format_memories, get_recent_happenings, format_recent_happenings
+from conversation_db import get_mood, get_all_memories, format_mood, format_memories, get_recent_happenings, format_recent_happenings, get_channel_summaries, ms_to_iso
 import json
 
 def main():
@@ -27,6 +27,17 @@ def main():
     else:
         print("(No recent happenings recorded yet)")
     
+    # Get channel summaries
+    print("\n🧵 CHANNEL SUMMARIES:")
+    print("-" * 60)
+    summaries = get_channel_summaries()
+    if not summaries:
+        print("(No channel summaries yet)")
+    for summary in summaries:
+        print(f"Channel {summary['channel_id']}: {summary['folded']} messages, through {ms_to_iso(summary['through_ts'])}")
+        print(f"   {summary['summary']}")
+        print()
+    
     # Get all memories
     print("\n💾 MEMORY BANK:")
     print("-" * 60)
@@ -39,7 +50,7 @@ def main():
         for i, mem in enumerate(memories, 1):
             source = mem.get('source', 'unknown')
             updated = mem.get('updated_at', 'unknown')
-            print(f"{i}. [{mem['key']}]")
+            print(f"{i}. [{mem['key']}]{' 📌 pinned' if mem.get('pinned') else ''}")
             print(f"   Value: {mem['value']}")
             print(f"   Source: {source}")
             print(f"   Updated: {updated}")